@@ -0,0 +1,121 @@
+"""Times the vectorised transforms against the row by row `.apply` calls or generic
+parsing they replaced, and checks both give the same output.
+
+Run from the pipeline folder:
+```
+python -m benchmarks.micro_benchmarks --rows 100000
+```
+"""
+
+import argparse
+import timeit
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from yd_extractor.kindle.reading import get_asin_image, get_asin_images
+from yd_extractor.kindle.schemas import check_is_valid_asin, is_valid_asin
+from yd_extractor.utils.pandas import parse_hms_durations
+
+
+def make_sleep_minutes(rows: int, rng: np.random.Generator) -> pd.Series:
+    return pd.Series(rng.integers(0, 720, rows))
+
+
+def make_reading_millis(rows: int, rng: np.random.Generator) -> pd.Series:
+    return pd.Series(rng.integers(0, 4 * 60 * 60 * 1000, rows))
+
+
+def make_asins(rows: int, rng: np.random.Generator, books: int = 2000) -> pd.Series:
+    characters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"))
+    codes = rng.choice(characters, size=(books, 8))
+    # Some sessions have asins which aren't books
+    library = ["B0" + "".join(code) for code in codes] + ["NotAnAsin"]
+    return pd.Series(rng.choice(library, rows))
+
+
+def make_hms_durations(rows: int, rng: np.random.Generator) -> pd.Series:
+    hours = rng.integers(0, 3, rows)
+    minutes = rng.integers(0, 60, rows)
+    seconds = rng.integers(0, 60, rows)
+    return pd.Series(
+        [f"{h}:{m:02d}:{s:02d}" for h, m, s in zip(hours, minutes, seconds)]
+    )
+
+
+# name: (make input, row by row version, vectorised version)
+MICRO_BENCHMARKS: dict[str, tuple[Callable, Callable, Callable]] = {
+    "sleep_minutes_to_hours": (
+        make_sleep_minutes,
+        lambda series: series.apply(lambda x: round(x / 60, 2)),
+        lambda series: (series / 60).round(2),
+    ),
+    "reading_millis_to_minutes": (
+        make_reading_millis,
+        lambda series: series.apply(lambda x: round(x / (60 * 1000))),
+        lambda series: (series / (60 * 1000)).round().astype(int),
+    ),
+    "asin_images": (
+        make_asins,
+        lambda series: series.apply(get_asin_image),
+        get_asin_images,
+    ),
+    "asin_validation": (
+        make_asins,
+        lambda series: series.apply(is_valid_asin),
+        check_is_valid_asin,
+    ),
+    "hms_durations_to_seconds": (
+        make_hms_durations,
+        lambda series: pd.to_timedelta(series).dt.total_seconds(),
+        parse_hms_durations,
+    ),
+}
+
+
+def run_micro_benchmarks(rows: int, repeat: int = 5, seed: int = 0) -> list[dict]:
+    """Runs each micro benchmark and returns the best time of each version.
+
+    Raises
+    ------
+    AssertionError
+        If a vectorised version doesn't give the same output as the `.apply` version.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for name, (make_input, apply_version, vectorised_version) in MICRO_BENCHMARKS.items():
+        series = make_input(rows, rng)
+        pd.testing.assert_series_equal(
+            apply_version(series), vectorised_version(series), check_names=False
+        )
+        apply_time = min(
+            timeit.repeat(lambda: apply_version(series), number=1, repeat=repeat)
+        )
+        vectorised_time = min(
+            timeit.repeat(lambda: vectorised_version(series), number=1, repeat=repeat)
+        )
+        results.append(
+            {
+                "name": name,
+                "apply_ms": round(apply_time * 1000, 2),
+                "vectorised_ms": round(vectorised_time * 1000, 2),
+                "speedup": round(apply_time / vectorised_time, 1),
+            }
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = run_micro_benchmarks(args.rows, args.repeat, args.seed)
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
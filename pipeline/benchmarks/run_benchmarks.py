@@ -0,0 +1,394 @@
+"""Runs the pipeline end to end on synthetic exports and records how long each stage
+takes and how much memory it needs.
+
+Run from the pipeline folder:
+```
+python -m benchmarks.run_benchmarks --years 3
+```
+
+Each benchmark runs in a freshly spawned process so its peak memory is not affected by
+the benchmarks before it. The github api and play store are replaced by local stand-ins,
+see `benchmarks/stand_ins.py`. Results are printed as a table and written to
+`data/benchmarks/results/`.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+import psutil
+
+from benchmarks.stand_ins import start_github_stand_in, start_play_store_stand_in
+from benchmarks.synthetic_exports import SyntheticExportSize, generate_input_folder
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BENCHMARK_FOLDER = PIPELINE_DIR / "data" / "benchmarks"
+
+
+def get_peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux and bytes on mac os
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak_rss / 1024**2
+    return peak_rss / 1024
+
+
+def create_benchmark_load_function(data_folder: Path) -> Callable:
+    from config import config_loader
+    from yd_extractor.utils.io import create_load_function
+
+    output_config = config_loader.OutputConfig()
+    output_data_folder = data_folder / "output"
+    os.makedirs(output_data_folder / "metadata", exist_ok=True)
+    return create_load_function(
+        output_data_folder,
+        output_formats=output_config.table_formats,
+        default_output_format=output_config.default_format,
+        write_bundles=output_config.write_year_bundles,
+    )
+
+
+def benchmark_fitbit(data_folder: Path, data_type: str, options: dict) -> None:
+    import yd_extractor.fitbit as fitbit_extractor
+
+    process_functions = {
+        "calories": fitbit_extractor.process_calories,
+        "steps": fitbit_extractor.process_steps,
+        "sleep": fitbit_extractor.process_sleep,
+        "exercise": fitbit_extractor.process_exercise,
+    }
+    kwargs = {}
+    if data_type in ["calories", "steps"]:
+        kwargs = dict(
+            aggregate_daily=options["aggregate_daily"],
+            cache_folder=data_folder / "cache" / "fitbit",
+        )
+    with fitbit_extractor.TakeoutArchive.from_latest_zip(
+        data_folder / "input", "google/takeout*.zip"
+    ) as archive:
+        process_functions[data_type](
+            archive,
+            load_function=create_benchmark_load_function(data_folder),
+            **kwargs,
+        )
+
+
+def benchmark_kindle(data_folder: Path, options: dict) -> None:
+    import yd_extractor.kindle as kindle_extractor
+    from yd_extractor.utils.io import get_latest_file
+
+    input_data_folder = data_folder / "input"
+    kindle_extractor.process_reading(
+        inputs_folder=input_data_folder,
+        zip_path=get_latest_file(input_data_folder, "amazon/Kindle*.zip"),
+        cleanup=True,
+        load_function=create_benchmark_load_function(data_folder),
+    )
+
+
+def benchmark_strong(data_folder: Path, options: dict) -> None:
+    import yd_extractor.strong as strong_extractor
+    from yd_extractor.utils.io import get_latest_file
+
+    strong_extractor.process_workouts(
+        csv_path=get_latest_file(data_folder / "input", "strong/strong*.csv"),
+        load_function=create_benchmark_load_function(data_folder),
+    )
+
+
+def benchmark_app_usage(data_folder: Path, options: dict) -> None:
+    from yd_extractor.app_usage.screen_time import process_screen_time
+    from yd_extractor.utils.io import get_latest_file
+
+    input_data_folder = data_folder / "input"
+    process_screen_time(
+        csv_file_path=get_latest_file(
+            input_data_folder, "app_usage/AUM_V4_Activity*.csv"
+        ),
+        app_info_path=get_latest_file(input_data_folder, "app_usage/AUM_V4_App*.csv"),
+        load_function=create_benchmark_load_function(data_folder),
+        cache_folder=data_folder / "cache",
+        play_store_url=options["play_store_url"],
+    )
+
+
+def benchmark_github(data_folder: Path, options: dict) -> None:
+    import yd_extractor.github as github_extractor
+
+    github_extractor.process_repo_contributions(
+        github_token="synthetic",
+        start_year=options["start_year"],
+        load_function=create_benchmark_load_function(data_folder),
+        api_url=options["github_api_url"],
+        cache_folder=data_folder / "cache" / "github",
+    )
+
+
+def benchmark_pipeline(data_folder: Path, options: dict) -> None:
+    import main
+    from config import config_loader
+
+    config = config_loader.load_config(PIPELINE_DIR / "config" / "config.toml")
+    config = config.model_copy(
+        update=dict(
+            download_from_drive=False,
+            cleanup_ziped_files=False,
+            github_api_url=options["github_api_url"],
+            play_store_url=options["play_store_url"],
+            max_workers=options.get("max_workers") or config.max_workers,
+            process_start_method=(
+                options.get("start_method") or config.process_start_method
+            ),
+        )
+    )
+    env_vars = {
+        "DRIVE_SHARE_URL": None,
+        "GITHUB_TOKEN": "synthetic",
+        "GITHUB_USERNAME": None,
+    }
+    main.run_pipeline(config, env_vars, data_folder=data_folder)
+
+
+BENCHMARKS: dict[str, tuple[Callable, tuple]] = {
+    "fitbit_calories": (benchmark_fitbit, ("calories",)),
+    "fitbit_steps": (benchmark_fitbit, ("steps",)),
+    "fitbit_sleep": (benchmark_fitbit, ("sleep",)),
+    "fitbit_exercise": (benchmark_fitbit, ("exercise",)),
+    "kindle_reading": (benchmark_kindle, ()),
+    "strong_workouts": (benchmark_strong, ()),
+    "app_usage_screen_time": (benchmark_app_usage, ()),
+    "github_repo_contributions": (benchmark_github, ()),
+    "pipeline_cold": (benchmark_pipeline, ()),
+    "pipeline_warm": (benchmark_pipeline, ()),
+}
+
+
+def run_benchmark_in_child(
+    name: str,
+    data_folder: Path,
+    options: dict,
+) -> dict:
+    """Runs a single benchmark, called inside the spawned process."""
+    os.chdir(PIPELINE_DIR)
+    logging.basicConfig(level=options["log_level"])
+    benchmark_function, args = BENCHMARKS[name]
+    process = psutil.Process()
+    cpu_times_before = process.cpu_times()
+    start_time = time.perf_counter()
+    benchmark_function(data_folder, *args, options)
+    wall_time = time.perf_counter() - start_time
+    cpu_times_after = process.cpu_times()
+    children_rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "name": name,
+        "wall_time_s": round(wall_time, 3),
+        "cpu_time_s": round(
+            cpu_times_after.user
+            - cpu_times_before.user
+            + cpu_times_after.system
+            - cpu_times_before.system,
+            3,
+        ),
+        "peak_rss_mb": round(get_peak_rss_mb(), 1),
+        # Stages run by the scheduler's process pool
+        "children_cpu_time_s": round(
+            children_rusage.ru_utime + children_rusage.ru_stime, 3
+        ),
+    }
+
+
+def run_benchmark(name: str, data_folder: Path, options: dict) -> dict:
+    """Runs a benchmark in a freshly spawned process and returns its measurements."""
+    if name == "pipeline_cold":
+        shutil.rmtree(data_folder / "cache", ignore_errors=True)
+    # The kindle stage unzips into the input folder and removes the unzipped files,
+    # the input zips and csvs are never modified.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        future = executor.submit(run_benchmark_in_child, name, data_folder, options)
+        try:
+            return future.result()
+        except Exception as e:
+            logger.exception(f"Benchmark '{name}' failed")
+            return {"name": name, "error": repr(e)}
+
+
+def get_input_size_mb(input_folder: Path) -> float:
+    total_bytes = sum(
+        file.stat().st_size for file in input_folder.rglob("*") if file.is_file()
+    )
+    return round(total_bytes / 1024**2, 1)
+
+
+def print_results_table(results: list[dict]) -> None:
+    columns = [
+        ("name", "benchmark"),
+        ("wall_time_s", "wall (s)"),
+        ("cpu_time_s", "cpu (s)"),
+        ("children_cpu_time_s", "children cpu (s)"),
+        ("peak_rss_mb", "peak rss (MB)"),
+    ]
+    rows = [[header for _, header in columns]]
+    for result in results:
+        if "error" in result:
+            rows.append([result["name"], "failed", "", "", ""])
+            continue
+        rows.append([str(result[key]) for key, _ in columns])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for index, row in enumerate(rows):
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+        if index == 0:
+            print("  ".join("-" * width for width in widths))
+
+
+def run_benchmarks(
+    size: SyntheticExportSize,
+    benchmark_folder: Path = DEFAULT_BENCHMARK_FOLDER,
+    benchmark_names: Optional[list[str]] = None,
+    network_latency: float = 0.05,
+    max_workers: Optional[int] = None,
+    start_method: Optional[str] = None,
+    regenerate: bool = False,
+    log_level: int = logging.WARNING,
+) -> dict:
+    """Generates the synthetic exports if needed, runs the benchmarks and writes the
+    results into `{benchmark_folder}/results/`.
+
+    Parameters
+    ----------
+    size : SyntheticExportSize
+        Size of the synthetic exports.
+    benchmark_folder : Path
+        Folder with the synthetic input, output and cache folders.
+    benchmark_names : Optional[list[str]]
+        Benchmarks to run, all of them if not given.
+    network_latency : float
+        Seconds each stand-in takes to answer a request.
+    max_workers : Optional[int]
+        Overrides max_workers of config.toml for the pipeline benchmarks.
+    start_method : Optional[str]
+        Overrides process_start_method of config.toml for the pipeline benchmarks.
+    regenerate : bool
+        Regenerate the synthetic exports even if they already exist.
+    log_level : int
+        Log level of the benchmarked code.
+
+    Returns
+    -------
+    dict
+        Results which were written to the results json.
+    """
+    data_folder = benchmark_folder / f"synthetic_{size.years}y_{size.sample_minutes}m"
+    input_folder = data_folder / "input"
+    if regenerate or not input_folder.exists():
+        shutil.rmtree(data_folder, ignore_errors=True)
+        generate_input_folder(input_folder, size)
+
+    github_server = start_github_stand_in(
+        size.number_of_repos, network_latency, size.seed
+    )
+    play_store_server = start_play_store_stand_in(network_latency)
+    options = {
+        "aggregate_daily": True,
+        "start_year": size.start_date.year,
+        "github_api_url": github_server.url,
+        "play_store_url": play_store_server.url,
+        "max_workers": max_workers,
+        "start_method": start_method,
+        "log_level": log_level,
+    }
+    results = []
+    try:
+        for name in benchmark_names or BENCHMARKS.keys():
+            logger.info(f"Running benchmark '{name}'...")
+            results.append(run_benchmark(name, data_folder, options))
+    finally:
+        github_server.stop()
+        play_store_server.stop()
+
+    report = {
+        "created_at": datetime.datetime.now().isoformat(),
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "size": size.to_dict(),
+        "input_size_mb": get_input_size_mb(input_folder),
+        "network_latency_s": network_latency,
+        "results": results,
+    }
+    results_folder = benchmark_folder / "results"
+    os.makedirs(results_folder, exist_ok=True)
+    results_path = (
+        results_folder / f"results_{datetime.datetime.now():%Y-%m-%d_%H-%M-%S}.json"
+    )
+    with open(results_path, "w") as file:
+        json.dump(report, file, indent=2)
+
+    print_results_table(results)
+    print(f"Input size: {report['input_size_mb']} MB, results written to {results_path}")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument(
+        "--sample-minutes",
+        type=int,
+        default=1,
+        help="Minutes between fitbit calories/steps samples.",
+    )
+    parser.add_argument("--books", type=int, default=50)
+    parser.add_argument("--apps", type=int, default=100)
+    parser.add_argument("--repos", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        choices=list(BENCHMARKS.keys()),
+        help="Benchmarks to run, all of them by default.",
+    )
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--max-workers", type=int)
+    parser.add_argument("--start-method", choices=["fork", "spawn", "forkserver"])
+    parser.add_argument("--folder", type=Path, default=DEFAULT_BENCHMARK_FOLDER)
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    size = SyntheticExportSize(
+        years=args.years,
+        sample_minutes=args.sample_minutes,
+        number_of_books=args.books,
+        number_of_apps=args.apps,
+        number_of_repos=args.repos,
+        seed=args.seed,
+    )
+    run_benchmarks(
+        size,
+        benchmark_folder=args.folder,
+        benchmark_names=args.benchmarks,
+        network_latency=args.latency,
+        max_workers=args.max_workers,
+        start_method=args.start_method,
+        regenerate=args.regenerate,
+        log_level=logging.INFO if args.verbose else logging.WARNING,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Local stand-ins for the web services the pipeline calls, so benchmarks measure the
+pipeline and not the network. Each stand-in runs in a daemon thread and can be given an
+artificial latency per request.
+"""
+
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+# Same page size as the GetUserRepoContributions query
+GITHUB_PAGE_SIZE = 100
+
+
+class StandInServer:
+    """Serves a request handler on a random local port until `stop` is called."""
+
+    def __init__(self, handler: type[BaseHTTPRequestHandler], path: str) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}{path}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self) -> "StandInServer":
+        self.thread.start()
+        logger.info(f"Stand-in server listening on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+
+def create_github_contributions(
+    year: int,
+    number_of_repos: int,
+    seed: int = 0,
+) -> dict[str, list[dict]]:
+    """Creates the commit contribution nodes of every repo for a year."""
+    rng = random.Random(seed * 10_000 + year)
+    contributions = {}
+    for repo_index in range(number_of_repos):
+        name = f"synthetic-repo-{repo_index}"
+        url = f"https://github.com/synthetic/{name}"
+        days = sorted(rng.sample(range(365), rng.randint(5, 250)))
+        contributions[url] = [
+            {
+                "commitCount": rng.randint(1, 10),
+                "occurredAt": (
+                    datetime.datetime(year, 1, 1) + datetime.timedelta(days=day)
+                ).strftime("%Y-%m-%dT00:00:00Z"),
+                "repository": {
+                    "name": name,
+                    "url": url,
+                    "openGraphImageUrl": f"https://opengraph.githubassets.com/{name}",
+                },
+            }
+            for day in days
+        ]
+    return contributions
+
+
+def create_github_handler(
+    number_of_repos: int,
+    latency: float = 0.0,
+    seed: int = 0,
+) -> type[BaseHTTPRequestHandler]:
+    """Creates a handler answering the GetUserRepoContributions and
+    GetRepoCommitHistory queries like the github graphql api, with commit history
+    paginated by an integer cursor."""
+    contributions_by_year: dict[int, dict] = {}
+    lock = threading.Lock()
+
+    def get_contributions(year: int) -> dict[str, list[dict]]:
+        with lock:
+            if year not in contributions_by_year:
+                contributions_by_year[year] = create_github_contributions(
+                    year, number_of_repos, seed
+                )
+        return contributions_by_year[year]
+
+    def get_repo_contributions(variables: dict) -> dict:
+        repos = []
+        for url, nodes in get_contributions(int(variables["from"][:4])).items():
+            repos.append(
+                {
+                    "repository": {
+                        "name": nodes[0]["repository"]["name"],
+                        "url": url,
+                        "owner": {"login": "synthetic"},
+                    },
+                    "contributions": {
+                        "pageInfo": {
+                            "hasNextPage": len(nodes) > GITHUB_PAGE_SIZE,
+                            "endCursor": str(GITHUB_PAGE_SIZE),
+                        },
+                        "nodes": nodes[:GITHUB_PAGE_SIZE],
+                    },
+                }
+            )
+        return {
+            "viewer": {
+                "id": "synthetic-viewer",
+                "contributionsCollection": {"commitContributionsByRepository": repos},
+            }
+        }
+
+    def get_commit_history(variables: dict) -> dict:
+        url = f"https://github.com/{variables['owner']}/{variables['name']}"
+        nodes = get_contributions(int(variables["since"][:4])).get(url)
+        if nodes is None:
+            return {"repository": None}
+        # Each contribution day is expanded back into its commits
+        commits = [
+            {"authoredDate": node["occurredAt"][:10] + "T12:00:00Z"}
+            for node in nodes
+            for _ in range(node["commitCount"])
+        ]
+        offset = int(variables.get("after") or 0)
+        end = offset + GITHUB_PAGE_SIZE
+        return {
+            "repository": {
+                **nodes[0]["repository"],
+                "defaultBranchRef": {
+                    "target": {
+                        "history": {
+                            "pageInfo": {
+                                "hasNextPage": end < len(commits),
+                                "endCursor": str(end),
+                            },
+                            "nodes": commits[offset:end],
+                        }
+                    }
+                },
+            }
+        }
+
+    class GithubGraphqlHandler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            time.sleep(latency)
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if "GetRepoCommitHistory" in body["query"]:
+                data = get_commit_history(body["variables"])
+            else:
+                data = get_repo_contributions(body["variables"])
+            response = {"data": data}
+            self._send(200, json.dumps(response).encode("utf-8"), "application/json")
+
+        def _send(self, status: int, body: bytes, content_type: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    return GithubGraphqlHandler
+
+
+def create_play_store_handler(
+    latency: float = 0.0,
+    missing_every: int = 10,
+) -> type[BaseHTTPRequestHandler]:
+    """Creates a handler answering play store app pages with an icon image. Every
+    `missing_every`-th app returns 404 like apps which are not on the play store."""
+
+    class PlayStoreHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            time.sleep(latency)
+            package_name = parse_qs(urlparse(self.path).query).get("id", [""])[0]
+            digits = "".join(filter(str.isdigit, package_name))
+            if missing_every and digits and int(digits) % missing_every == 0:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = (
+                f'<html><body><img alt="Icon image" '
+                f'src="https://play-lh.googleusercontent.com/{package_name}">'
+                f"</body></html>"
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    return PlayStoreHandler
+
+
+def start_github_stand_in(
+    number_of_repos: int,
+    latency: float = 0.0,
+    seed: int = 0,
+) -> StandInServer:
+    handler = create_github_handler(number_of_repos, latency, seed)
+    return StandInServer(handler, "/graphql").start()
+
+
+def start_play_store_stand_in(latency: float = 0.0) -> StandInServer:
+    handler = create_play_store_handler(latency)
+    return StandInServer(handler, "/store/apps/details").start()
@@ -0,0 +1,383 @@
+"""Generates realistic synthetic versions of the exports the pipeline reads, so it can be
+run and benchmarked without real personal data.
+
+The generated input folder has the same layout as the google drive folder:
+```
+input/
+    google/takeout-synthetic.zip
+    amazon/Kindle-synthetic.zip
+    strong/strong-synthetic.csv
+    app_usage/AUM_V4_Activity_synthetic.csv
+    app_usage/AUM_V4_App_synthetic.csv
+```
+"""
+
+import csv
+import datetime
+import json
+import logging
+import os
+import random
+import zipfile
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+FITBIT_EXPORT_PREFIX = "Takeout/Fitbit/Global Export Data/"
+FITBIT_DATETIME_FORMAT = "%m/%d/%y %H:%M:%S"
+
+
+class SyntheticExportSize:
+    """Size of the synthetic exports.
+
+    Args:
+        years (int): Number of years of data, ending with the current year.
+        sample_minutes (int): Minutes between fitbit calories/steps samples. Fitbit
+            exports one sample every minute.
+        days_per_file (int): Days of samples in each fitbit json. Fitbit exports
+            calories and steps in files of about a month.
+        number_of_books (int): Books in the kindle library.
+        number_of_apps (int): Apps installed for app usage.
+        number_of_repos (int): Github repos with contributions.
+        seed (int): Seed for the random data, the same seed gives the same exports.
+    """
+
+    def __init__(
+        self,
+        years: int = 1,
+        sample_minutes: int = 1,
+        days_per_file: int = 30,
+        number_of_books: int = 50,
+        number_of_apps: int = 100,
+        number_of_repos: int = 10,
+        seed: int = 0,
+    ) -> None:
+        self.years = years
+        self.sample_minutes = sample_minutes
+        self.days_per_file = days_per_file
+        self.number_of_books = number_of_books
+        self.number_of_apps = number_of_apps
+        self.number_of_repos = number_of_repos
+        self.seed = seed
+
+    @property
+    def start_date(self) -> datetime.date:
+        return datetime.date(datetime.date.today().year - self.years + 1, 1, 1)
+
+    @property
+    def end_date(self) -> datetime.date:
+        return datetime.date.today()
+
+    def days(self) -> list[datetime.date]:
+        number_of_days = (self.end_date - self.start_date).days + 1
+        return [
+            self.start_date + datetime.timedelta(days=day)
+            for day in range(number_of_days)
+        ]
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def to_json_bytes(data) -> bytes:
+    # Exports are written without whitespace, like the real ones.
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def generate_takeout_zip(zip_path: Path, size: SyntheticExportSize) -> None:
+    """Generates a google takeout zip with fitbit calories, steps, sleep, exercise and
+    heart rate jsons."""
+    rng = random.Random(size.seed)
+    days = size.days()
+    samples_per_day = 24 * 60 // size.sample_minutes
+    os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for file_start in range(0, len(days), size.days_per_file):
+            file_days = days[file_start : file_start + size.days_per_file]
+            file_date = file_days[0].isoformat()
+
+            calories, steps, heart_rate = [], [], []
+            for day in file_days:
+                start = datetime.datetime.combine(day, datetime.time())
+                for sample in range(samples_per_day):
+                    date_time = (
+                        start + datetime.timedelta(minutes=sample * size.sample_minutes)
+                    ).strftime(FITBIT_DATETIME_FORMAT)
+                    calories.append(
+                        {"dateTime": date_time, "value": f"{rng.uniform(0.9, 9):.2f}"}
+                    )
+                    steps.append(
+                        {"dateTime": date_time, "value": str(rng.randint(0, 120))}
+                    )
+                    if sample % 10 == 0:
+                        heart_rate.append(
+                            {
+                                "dateTime": date_time,
+                                "value": {
+                                    "bpm": rng.randint(50, 160),
+                                    "confidence": 2,
+                                },
+                            }
+                        )
+
+            for data_type, data in [
+                ("calories", calories),
+                ("steps", steps),
+                ("heart_rate", heart_rate),
+                ("sleep", generate_sleep_logs(file_days, rng)),
+                ("exercise", generate_exercise_logs(file_days, rng)),
+            ]:
+                zip_file.writestr(
+                    f"{FITBIT_EXPORT_PREFIX}{data_type}-{file_date}.json",
+                    to_json_bytes(data),
+                )
+
+        # Other takeout files which the pipeline should ignore
+        zip_file.writestr("Takeout/archive_browser.html", "<html></html>")
+        zip_file.writestr(f"{FITBIT_EXPORT_PREFIX}badge.json", "[]")
+
+
+def generate_sleep_logs(days: list[datetime.date], rng: random.Random) -> list[dict]:
+    sleep_logs = []
+    for day in days:
+        start = datetime.datetime.combine(
+            day - datetime.timedelta(days=1), datetime.time(22)
+        ) + datetime.timedelta(minutes=rng.randint(0, 120))
+        minutes_asleep = rng.randint(300, 540)
+        minutes_awake = rng.randint(10, 60)
+        end = start + datetime.timedelta(minutes=minutes_asleep + minutes_awake)
+        sleep_logs.append(
+            {
+                "logId": rng.getrandbits(40),
+                "dateOfSleep": day.isoformat(),
+                "startTime": start.strftime("%Y-%m-%dT%H:%M:%S.000"),
+                "endTime": end.strftime("%Y-%m-%dT%H:%M:%S.000"),
+                "duration": (minutes_asleep + minutes_awake) * 60 * 1000,
+                "minutesToFallAsleep": rng.randint(0, 20),
+                "minutesAsleep": minutes_asleep,
+                "minutesAwake": minutes_awake,
+                "minutesAfterWakeup": 0,
+                "timeInBed": minutes_asleep + minutes_awake,
+                "efficiency": rng.randint(80, 99),
+                "type": "stages",
+                "infoCode": 0,
+                "mainSleep": True,
+            }
+        )
+    return sleep_logs
+
+
+def generate_exercise_logs(days: list[datetime.date], rng: random.Random) -> list[dict]:
+    exercise_logs = []
+    for day in days:
+        if rng.random() > 0.5:
+            continue
+        active_minutes = rng.randint(10, 90)
+        distance = round(active_minutes / rng.uniform(5, 8), 3)
+        exercise_logs.append(
+            {
+                "logId": rng.getrandbits(40),
+                "activityName": rng.choice(["Run", "Walk", "Bike", "Swim"]),
+                "averageHeartRate": rng.randint(100, 170),
+                "calories": rng.randint(100, 900),
+                "distance": distance,
+                "distanceUnit": "Kilometer",
+                "activeDuration": active_minutes * 60 * 1000,
+                "startTime": datetime.datetime.combine(
+                    day, datetime.time(rng.randint(6, 20), rng.randint(0, 59))
+                ).strftime(FITBIT_DATETIME_FORMAT),
+                "pace": active_minutes * 60 / distance,
+                "steps": active_minutes * 150,
+            }
+        )
+    return exercise_logs
+
+
+def generate_asin(rng: random.Random) -> str:
+    return "B0" + "".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789", k=8))
+
+
+def generate_kindle_zip(zip_path: Path, size: SyntheticExportSize) -> None:
+    """Generates an amazon kindle zip with reading sessions and one digital content
+    ownership json per book."""
+    rng = random.Random(size.seed)
+    asins = [generate_asin(rng) for _ in range(size.number_of_books)]
+    os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for index, asin in enumerate(asins):
+            ownership = {
+                "rights": [
+                    {
+                        "rightType": "Download",
+                        "acquiredDate": f"{size.start_date.isoformat()}T10:00:00Z",
+                    }
+                ],
+                "resource": {
+                    "ASIN": asin,
+                    "Product Name": f"Synthetic Book {index}: A Novel",
+                    "resourceType": "KindleEBook",
+                },
+                # Borrowed books are skipped by the pipeline
+                "origin": {"originType": "Purchase" if index % 10 else "Borrow"},
+            }
+            zip_file.writestr(
+                f"Digital.Content.Ownership/Digital.Content.Ownership.{index}.json",
+                to_json_bytes(ownership),
+            )
+
+        rows = [
+            [
+                "ASIN",
+                "start_timestamp",
+                "end_timestamp",
+                "total_reading_millis",
+                "number_of_page_flips",
+                "device_family",
+            ]
+        ]
+        for day in size.days():
+            for _ in range(rng.randint(0, 3)):
+                start = datetime.datetime.combine(
+                    day, datetime.time(rng.randint(6, 23), rng.randint(0, 59))
+                )
+                millis = rng.randint(60, 3600) * 1000
+                end = start + datetime.timedelta(milliseconds=millis)
+                rows.append(
+                    [
+                        rng.choice(asins),
+                        start.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                        end.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                        millis,
+                        millis // 30000,
+                        "Kindle E-reader",
+                    ]
+                )
+        rows.append(["Not Available", "Not Available", "Not Available", 0, 0, ""])
+        zip_file.writestr(
+            "Kindle.Devices.ReadingSession/Kindle.Devices.ReadingSession.csv",
+            "\n".join(",".join(str(value) for value in row) for row in rows),
+        )
+
+
+def generate_strong_csv(csv_path: Path, size: SyntheticExportSize) -> None:
+    """Generates a strong export with a workout every few days."""
+    rng = random.Random(size.seed)
+    exercises = ["Bench Press", "Squat", "Deadlift", "Row", "Overhead Press"]
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    with open(csv_path, "w", newline="") as file:
+        writer = csv.writer(file, delimiter=";")
+        writer.writerow(
+            [
+                "Workout #",
+                "Date",
+                "Workout Name",
+                "Duration (sec)",
+                "Exercise Name",
+                "Set Order",
+                "Weight (kg)",
+                "Reps",
+                "Distance (meters)",
+                "Seconds",
+                "Notes",
+                "Workout Notes",
+                "RPE",
+            ]
+        )
+        workout_number = 0
+        for day in size.days():
+            if rng.random() > 0.4:
+                continue
+            workout_number += 1
+            start = datetime.datetime.combine(day, datetime.time(rng.randint(6, 20)))
+            workout_name = rng.choice(["Push", "Pull", "Legs"])
+            duration = rng.randint(1800, 5400)
+            for exercise in rng.sample(exercises, 3):
+                for set_order in range(1, 4):
+                    writer.writerow(
+                        [
+                            workout_number,
+                            start.strftime("%Y-%m-%d %H:%M:%S"),
+                            workout_name,
+                            duration,
+                            exercise,
+                            set_order,
+                            rng.choice([40, 50, 60, 80, 100]),
+                            rng.randint(5, 12),
+                            0,
+                            0,
+                            "",
+                            "",
+                            "",
+                        ]
+                    )
+
+
+def generate_app_usage_csvs(folder: Path, size: SyntheticExportSize) -> None:
+    """Generates the app usage (AUM) activity log and app info csvs."""
+    rng = random.Random(size.seed)
+    os.makedirs(folder, exist_ok=True)
+    apps = [
+        (f"Synthetic App {index}", f"com.synthetic.app{index}")
+        for index in range(size.number_of_apps)
+    ]
+    with open(folder / "AUM_V4_App_synthetic.csv", "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(
+            [
+                "App name",
+                "Package name",
+                "App version",
+                "App version code",
+                "Updated time",
+                "Category",
+                "Installed",
+            ]
+        )
+        for app_name, package_name in apps:
+            writer.writerow(
+                [
+                    app_name,
+                    package_name,
+                    "1.0.0",
+                    1,
+                    f"{size.start_date.isoformat()} 12:00:00",
+                    rng.choice(["Social", "Tools", "Games", "Productivity"]),
+                    "Yes",
+                ]
+            )
+
+    with open(folder / "AUM_V4_Activity_synthetic.csv", "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["App name", "Date", "Time", "Duration"])
+        # The activity log is ordered from newest to oldest event
+        for day in reversed(size.days()):
+            events = []
+            for _ in range(rng.randint(20, 60)):
+                seconds = rng.randint(0, 24 * 60 * 60 - 1)
+                events.append((seconds, rng.choice(apps)[0]))
+            events.append((rng.randint(0, 24 * 60 * 60 - 1), "Screen on (unlocked)"))
+            for seconds, app_name in sorted(events, reverse=True):
+                duration = rng.randint(5, 1800)
+                writer.writerow(
+                    [
+                        app_name,
+                        day.strftime("%m/%d/%y"),
+                        str(datetime.timedelta(seconds=seconds)),
+                        str(datetime.timedelta(seconds=duration)),
+                    ]
+                )
+
+
+def generate_input_folder(
+    input_folder: Path,
+    size: Optional[SyntheticExportSize] = None,
+) -> None:
+    """Generates every synthetic export into the input folder, using the same layout as
+    the google drive folder."""
+    size = size or SyntheticExportSize()
+    logger.info(f"Generating synthetic exports into {input_folder}: {size.to_dict()}")
+    generate_takeout_zip(input_folder / "google" / "takeout-synthetic.zip", size)
+    generate_kindle_zip(input_folder / "amazon" / "Kindle-synthetic.zip", size)
+    generate_strong_csv(input_folder / "strong" / "strong-synthetic.csv", size)
+    generate_app_usage_csvs(input_folder / "app_usage", size)
@@ -6,6 +6,9 @@ import toml
 from dotenv import load_dotenv
 from pydantic import BaseModel
 
+from yd_extractor.utils.csv_reader import DEFAULT_CSV_ENGINE
+from yd_extractor.utils.validation import DEFAULT_SAMPLE_SIZE, ValidationLevel
+
 logger = logging.getLogger(__name__)
 
 
@@ -15,6 +18,15 @@ class FitbitConfig(BaseModel):
     process_sleep: bool
     process_steps: bool
     process_exercise: bool
+    aggregate_daily_on_read: bool = False
+    incremental: bool = False
+
+
+class OutputConfig(BaseModel):
+    default_format: str = "csv"
+    table_formats: dict[str, str] = {}
+    write_year_bundles: bool = False
+    write_warehouse: bool = False
 
 
 class EnvVars(BaseModel):
@@ -28,11 +40,24 @@ class PipelineConfig(BaseModel):
     download_from_drive: bool
     cleanup_unziped_files: bool
     cleanup_ziped_files: bool
+    max_workers: int = 1
+    process_start_method: Optional[str] = None
+    download_max_workers: int = 4
+    profile_memory: bool = False
+    memory_sample_interval: float = 0.5
+    validation_level: ValidationLevel = ValidationLevel.FULL
+    validation_sample_size: int = DEFAULT_SAMPLE_SIZE
+    csv_engine: str = DEFAULT_CSV_ENGINE
+    csv_memory_map: bool = False
     fitbit_config: FitbitConfig
+    output_config: OutputConfig = OutputConfig()
     process_github: bool
     process_kindle: bool
     process_strong: bool
     process_app_usage: bool
+    app_usage_incremental: bool = False
+    github_api_url: str = "https://api.github.com/graphql"
+    play_store_url: str = "https://play.google.com/store/apps/details"
 
     @classmethod
     def from_toml(cls, file_path: str) -> "PipelineConfig":
@@ -1,6 +1,9 @@
 import logging
 import os
+import time
+from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 
 import yd_extractor.fitbit as fitbit_extractor
@@ -10,9 +13,21 @@ import yd_extractor.strong as strong_extractor
 from yd_extractor.app_usage.screen_time import process_screen_time
 from config import config_loader
 from yd_extractor.utils.logger import (
+    DEFAULT_LOG_DIR,
     setup_aebels_logger,
 )
-from yd_extractor.utils.io import download_files_from_drive, get_latest_file, create_load_function
+from yd_extractor.utils.memory_profiler import (ResourceSampler,
+                                                start_memory_profiling,
+                                                stop_memory_profiling,
+                                                write_memory_report)
+from yd_extractor.utils.drive_sync import download_files_from_drive
+from yd_extractor.utils.input_tracker import InputTracker
+from yd_extractor.utils.io import get_latest_file, create_load_function
+from yd_extractor.utils.pipeline_stage import PipelineStage, collect_stage_metrics
+from yd_extractor.utils.run_report import create_run_report, write_run_report
+from yd_extractor.utils.scheduler import StageScheduler
+from yd_extractor.utils.csv_reader import configure_csv_reader
+from yd_extractor.utils.validation import configure_validation
 
 from yd_extractor.utils.io import get_latest_valid_zip
 
@@ -26,117 +41,217 @@ setup_aebels_logger(
 )
 
 
+def configure_stage_process(
+    validation_level: str,
+    validation_sample_size: int,
+    csv_engine: str,
+    csv_memory_map: bool,
+):
+    """Applies the process wide settings, run in the main process and in each worker."""
+    configure_validation(validation_level, validation_sample_size)
+    configure_csv_reader(csv_engine, csv_memory_map)
+
+
 def run_pipeline(
     config: config_loader.PipelineConfig,
     env_vars: config_loader.EnvVars,
+    data_folder: Optional[Path] = None,
 ):
+    started_at = datetime.now()
+    start_time = time.perf_counter()
+
     # Unpack config
     fitbit_config = config.fitbit_config
 
     # Setup folder structure
     root_dir = Path(__file__).resolve().parent
-    input_data_folder = root_dir / "data" / "input"
-    output_data_folder = root_dir / "data" / "output"
-    load_function = create_load_function(output_data_folder)
+    data_folder = data_folder or root_dir / "data"
+    input_data_folder = data_folder / "input"
+    output_data_folder = data_folder / "output"
+    cache_folder = data_folder / "cache"
+    # Remembers which input zips are valid so unchanged ones aren't opened every run
+    zip_manifest_path = cache_folder / "zip_manifest.json"
+    load_function = create_load_function(
+        output_data_folder,
+        output_formats=config.output_config.table_formats,
+        default_output_format=config.output_config.default_format,
+        write_bundles=config.output_config.write_year_bundles,
+        warehouse_path=(
+            # Not in the output folder, which is published with the website
+            data_folder / "warehouse.sqlite"
+            if config.output_config.write_warehouse
+            else None
+        ),
+    )
 
     os.makedirs(input_data_folder, exist_ok=True)
-    os.makedirs(root_dir / "data" / "output", exist_ok=True)
-    os.makedirs(root_dir / "data" / "output" / "metadata", exist_ok=True)
-    logger.info(f"Inputs and output data will be stored here: {root_dir / 'data'}")
+    os.makedirs(output_data_folder, exist_ok=True)
+    os.makedirs(output_data_folder / "metadata", exist_ok=True)
+    logger.info(f"Inputs and output data will be stored here: {data_folder}")
 
-    if config.download_from_drive:
-        try:
-            download_files_from_drive(input_data_folder, env_vars)
-        except Exception as e:
-            logger.exception(f"Error while downloading files from Google Drive")
+    process_settings = (
+        config.validation_level,
+        config.validation_sample_size,
+        config.csv_engine,
+        config.csv_memory_map,
+    )
+    configure_stage_process(*process_settings)
+
+    resource_sampler = None
+    if config.profile_memory:
+        logger.info("Memory profiling is on, stages will run slower.")
+        start_memory_profiling()
+
+    # Stages don't depend on each other so they are scheduled to run concurrently
+    scheduler = StageScheduler(
+        max_workers=config.max_workers,
+        profile_memory=config.profile_memory,
+        initializer=configure_stage_process,
+        initargs=process_settings,
+        start_method=config.process_start_method,
+    )
+    scheduler.start()
+    if config.profile_memory:
+        # Started once the workers are forked, see `StageScheduler._start_workers`
+        resource_sampler = ResourceSampler(config.memory_sample_interval).start()
+    # Each source's stages are scheduled once its input files are downloaded, so they
+    # run whilst larger files are still downloading.
+    inputs = InputTracker()
 
     # Fitbit
-    if fitbit_config.process_fitbit:
-        latest_google_zip = get_latest_valid_zip(
+    takeout_archives = []
+
+    def schedule_fitbit():
+        # Central directory of the zip is indexed once and shared by all fitbit stages
+        takeout_archive = fitbit_extractor.TakeoutArchive.from_latest_zip(
             folder_path=input_data_folder,
             file_name_glob="google/takeout*.zip",
-            expected_file_path="Takeout/Fitbit/Global Export Data",
+            manifest_path=zip_manifest_path,
         )
-        if latest_google_zip:
-            # Calories
-            if fitbit_config.process_calories:
-                fitbit_extractor.process_calories(
-                    inputs_folder=input_data_folder,
-                    zip_path=latest_google_zip,
-                    cleanup=config.cleanup_unziped_files,
+        if not takeout_archive:
+            logger.warning("Couldn't find zip for google fitbit data.")
+            return
+        takeout_archives.append(takeout_archive)
+        fitbit_cache_folder = None
+        if fitbit_config.incremental:
+            fitbit_cache_folder = cache_folder / "fitbit"
+
+        # Calories
+        if fitbit_config.process_calories:
+            scheduler.add_stage(
+                "fitbit_calories",
+                fitbit_extractor.process_calories,
+                kwargs=dict(
+                    archive=takeout_archive,
                     load_function=load_function,
-                )
+                    aggregate_daily=fitbit_config.aggregate_daily_on_read,
+                    cache_folder=fitbit_cache_folder,
+                ),
+            )
 
-            # Sleep
-            if fitbit_config.process_sleep:
-                fitbit_extractor.process_sleep(
-                    inputs_folder=input_data_folder,
-                    zip_path=latest_google_zip,
-                    cleanup=config.cleanup_unziped_files,
+        # Sleep
+        if fitbit_config.process_sleep:
+            scheduler.add_stage(
+                "fitbit_sleep",
+                fitbit_extractor.process_sleep,
+                kwargs=dict(
+                    archive=takeout_archive,
                     load_function=load_function,
-                )
+                ),
+            )
 
-            # Steps
-            if fitbit_config.process_steps:
-                fitbit_extractor.process_steps(
-                    inputs_folder=input_data_folder,
-                    zip_path=latest_google_zip,
-                    cleanup=config.cleanup_unziped_files,
+        # Steps
+        if fitbit_config.process_steps:
+            scheduler.add_stage(
+                "fitbit_steps",
+                fitbit_extractor.process_steps,
+                kwargs=dict(
+                    archive=takeout_archive,
                     load_function=load_function,
-                )
+                    aggregate_daily=fitbit_config.aggregate_daily_on_read,
+                    cache_folder=fitbit_cache_folder,
+                ),
+            )
 
-            # Exercise
-            if fitbit_config.process_exercise:
-                fitbit_extractor.process_exercise(
-                    inputs_folder=input_data_folder,
-                    zip_path=latest_google_zip,
-                    cleanup=config.cleanup_unziped_files,
+        # Exercise
+        if fitbit_config.process_exercise:
+            scheduler.add_stage(
+                "fitbit_exercise",
+                fitbit_extractor.process_exercise,
+                kwargs=dict(
+                    archive=takeout_archive,
                     load_function=load_function,
-                )
-        else:
-            logger.warning("Couldn't find zip for google fitbit data.")
+                ),
+            )
+
+    if fitbit_config.process_fitbit:
+        inputs.when_ready("google/takeout*.zip", schedule_fitbit)
 
     # Github
     if config.process_github:
-        github_extractor.process_repo_contributions(
-            github_token=env_vars["GITHUB_TOKEN"],
-            load_function=load_function,
+        scheduler.add_stage(
+            "github_repo_contributions",
+            github_extractor.process_repo_contributions,
+            kwargs=dict(
+                github_token=env_vars["GITHUB_TOKEN"],
+                load_function=load_function,
+                api_url=config.github_api_url,
+                github_username=env_vars["GITHUB_USERNAME"],
+                cache_folder=cache_folder / "github",
+            ),
+            io_bound=True,
         )
 
     # Kindle
-    if config.process_kindle:
+    def schedule_kindle():
         latest_zip = get_latest_valid_zip(
             folder_path=input_data_folder,
             file_name_glob="amazon/Kindle*.zip",
             expected_file_path="Kindle.Devices.ReadingSession" "/Kindle.Devices.ReadingSession.csv",
+            manifest_path=zip_manifest_path,
         )
         if latest_zip:
-            kindle_extractor.process_reading(
-                inputs_folder=input_data_folder,
-                zip_path=latest_zip,
-                cleanup=config.cleanup_unziped_files,
-                load_function=load_function,
+            scheduler.add_stage(
+                "kindle_reading",
+                kindle_extractor.process_reading,
+                kwargs=dict(
+                    inputs_folder=input_data_folder,
+                    zip_path=latest_zip,
+                    cleanup=config.cleanup_unziped_files,
+                    load_function=load_function,
+                    cache_folder=cache_folder,
+                    max_workers=config.max_workers,
+                ),
             )
         else:
             logger.warning("Couldn't find zip for kindle data.")
 
+    if config.process_kindle:
+        inputs.when_ready("amazon/Kindle*.zip", schedule_kindle)
+
     # Strong
-    if config.process_strong:
+    def schedule_strong():
         try:
             latest_csv = get_latest_file(
                 folder_path=input_data_folder,
                 file_name_glob="strong/strong*.csv",
             )
-            strong_extractor.process_workouts(
-                latest_csv,
-                load_function,
+            scheduler.add_stage(
+                "strong_workouts",
+                strong_extractor.process_workouts,
+                kwargs=dict(
+                    csv_path=latest_csv,
+                    load_function=load_function,
+                ),
             )
         except:
             logger.warning("Couldn't process strong data")
 
-    
+    if config.process_strong:
+        inputs.when_ready("strong/strong*.csv", schedule_strong)
+
     # App Usage
-    if config.process_app_usage:
+    def schedule_app_usage():
         screen_time_csv = get_latest_file(
             folder_path=input_data_folder,
             file_name_glob="app_usage/AUM_V4_Activity*.csv"
@@ -150,18 +265,63 @@ def run_pipeline(
         except:
             logger.warning("Couldn't find app info file.")
         
-        process_screen_time(
-            screen_time_csv,
-            app_info_csv,
-            load_function=load_function
+        # Fetches app icons from the play store so it is run in a thread
+        scheduler.add_stage(
+            "app_usage_screen_time",
+            process_screen_time,
+            kwargs=dict(
+                csv_file_path=screen_time_csv,
+                app_info_path=app_info_csv,
+                load_function=load_function,
+                cache_folder=cache_folder,
+                play_store_url=config.play_store_url,
+                incremental=config.app_usage_incremental,
+            ),
+            io_bound=True,
+        )
+
+    if config.process_app_usage:
+        inputs.when_ready(
+            ["app_usage/AUM_V4_Activity*.csv", "app_usage/AUM_V4_App*.csv"],
+            schedule_app_usage,
         )
-        
+
+    with collect_stage_metrics() as stage_metrics:
+        if config.download_from_drive:
+            with PipelineStage(logger, "download_from_drive"):
+                download_files_from_drive(
+                    input_data_folder,
+                    env_vars,
+                    manifest_path=cache_folder / "drive_manifest.json",
+                    max_workers=config.download_max_workers,
+                    input_tracker=inputs,
+                )
+    # Schedules the stages still waiting, also when the download failed or is disabled
+    inputs.finish()
+
+    scheduler.run()
+    for takeout_archive in takeout_archives:
+        takeout_archive.close()
 
     if config.cleanup_ziped_files:
         for zip_file in input_data_folder.glob("*.zip"):
             zip_file.unlink()
     logger.info("Finished extracting data.")
 
+    report = create_run_report(
+        [metrics.to_dict() for metrics in stage_metrics] + scheduler.stage_metrics,
+        started_at,
+        time.perf_counter() - start_time,
+    )
+    write_run_report(report, Path(DEFAULT_LOG_DIR))
+
+    if resource_sampler:
+        resource_sampler.stop()
+        stop_memory_profiling()
+        write_memory_report(
+            report["stages"], resource_sampler.samples, Path(DEFAULT_LOG_DIR)
+        )
+
 
 if __name__ == "__main__":
     config = config_loader.load_config("config/config.toml")
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from benchmarks.stand_ins import StandInServer, create_play_store_handler
+from yd_extractor.app_usage.app_info_map import (
+    MISSING_ICON_CACHE_TTL,
+    get_play_store_icons,
+)
+from yd_extractor.utils.io import read_json_cache, write_json_cache
+
+ICON_URL = "https://play-lh.googleusercontent.com/"
+
+
+def create_counting_handler(failing_packages: set[str] = frozenset()):
+    """Play store stand-in which counts the pages requested and answers 500 for
+    failing_packages."""
+    play_store_handler = create_play_store_handler(missing_every=10)
+
+    class CountingHandler(play_store_handler):
+        requested: list[str] = []
+
+        def do_GET(self) -> None:
+            package_name = self.path.split("id=")[1].split("&")[0]
+            CountingHandler.requested.append(package_name)
+            if package_name in failing_packages:
+                self.send_response(500)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            super().do_GET()
+
+    return CountingHandler
+
+
+@pytest.fixture
+def play_store():
+    handler = create_counting_handler(failing_packages={"com.app.broken"})
+    with StandInServer(handler, "/store/apps/details") as server:
+        server.requested = handler.requested
+        yield server
+
+
+def test_fetches_icons_and_missing_apps(play_store):
+    icons = get_play_store_icons(
+        ["com.app1", "com.app2", "com.app10"], play_store_url=play_store.url
+    )
+    assert icons == {
+        "com.app1": ICON_URL + "com.app1",
+        "com.app2": ICON_URL + "com.app2",
+        # The stand-in answers 404 for every 10th app
+        "com.app10": None,
+    }
+
+
+def test_duplicate_packages_are_fetched_once(play_store):
+    get_play_store_icons(["com.app1", "com.app1"], play_store_url=play_store.url)
+    assert play_store.requested == ["com.app1"]
+
+
+def test_cached_icons_are_not_fetched_again(play_store, tmp_path):
+    cache_path = tmp_path / "play_store_icons.json"
+    packages = ["com.app1", "com.app10"]
+    first_icons = get_play_store_icons(
+        packages, cache_path=cache_path, play_store_url=play_store.url
+    )
+    play_store.requested.clear()
+    second_icons = get_play_store_icons(
+        packages, cache_path=cache_path, play_store_url=play_store.url
+    )
+    assert second_icons == first_icons
+    assert play_store.requested == []
+
+
+def test_stale_cache_entries_are_fetched_again(play_store, tmp_path):
+    cache_path = tmp_path / "play_store_icons.json"
+    write_json_cache(
+        cache_path,
+        {
+            "com.app10": {
+                "icon": None,
+                "fetched_at": time.time() - MISSING_ICON_CACHE_TTL - 1,
+            },
+            "com.app1": {"icon": ICON_URL + "cached", "fetched_at": time.time()},
+        },
+    )
+    icons = get_play_store_icons(
+        ["com.app1", "com.app10"], cache_path=cache_path, play_store_url=play_store.url
+    )
+    assert icons["com.app1"] == ICON_URL + "cached"
+    assert play_store.requested == ["com.app10"]
+
+
+def test_failed_requests_are_not_cached(play_store, tmp_path):
+    cache_path = tmp_path / "play_store_icons.json"
+    icons = get_play_store_icons(
+        ["com.app.broken", "com.app1"],
+        cache_path=cache_path,
+        play_store_url=play_store.url,
+    )
+    assert icons["com.app.broken"] is None
+    assert set(read_json_cache(cache_path)) == {"com.app1"}
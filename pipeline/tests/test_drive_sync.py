@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from yd_extractor.utils.drive_sync import (
+    STAGING_SUFFIX,
+    LocalDirectorySource,
+    sync_drive_folder,
+)
+from yd_extractor.utils.io import read_json_cache
+
+
+class CountingSource(LocalDirectorySource):
+    """Local folder source which records the files downloaded, and fails the first
+    download of each file in failing_paths."""
+
+    def __init__(self, folder_path, failing_paths=()) -> None:
+        super().__init__(folder_path)
+        self.failing_paths = set(failing_paths)
+        self.downloaded = []
+
+    def download(self, remote_file, output_path) -> None:
+        if remote_file.path in self.failing_paths:
+            self.failing_paths.remove(remote_file.path)
+            # Partial download left behind, it must not replace the local file
+            output_path.write_bytes(b"partial")
+            raise ConnectionError(f"Download of {remote_file.path} interrupted")
+        super().download(remote_file, output_path)
+        self.downloaded.append(remote_file.path)
+
+
+@pytest.fixture
+def drive(tmp_path):
+    source_folder = tmp_path / "drive"
+    (source_folder / "amazon").mkdir(parents=True)
+    (source_folder / "amazon" / "Kindle.zip").write_bytes(b"kindle")
+    (source_folder / "takeout.zip").write_bytes(b"takeout")
+    return source_folder
+
+
+def sync(source, tmp_path):
+    return sync_drive_folder(
+        source, tmp_path / "input", tmp_path / "drive_manifest.json", max_workers=2
+    )
+
+
+def test_first_sync_downloads_every_file(drive, tmp_path):
+    source = CountingSource(drive)
+    downloaded_files = sync(source, tmp_path)
+    input_folder = tmp_path / "input"
+    assert sorted(downloaded_files) == [
+        input_folder / "amazon" / "Kindle.zip",
+        input_folder / "takeout.zip",
+    ]
+    assert (input_folder / "amazon" / "Kindle.zip").read_bytes() == b"kindle"
+    assert (input_folder / "takeout.zip").read_bytes() == b"takeout"
+    assert set(read_json_cache(tmp_path / "drive_manifest.json")) == {
+        "amazon/Kindle.zip",
+        "takeout.zip",
+    }
+
+
+def test_resync_without_changes_downloads_nothing(drive, tmp_path):
+    sync(CountingSource(drive), tmp_path)
+    source = CountingSource(drive)
+    assert sync(source, tmp_path) == []
+    assert source.downloaded == []
+
+
+def test_changed_and_new_files_are_downloaded(drive, tmp_path):
+    sync(CountingSource(drive), tmp_path)
+    (drive / "takeout.zip").write_bytes(b"newer takeout")
+    (drive / "strong.csv").write_bytes(b"workouts")
+    source = CountingSource(drive)
+    sync(source, tmp_path)
+    assert sorted(source.downloaded) == ["strong.csv", "takeout.zip"]
+    assert (tmp_path / "input" / "takeout.zip").read_bytes() == b"newer takeout"
+
+
+def test_failed_download_is_retried_next_sync(drive, tmp_path):
+    sync(CountingSource(drive), tmp_path)
+    (drive / "takeout.zip").write_bytes(b"newer takeout")
+    source = CountingSource(drive, failing_paths={"takeout.zip"})
+    with pytest.raises(RuntimeError, match="takeout.zip"):
+        sync(source, tmp_path)
+    # The previous version is kept and the manifest still describes it
+    local_path = tmp_path / "input" / "takeout.zip"
+    assert local_path.read_bytes() == b"takeout"
+    manifest = read_json_cache(tmp_path / "drive_manifest.json")
+    assert manifest["takeout.zip"]["size"] == len(b"takeout")
+
+    assert sync(source, tmp_path) == [local_path]
+    assert source.downloaded == ["takeout.zip"]
+    assert local_path.read_bytes() == b"newer takeout"
+    assert not os.path.exists(f"{local_path}{STAGING_SUFFIX}")
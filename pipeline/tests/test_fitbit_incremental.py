@@ -0,0 +1,107 @@
+import json
+import zipfile
+
+import pytest
+
+from yd_extractor.fitbit.takeout_archive import FITBIT_EXPORT_PREFIX, TakeoutArchive
+from yd_extractor.fitbit.utils import (
+    extract_time_series_data,
+    extract_time_series_data_incremental,
+    transform_time_series_data,
+)
+from yd_extractor.utils.io import read_json_cache
+
+
+def create_samples(day: str, values: list[int]) -> list[dict]:
+    """Samples of a day, one per hour, day is "MM/DD/YY"."""
+    return [
+        {"dateTime": f"{day} {hour:02d}:00:00", "value": str(value)}
+        for hour, value in enumerate(values)
+    ]
+
+
+@pytest.fixture
+def export_files():
+    # Each file covers a few days, the last day of a file may continue in the next one
+    return {
+        "steps-2024-01-01.json": create_samples("01/01/24", [100, 200, 300])
+        + create_samples("01/02/24", [50]),
+        "steps-2024-01-03.json": create_samples("01/02/24", [25])
+        + create_samples("01/03/24", [400, 10]),
+        "steps-2024-01-05.json": create_samples("01/05/24", [1000]),
+    }
+
+
+def write_takeout_zip(zip_path, export_files: dict) -> None:
+    with zipfile.ZipFile(zip_path, "w") as zip_file:
+        for file_name, samples in export_files.items():
+            zip_file.writestr(FITBIT_EXPORT_PREFIX + file_name, json.dumps(samples))
+        # Other data types aren't read
+        zip_file.writestr(FITBIT_EXPORT_PREFIX + "calories-2024-01-01.json", "[]")
+
+
+@pytest.fixture
+def read_files(monkeypatch):
+    """Names of the files read from the archive."""
+    read_files = []
+    read = TakeoutArchive.read
+
+    def recording_read(self, zip_info):
+        read_files.append(zip_info.filename.removeprefix(FITBIT_EXPORT_PREFIX))
+        return read(self, zip_info)
+
+    monkeypatch.setattr(TakeoutArchive, "read", recording_read)
+    return read_files
+
+
+def extract_daily_totals(zip_path, cache_path):
+    """Daily totals of the incremental and the full extraction."""
+    with TakeoutArchive(zip_path) as archive:
+        incremental = extract_time_series_data_incremental(
+            archive, "steps", cache_path
+        )
+        full = extract_time_series_data(archive, "steps")
+    return transform_time_series_data(incremental), transform_time_series_data(full)
+
+
+def test_unchanged_files_are_not_read(tmp_path, export_files, read_files):
+    zip_path, cache_path = tmp_path / "takeout.zip", tmp_path / "steps.json"
+    write_takeout_zip(zip_path, export_files)
+    extract_daily_totals(zip_path, cache_path)
+    read_files.clear()
+
+    with TakeoutArchive(zip_path) as archive:
+        df = extract_time_series_data_incremental(archive, "steps", cache_path)
+    assert read_files == []
+    assert transform_time_series_data(df)["value"].tolist() == [600, 75, 410, 1000]
+
+
+def test_changed_file_is_read_again(tmp_path, export_files, read_files):
+    zip_path, cache_path = tmp_path / "takeout.zip", tmp_path / "steps.json"
+    write_takeout_zip(zip_path, export_files)
+    extract_daily_totals(zip_path, cache_path)
+
+    export_files["steps-2024-01-03.json"] = create_samples("01/03/24", [7, 8])
+    write_takeout_zip(zip_path, export_files)
+    read_files.clear()
+    incremental, full = extract_daily_totals(zip_path, cache_path)
+    # Once by the incremental extraction, once by the full one
+    assert read_files.count("steps-2024-01-03.json") == 2
+    assert read_files.count("steps-2024-01-01.json") == 1
+    assert incremental.equals(full)
+    assert incremental["value"].tolist() == [600, 50, 15, 1000]
+
+
+def test_removed_file_is_dropped(tmp_path, export_files, read_files):
+    zip_path, cache_path = tmp_path / "takeout.zip", tmp_path / "steps.json"
+    write_takeout_zip(zip_path, export_files)
+    extract_daily_totals(zip_path, cache_path)
+
+    del export_files["steps-2024-01-05.json"]
+    write_takeout_zip(zip_path, export_files)
+    incremental, full = extract_daily_totals(zip_path, cache_path)
+    assert incremental.equals(full)
+    assert incremental["value"].tolist() == [600, 75, 410]
+    assert FITBIT_EXPORT_PREFIX + "steps-2024-01-05.json" not in read_json_cache(
+        cache_path
+    )
@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from yd_extractor.utils.io import read_json_cache
+from yd_extractor.utils.output_manifest import (
+    OUTPUT_MANIFEST_PATH,
+    write_bytes_atomically,
+    write_output_file,
+)
+
+RELATIVE_PATH = Path("fitbit_steps.csv")
+CONTENT = b"date,steps\n2024-01-01,8000\n"
+
+
+def list_tmp_files(folder: Path) -> list[Path]:
+    return list(folder.rglob("*.tmp"))
+
+
+def test_first_write_is_recorded_in_manifest(tmp_path):
+    assert write_output_file(tmp_path, RELATIVE_PATH, CONTENT, rows=1)
+    assert (tmp_path / RELATIVE_PATH).read_bytes() == CONTENT
+    entry = read_json_cache(tmp_path / OUTPUT_MANIFEST_PATH)["fitbit_steps.csv"]
+    assert entry["size"] == len(CONTENT)
+    assert entry["rows"] == 1
+
+
+def test_unchanged_content_is_not_written(tmp_path):
+    write_output_file(tmp_path, RELATIVE_PATH, CONTENT, rows=1)
+    path = tmp_path / RELATIVE_PATH
+    os.utime(path, ns=(0, 0))
+    assert not write_output_file(tmp_path, RELATIVE_PATH, CONTENT, rows=1)
+    assert os.stat(path).st_mtime_ns == 0
+
+
+def test_changed_content_replaces_the_file(tmp_path):
+    write_output_file(tmp_path, RELATIVE_PATH, CONTENT, rows=1)
+    new_content = CONTENT + b"2024-01-02,9000\n"
+    assert write_output_file(tmp_path, RELATIVE_PATH, new_content, rows=2)
+    assert (tmp_path / RELATIVE_PATH).read_bytes() == new_content
+    entry = read_json_cache(tmp_path / OUTPUT_MANIFEST_PATH)["fitbit_steps.csv"]
+    assert entry["rows"] == 2
+
+
+def test_deleted_file_is_written_again(tmp_path):
+    write_output_file(tmp_path, RELATIVE_PATH, CONTENT, rows=1)
+    (tmp_path / RELATIVE_PATH).unlink()
+    # The manifest still matches the content, but the file is gone
+    assert write_output_file(tmp_path, RELATIVE_PATH, CONTENT, rows=1)
+    assert (tmp_path / RELATIVE_PATH).read_bytes() == CONTENT
+
+
+def test_no_temporary_files_are_left(tmp_path):
+    write_output_file(tmp_path, RELATIVE_PATH, CONTENT)
+    write_output_file(tmp_path, Path("metadata") / "steps_metadata.json", b"{}")
+    write_output_file(tmp_path, RELATIVE_PATH, CONTENT + b"\n")
+    assert list_tmp_files(tmp_path) == []
+
+
+def test_failed_write_keeps_previous_file(tmp_path, monkeypatch):
+    path = tmp_path / RELATIVE_PATH
+    write_bytes_atomically(path, CONTENT)
+
+    def fail_replace(source, destination):
+        raise OSError("Disk full")
+
+    monkeypatch.setattr(os, "replace", fail_replace)
+    with pytest.raises(OSError):
+        write_bytes_atomically(path, b"half written")
+    assert path.read_bytes() == CONTENT
+    assert list_tmp_files(tmp_path) == []
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from yd_extractor.utils.pandas import parse_hms_durations
+
+
+def parse_durations_per_row(durations: pd.Series) -> pd.Series:
+    """How durations were parsed before `parse_hms_durations`."""
+    return pd.to_timedelta(durations).dt.total_seconds()
+
+
+@pytest.mark.parametrize(
+    "durations",
+    [
+        pytest.param(["0:05:12", "1:00:00", "12:34:56"], id="h:mm:ss"),
+        pytest.param(["25:00:00", "100:00:01"], id="more than a day"),
+        pytest.param(["1:2:3", "0:61:00"], id="unpadded or overflowing fields"),
+        pytest.param(["0:05:12", None, np.nan], id="missing values"),
+        pytest.param([None, None], id="only missing values"),
+        pytest.param([], id="empty"),
+    ],
+)
+def test_matches_per_row_parser(durations):
+    series = pd.Series(durations, index=range(10, 10 + len(durations)), dtype=object)
+    pd.testing.assert_series_equal(
+        parse_hms_durations(series), parse_durations_per_row(series), check_dtype=False
+    )
+
+
+@pytest.mark.parametrize(
+    "durations",
+    [
+        pytest.param(["05:12"], id="mm:ss"),
+        pytest.param(["0:05:12", "05:12"], id="mixed with mm:ss"),
+        pytest.param(["0:05:12", "abc"], id="malformed"),
+    ],
+)
+def test_raises_like_per_row_parser(durations):
+    series = pd.Series(durations, dtype=object)
+    with pytest.raises(ValueError) as expected_error:
+        parse_durations_per_row(series)
+    with pytest.raises(ValueError) as error:
+        parse_hms_durations(series)
+    assert str(error.value) == str(expected_error.value)
+
+
+def test_matches_per_row_parser_on_many_durations(monkeypatch):
+    rng = np.random.default_rng(0)
+    seconds = rng.integers(0, 48 * 3600, 10_000)
+    durations = pd.Series(
+        [f"{s // 3600}:{s // 60 % 60:02d}:{s % 60:02d}" for s in seconds],
+        index=rng.permutation(len(seconds)),
+        dtype=object,
+    )
+    durations[::7] = None
+    expected = parse_durations_per_row(durations)
+
+    def fail_to_timedelta(*args, **kwargs):
+        raise AssertionError("Valid durations should be parsed by numpy")
+
+    monkeypatch.setattr(pd, "to_timedelta", fail_to_timedelta)
+    pd.testing.assert_series_equal(parse_hms_durations(durations), expected)
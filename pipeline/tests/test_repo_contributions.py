@@ -0,0 +1,36 @@
+import pytest
+
+from benchmarks.stand_ins import create_github_contributions, start_github_stand_in
+from yd_extractor.github.repo_contributions import (create_github_session,
+                                                    fetch_repo_contributions)
+
+NUMBER_OF_REPOS = 10
+
+
+@pytest.fixture
+def github_api():
+    server = start_github_stand_in(NUMBER_OF_REPOS)
+    yield server
+    server.stop()
+
+
+def test_fetches_every_page_of_every_repo(github_api):
+    expected_contributions = create_github_contributions(2024, NUMBER_OF_REPOS)
+    # Otherwise only the first page is tested
+    assert any(len(nodes) > 100 for nodes in expected_contributions.values())
+
+    with create_github_session("synthetic") as session:
+        contributions = fetch_repo_contributions(session, 2024, github_api.url)
+
+    assert sorted(
+        (node["occurredAt"], node["repository"]["url"], node["commitCount"])
+        for nodes in expected_contributions.values()
+        for node in nodes
+    ) == sorted(
+        (
+            contribution["occured_at"],
+            contribution["repository_url"],
+            contribution["commit_count"],
+        )
+        for contribution in contributions
+    )
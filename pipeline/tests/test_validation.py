@@ -0,0 +1,118 @@
+import datetime
+
+import pandas as pd
+import pandera as pa
+import pytest
+from pandera.typing.pandas import DataFrame, Series
+
+from yd_extractor.kindle.schemas import check_is_valid_asin
+from yd_extractor.utils.validation import (
+    ValidationLevel,
+    check_is_time,
+    check_types,
+    configure_validation,
+    validate,
+)
+
+
+class ReadingSessions(pa.DataFrameModel):
+    class Config:
+        coerce = True
+
+    asin: Series[str] = pa.Field()
+    start_time: Series[object] = pa.Field()
+    page_flips: Series[int] = pa.Field(default=0)
+
+    @pa.check("asin")
+    def is_valid_asin(self, series: Series[str]) -> Series[bool]:
+        return check_is_valid_asin(series)
+
+    @pa.check("start_time")
+    def is_time(self, series: Series[object]) -> Series[bool]:
+        return check_is_time(series)
+
+
+@check_types
+def passthrough(df: DataFrame[ReadingSessions]) -> DataFrame[ReadingSessions]:
+    return df
+
+
+@pytest.fixture(autouse=True)
+def reset_validation_level():
+    yield
+    configure_validation(ValidationLevel.FULL)
+
+
+@pytest.fixture
+def valid_sessions():
+    return pd.DataFrame(
+        {
+            "asin": ["B000000001", "B000000002", "B000000001"],
+            "start_time": [datetime.time(9), datetime.time(12, 30), datetime.time(21)],
+            "page_flips": ["3", None, "7"],
+        }
+    )
+
+
+@pytest.fixture
+def invalid_sessions(valid_sessions):
+    df = valid_sessions.copy()
+    df.loc[1, "asin"] = "not an asin"
+    df.loc[2, "start_time"] = "21:00:00"
+    return df
+
+
+def get_failed_rows(error: pa.errors.SchemaErrors) -> dict[str, list[int]]:
+    failure_cases = error.failure_cases
+    return {
+        check: sorted(failure_cases[failure_cases["check"] == check]["index"])
+        for check in ["is_valid_asin", "is_time"]
+    }
+
+
+def test_valid_data_passes_every_level(valid_sessions):
+    for level in ValidationLevel:
+        configure_validation(level)
+        df = validate(valid_sessions, ReadingSessions)
+        assert df["page_flips"].tolist() == [3, 0, 7]
+
+
+def test_full_raises_in_check_types_and_validate(invalid_sessions):
+    configure_validation(ValidationLevel.FULL)
+    with pytest.raises(pa.errors.SchemaError, match="is_valid_asin"):
+        passthrough(invalid_sessions)
+    with pytest.raises(pa.errors.SchemaError, match="is_valid_asin"):
+        validate(invalid_sessions, ReadingSessions)
+    # Failure reports name the failing rows of each check
+    with pytest.raises(pa.errors.SchemaErrors) as error:
+        ReadingSessions.validate(invalid_sessions, lazy=True)
+    assert get_failed_rows(error.value) == {"is_valid_asin": [1], "is_time": [2]}
+
+
+def test_once_per_boundary_only_raises_in_validate(invalid_sessions):
+    configure_validation(ValidationLevel.ONCE_PER_BOUNDARY)
+    assert passthrough(invalid_sessions) is invalid_sessions
+    with pytest.raises(pa.errors.SchemaError, match="is_valid_asin"):
+        validate(invalid_sessions, ReadingSessions)
+    with pytest.raises(pa.errors.SchemaError, match="is_time"):
+        validate(invalid_sessions.drop(index=1), ReadingSessions)
+
+
+def test_sampled_raises_for_failing_rows_in_the_sample(invalid_sessions):
+    configure_validation(ValidationLevel.SAMPLED, sample_size=2)
+    assert passthrough(invalid_sessions) is invalid_sessions
+    # Every row is invalid, so any sample fails
+    df = pd.concat([invalid_sessions.iloc[[1]]] * 5, ignore_index=True)
+    with pytest.raises(pa.errors.SchemaError, match="is_valid_asin"):
+        validate(df, ReadingSessions)
+
+
+def test_off_only_coerces(invalid_sessions):
+    configure_validation(ValidationLevel.OFF)
+    assert passthrough(invalid_sessions) is invalid_sessions
+    df = validate(invalid_sessions, ReadingSessions)
+    # Checks aren't run, but types and defaults are still applied
+    assert df["asin"].tolist() == ["B000000001", "not an asin", "B000000001"]
+    assert df["start_time"].tolist()[2] == "21:00:00"
+    assert df["page_flips"].tolist() == [3, 0, 7]
+    assert df["page_flips"].dtype == "int64"
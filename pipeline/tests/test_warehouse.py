@@ -0,0 +1,125 @@
+import pandas as pd
+import pytest
+
+from yd_extractor.app_usage.schemas import AppInfoMap
+from yd_extractor.github.schemas import GithubRepoContributions
+from yd_extractor.kindle.schemas import AsinMap
+from yd_extractor.utils.warehouse import (
+    connect_to_warehouse,
+    get_primary_key,
+    read_warehouse_table,
+    upsert_table,
+)
+
+TABLE_NAME = "github_repo_contributions"
+
+
+def create_contributions(rows: list[tuple]) -> pd.DataFrame:
+    df = pd.DataFrame(
+        rows,
+        columns=["date", "total_commits", "repository_name", "repository_url"],
+    )
+    df["date"] = pd.to_datetime(df["date"])
+    df["repository_image"] = ""
+    return df
+
+
+@pytest.fixture
+def contributions():
+    return create_contributions(
+        [
+            ("2024-01-01", 3, "pipeline", "https://github.com/me/pipeline"),
+            ("2024-01-01", 1, "website", "https://github.com/me/website"),
+            ("2024-01-02", 5, "pipeline", "https://github.com/me/pipeline"),
+            # Rows with a missing key are matched with IS
+            ("2024-01-03", 2, None, None),
+        ]
+    )
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    connection = connect_to_warehouse(tmp_path / "warehouse.sqlite")
+    yield connection
+    connection.close()
+
+
+def read_table(tmp_path, name: str = TABLE_NAME) -> list[tuple]:
+    df = read_warehouse_table(tmp_path / "warehouse.sqlite", name)
+    return sorted(df.itertuples(index=False, name=None), key=str)
+
+
+def test_primary_key_is_unique_column_or_date_and_category():
+    assert get_primary_key(AsinMap, ["asin", "product_name"]) == ["asin"]
+    assert get_primary_key(
+        GithubRepoContributions,
+        ["date", "total_commits", "repository_name", "repository_url"],
+    ) == ["date", "repository_name"]
+    assert get_primary_key(AppInfoMap, ["app_name", "image", "category"]) == []
+
+
+def test_first_upsert_inserts_every_row(warehouse, tmp_path, contributions):
+    assert upsert_table(
+        warehouse, contributions, TABLE_NAME, GithubRepoContributions
+    ) == (4, 0)
+    assert read_table(tmp_path) == sorted(
+        [
+            ("2024-01-01", 3, "pipeline", "https://github.com/me/pipeline", ""),
+            ("2024-01-01", 1, "website", "https://github.com/me/website", ""),
+            ("2024-01-02", 5, "pipeline", "https://github.com/me/pipeline", ""),
+            ("2024-01-03", 2, None, None, ""),
+        ],
+        key=str,
+    )
+
+
+def test_identical_upsert_changes_no_rows(warehouse, tmp_path, contributions):
+    upsert_table(warehouse, contributions, TABLE_NAME, GithubRepoContributions)
+    rows = read_table(tmp_path)
+    assert upsert_table(
+        warehouse, contributions, TABLE_NAME, GithubRepoContributions
+    ) == (0, 0)
+    assert read_table(tmp_path) == rows
+
+
+def test_changed_day_replaces_its_row(warehouse, tmp_path, contributions):
+    upsert_table(warehouse, contributions, TABLE_NAME, GithubRepoContributions)
+    contributions.loc[2, "total_commits"] = 8
+    assert upsert_table(
+        warehouse, contributions, TABLE_NAME, GithubRepoContributions
+    ) == (1, 1)
+    rows = read_table(tmp_path)
+    assert ("2024-01-02", 8, "pipeline", "https://github.com/me/pipeline", "") in rows
+    assert len(rows) == 4
+
+
+def test_removed_row_is_deleted(warehouse, tmp_path, contributions):
+    upsert_table(warehouse, contributions, TABLE_NAME, GithubRepoContributions)
+    contributions = contributions.drop(index=1)
+    assert upsert_table(
+        warehouse, contributions, TABLE_NAME, GithubRepoContributions
+    ) == (0, 1)
+    assert [row[2] for row in read_table(tmp_path)] == ["pipeline", "pipeline", None]
+
+
+def test_table_without_unique_or_date_column(warehouse, tmp_path):
+    df = pd.DataFrame(
+        {
+            "app_name": ["Maps", "Chess", "Chess"],
+            "image": ["maps.png", "chess.png", "chess.png"],
+            "category": ["Travel", "Games", "Games"],
+        }
+    )
+    # Rows are compared on every column, identical rows can't be told apart
+    assert upsert_table(warehouse, df, "app_info_map", AppInfoMap) == (2, 0)
+    assert upsert_table(warehouse, df, "app_info_map", AppInfoMap) == (0, 0)
+
+    df.loc[0, "category"] = "Navigation"
+    assert upsert_table(warehouse, df, "app_info_map", AppInfoMap) == (1, 1)
+    assert read_table(tmp_path, "app_info_map") == [
+        ("Chess", "chess.png", "Games"),
+        ("Maps", "maps.png", "Navigation"),
+    ]
+
+    assert upsert_table(warehouse, df.iloc[:1], "app_info_map", AppInfoMap) == (0, 1)
+    assert read_table(tmp_path, "app_info_map") == [("Maps", "maps.png", "Navigation")]
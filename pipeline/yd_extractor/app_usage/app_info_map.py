@@ -1,40 +1,64 @@
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Callable, Optional
 
 import pandas as pd
-import pandera as pa
 import requests
 from bs4 import BeautifulSoup
 from pandera.typing.pandas import DataFrame
+from requests.adapters import HTTPAdapter
 
-from yd_extractor.utils.pipeline_stage import PipelineStage
+from yd_extractor.utils.pipeline_stage import PipelineStage, record_metrics
 from yd_extractor.app_usage.schemas import AppInfoMap, RawAppInfoMap
+from yd_extractor.utils.csv_reader import read_csv_from_schema
+from yd_extractor.utils.io import read_json_cache, write_json_cache
 from yd_extractor.utils.pandas import rename_df_from_schema
+from yd_extractor.utils.validation import check_types, validate
 
 logger = logging.getLogger(__name__)
 
+PLAY_STORE_URL = "https://play.google.com/store/apps/details"
+PLAY_STORE_MAX_WORKERS = 8
+ICON_CACHE_TTL = 30 * 24 * 60 * 60  # seconds
+MISSING_ICON_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
 
-@pa.check_types
+
+@check_types
 def extract_app_info_map(csv_file_path: Path) -> DataFrame[RawAppInfoMap]:
     logger.info(f"Extracting app info data from {csv_file_path}...")
-    with open(csv_file_path) as file:
-        df = pd.read_csv(file)
-    df = RawAppInfoMap.validate(df)
+    df = read_csv_from_schema(csv_file_path, RawAppInfoMap, delimiter=",")
+    df = validate(df, RawAppInfoMap)
     return df
 
 
-def get_play_store_icon(package_name):
-    url = f"https://play.google.com/store/apps/details"
-    params = {"id": package_name, "hl": "en", "gl": "us"}
-    headers = {"User-Agent": "Mozilla/5.0"}
+def create_play_store_session(max_workers: int = PLAY_STORE_MAX_WORKERS) -> requests.Session:
+    """Creates a session whose connection pool is shared by all icon lookups."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": "Mozilla/5.0"})
+    return session
 
-    try:
-        response = requests.get(url, headers=headers, params=params, timeout=5)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        logger.warning(f"Failed to fetch page for {package_name}: {e}")
+
+def fetch_play_store_icon(
+    package_name: str,
+    session: requests.Session,
+    play_store_url: str = PLAY_STORE_URL,
+) -> Optional[str]:
+    """Fetches the icon url of an app from its play store page.
+
+    Returns None if the app has no page or the page has no icon. Raises
+    requests.RequestException if the page couldn't be fetched.
+    """
+    params = {"id": package_name, "hl": "en", "gl": "us"}
+    response = session.get(play_store_url, params=params, timeout=5)
+    if response.status_code == 404:
+        logger.warning(f"No play store page found for {package_name}")
         return None
+    response.raise_for_status()
 
     soup = BeautifulSoup(response.text, "html.parser")
 
@@ -49,8 +73,96 @@ def get_play_store_icon(package_name):
     return None
 
 
-@pa.check_types
-def transform_app_info_map(df: DataFrame[RawAppInfoMap]) -> DataFrame[AppInfoMap]:
+def get_play_store_icon(
+    package_name: str,
+    session: Optional[requests.Session] = None,
+    play_store_url: str = PLAY_STORE_URL,
+) -> Optional[str]:
+    try:
+        return fetch_play_store_icon(
+            package_name,
+            session or create_play_store_session(),
+            play_store_url,
+        )
+    except requests.RequestException as e:
+        logger.warning(f"Failed to fetch page for {package_name}: {e}")
+        return None
+
+
+def get_play_store_icons(
+    package_names: list[str],
+    cache_path: Optional[Path] = None,
+    play_store_url: str = PLAY_STORE_URL,
+    max_workers: int = PLAY_STORE_MAX_WORKERS,
+) -> dict[str, Optional[str]]:
+    """Gets the play store icon urls of many apps at once.
+
+    Icons are looked up concurrently over one pooled session. If cache_path is given,
+    found icons are cached for ICON_CACHE_TTL and apps without an icon for
+    MISSING_ICON_CACHE_TTL, so only missing or stale apps are fetched. Failed requests
+    are not cached.
+
+    Parameters
+    ----------
+    package_names : list[str]
+        Package names of the apps, e.g. "com.spotify.music".
+    cache_path : Optional[Path]
+        Path to the json file caching icons between runs.
+    play_store_url : str
+        Url of the play store app details page. Can be pointed at a local server.
+    max_workers : int
+        Maximum number of requests made at the same time.
+
+    Returns
+    -------
+    dict[str, Optional[str]]
+        Maps each package name to its icon url, None if it has no icon.
+    """
+    cache = read_json_cache(cache_path) if cache_path else {}
+    now = time.time()
+    icons = {}
+    packages_to_fetch = []
+    for package_name in set(package_names):
+        cached_icon = cache.get(package_name)
+        if cached_icon is not None:
+            ttl = ICON_CACHE_TTL if cached_icon["icon"] else MISSING_ICON_CACHE_TTL
+            if now - cached_icon["fetched_at"] < ttl:
+                icons[package_name] = cached_icon["icon"]
+                continue
+        packages_to_fetch.append(package_name)
+
+    logger.info(
+        f"Fetching {len(packages_to_fetch)} icons from the play store, "
+        f"{len(icons)} found in cache."
+    )
+
+    def fetch(package_name: str) -> tuple[str, Optional[str], bool]:
+        try:
+            icon = fetch_play_store_icon(package_name, session, play_store_url)
+            return package_name, icon, True
+        except requests.RequestException as e:
+            logger.warning(f"Failed to fetch page for {package_name}: {e}")
+            return package_name, None, False
+
+    with create_play_store_session(max_workers) as session, ThreadPoolExecutor(
+        max_workers
+    ) as executor:
+        for package_name, icon, fetched in executor.map(fetch, packages_to_fetch):
+            icons[package_name] = icon
+            if fetched:
+                cache[package_name] = {"icon": icon, "fetched_at": now}
+
+    if cache_path:
+        write_json_cache(cache_path, cache)
+    return icons
+
+
+@check_types
+def transform_app_info_map(
+    df: DataFrame[RawAppInfoMap],
+    icon_cache_path: Optional[Path] = None,
+    play_store_url: str = PLAY_STORE_URL,
+) -> DataFrame[AppInfoMap]:
     logger.info("Tranforming app info data...")
     df = rename_df_from_schema(df, RawAppInfoMap)
     df = df.dropna()
@@ -62,25 +174,35 @@ def transform_app_info_map(df: DataFrame[RawAppInfoMap]) -> DataFrame[AppInfoMap
             "category",
         ]
     ]
-    df
-    df["image"] = df["package_name"].apply(get_play_store_icon)
+    icons = get_play_store_icons(
+        df["package_name"].tolist(),
+        cache_path=icon_cache_path,
+        play_store_url=play_store_url,
+    )
+    df["image"] = df["package_name"].map(icons)
     df["image"] = df["image"].fillna("")
     df = df.drop("package_name", axis=1)
-    df = AppInfoMap.validate(df)
+    df = validate(df, AppInfoMap)
     return df
 
 
 def proccess_app_info_map(
     csv_file_path: Path,
     load_function: Optional[Callable[[pd.DataFrame, str], None]] = None,
+    icon_cache_path: Optional[Path] = None,
+    play_store_url: str = PLAY_STORE_URL,
 ) -> DataFrame[AppInfoMap]:
     df = AppInfoMap.empty()
 
-    with PipelineStage(logger, "app_usage_app_info"):
-        df = extract_app_info_map(csv_file_path)
-        df = transform_app_info_map(df)
+    with PipelineStage(logger, "app_usage_app_info") as stage:
+        with stage.span("extract"):
+            df = extract_app_info_map(csv_file_path)
+            record_metrics(rows_in=len(df))
+        with stage.span("transform"):
+            df = transform_app_info_map(df, icon_cache_path, play_store_url)
         if load_function:
-            load_function(df, "app_info_map", AppInfoMap)
+            with stage.span("load"):
+                load_function(df, "app_info_map", AppInfoMap)
     return df
 
 
@@ -1,35 +1,122 @@
 import logging
+import os
 from pathlib import Path
 from typing import Callable, Optional
 
 import pandas as pd
-import pandera as pa
 from pandera.typing.pandas import DataFrame
 
-from yd_extractor.utils.pipeline_stage import PipelineStage
-from yd_extractor.app_usage.app_info_map import proccess_app_info_map
+from yd_extractor.utils.pipeline_stage import PipelineStage, record_metrics
+from yd_extractor.app_usage.app_info_map import (PLAY_STORE_URL,
+                                                 proccess_app_info_map)
 from yd_extractor.app_usage.schemas import (AppInfoMap, AppUsageScreenTime,
                                             RawAppUsageScreenTime)
-from yd_extractor.utils.pandas import rename_df_from_schema
+from yd_extractor.utils.csv_reader import read_csv_from_schema
+from yd_extractor.utils.io import read_json_cache, write_json_cache
+from yd_extractor.utils.pandas import parse_hms_durations, rename_df_from_schema
+from yd_extractor.utils.validation import check_types, validate
 
 logger = logging.getLogger(__name__)
 
+SCREEN_TIME_CHUNK_SIZE = 5000
+SCREEN_TIME_HISTORY_FILE = "app_usage_screen_time.csv"
+SCREEN_TIME_STATE_FILE = "app_usage_screen_time.json"
+# Exports use the 24 or 12 hour clock depending on the phone's settings
+EVENT_TIMESTAMP_FORMATS = ["%m/%d/%y %H:%M:%S", "%m/%d/%y %I:%M:%S %p"]
 
-@pa.check_types
+
+class EventTimestampError(ValueError):
+    """Raised when the start of events of the activity log can't be parsed, so the log
+    can't be read incrementally."""
+
+
+def get_event_timestamps(df: DataFrame[RawAppUsageScreenTime]) -> pd.Series:
+    """Start of each event of the raw activity log, from its date and time columns.
+    Rows with missing values, which `transform_screen_time` drops, are NaT.
+
+    Raises
+    ------
+    EventTimestampError
+        If the date or time of any other row can't be parsed.
+    """
+    event_starts = df["Date"] + " " + df["Time"]
+    timestamps = pd.to_datetime(
+        event_starts, format=EVENT_TIMESTAMP_FORMATS[0], errors="coerce"
+    )
+    for timestamp_format in EVENT_TIMESTAMP_FORMATS[1:]:
+        is_missing = timestamps.isna()
+        if not is_missing.any():
+            break
+        timestamps[is_missing] = pd.to_datetime(
+            event_starts[is_missing], format=timestamp_format, errors="coerce"
+        )
+    is_unparsable = timestamps.isna() & df.notna().all(axis=1)
+    if is_unparsable.any():
+        example = df[is_unparsable].iloc[0]
+        raise EventTimestampError(
+            f"Couldn't parse the start of {is_unparsable.sum()} events of the activity "
+            f"log, e.g. '{example['Date']} {example['Time']}'"
+        )
+    return timestamps
+
+
+@check_types
 def extract_screen_time(
     csv_file_path: Path,
+    after: Optional[pd.Timestamp] = None,
+    chunksize: int = SCREEN_TIME_CHUNK_SIZE,
 ) -> DataFrame[RawAppUsageScreenTime]:
+    """Extracts the activity log exported by App Usage.
+
+    Parameters
+    ----------
+    csv_file_path : Path
+        Path to the "AUM_V4_Activity*.csv" export.
+    after : Optional[pd.Timestamp]
+        Only extract events which started after this timestamp. The log is ordered
+        newest event first, so it is read in chunks and reading stops at the first
+        chunk without newer events. The rest of the history isn't parsed.
+    chunksize : int
+        Rows per chunk when after is given.
+
+    Raises
+    ------
+    EventTimestampError
+        If after is given and the start of some events can't be parsed.
+    """
     logger.info(f"Extracting screen time data from {csv_file_path}")
-    with open(csv_file_path) as csv:
-        df = pd.read_csv(csv)
-    df = RawAppUsageScreenTime.validate(df)
+    if after is None:
+        df = read_csv_from_schema(csv_file_path, RawAppUsageScreenTime, delimiter=",")
+        df = validate(df, RawAppUsageScreenTime)
+        return df
+
+    chunks = []
+    number_of_rows = 0
+    with read_csv_from_schema(
+        csv_file_path, RawAppUsageScreenTime, delimiter=",", chunksize=chunksize
+    ) as reader:
+        for chunk in reader:
+            number_of_rows += len(chunk)
+            timestamps = get_event_timestamps(chunk)
+            is_new = timestamps > after
+            chunks.append(chunk[is_new])
+            # Rows with missing values are NaT, they don't tell if the chunk is new
+            if timestamps.notna().any() and not is_new.any():
+                break
+    df = RawAppUsageScreenTime.empty()
+    if chunks:
+        df = pd.concat(chunks, ignore_index=True)
+    logger.info(
+        f"Read {number_of_rows} rows of the activity log, "
+        f"{len(df)} events are newer than {after}."
+    )
+    df = validate(df, RawAppUsageScreenTime)
     return df
 
 
-@pa.check_types
+@check_types
 def transform_screen_time(
     df: DataFrame[RawAppUsageScreenTime],
-    df_app_info_map: Optional[DataFrame[AppInfoMap]] = None,
 ) -> DataFrame[AppUsageScreenTime]:
     logger.info("Transforming screen time data.")
     df = rename_df_from_schema(df, RawAppUsageScreenTime)
@@ -41,37 +128,140 @@ def transform_screen_time(
     ]
     df = df[~df["app_name"].isin(names_to_drop)]
     df["date"] = pd.to_datetime(df["date"], format="%m/%d/%y")
-    df["duration_minutes"] = pd.to_timedelta(df["duration"]).dt.total_seconds() / 60
+    df["duration_minutes"] = parse_hms_durations(df["duration"]) / 60
     df["duration_minutes"] = df["duration_minutes"].round().astype(int)
     df = df[df["duration_minutes"] > 0]
     df = df.drop(columns=["duration"])
+    df = validate(df, AppUsageScreenTime)
+    return df
 
-    if df_app_info_map is not None:
-        df = pd.merge(
-            df,
-            df_app_info_map,
-            how="left",
-        )
-        df["image"] = df["image"].fillna("")
-        df["category"] = df["category"].fillna("")
-    df = AppUsageScreenTime.validate(df)
+
+@check_types
+def merge_app_info(
+    df: DataFrame[AppUsageScreenTime],
+    df_app_info_map: DataFrame[AppInfoMap],
+) -> DataFrame[AppUsageScreenTime]:
+    """Adds the icon and category of each app to the screen time."""
+    df = pd.merge(
+        df,
+        df_app_info_map,
+        how="left",
+    )
+    df["image"] = df["image"].fillna("")
+    df["category"] = df["category"].fillna("")
+    df = validate(df, AppUsageScreenTime)
     return df
 
 
+def read_screen_time_history(
+    cache_folder: Path,
+) -> tuple[Optional[DataFrame[AppUsageScreenTime]], Optional[pd.Timestamp]]:
+    """Reads the screen time transformed in previous runs, along with the timestamp of
+    the last event extracted from the activity log.
+
+    Returns
+    -------
+    tuple[Optional[DataFrame[AppUsageScreenTime]], Optional[pd.Timestamp]]
+        (None, None) if there is no history, or it doesn't match its state because a
+        previous run stopped whilst writing them.
+    """
+    state = read_json_cache(cache_folder / SCREEN_TIME_STATE_FILE)
+    history_path = cache_folder / SCREEN_TIME_HISTORY_FILE
+    if "last_event" not in state or not os.path.exists(history_path):
+        return None, None
+
+    df = pd.read_csv(
+        history_path,
+        dtype={"app_name": str, "time": str},
+        parse_dates=["date"],
+        keep_default_na=False,
+    )
+    if len(df) != state["rows"]:
+        logger.warning(f"Screen time history {history_path} is incomplete, ignoring it.")
+        return None, None
+    df = validate(df, AppUsageScreenTime)
+    return df, pd.Timestamp(state["last_event"])
+
+
+def write_screen_time_history(
+    cache_folder: Path,
+    df: DataFrame[AppUsageScreenTime],
+    last_event: pd.Timestamp,
+) -> None:
+    """Stores the transformed screen time and the timestamp of the last event extracted
+    from the activity log, see `read_screen_time_history`."""
+    os.makedirs(cache_folder, exist_ok=True)
+    history_path = cache_folder / SCREEN_TIME_HISTORY_FILE
+    tmp_path = f"{history_path}.tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, history_path)
+    write_json_cache(
+        cache_folder / SCREEN_TIME_STATE_FILE,
+        {"last_event": last_event.isoformat(), "rows": len(df)},
+    )
+
+
 def process_screen_time(
     csv_file_path: Path,
     app_info_path: Optional[Path] = None,
     load_function: Optional[Callable[[pd.DataFrame, str], None]] = None,
+    cache_folder: Optional[Path] = None,
+    play_store_url: str = PLAY_STORE_URL,
+    incremental: bool = False,
 ) -> DataFrame[AppUsageScreenTime]:
+    """Extracts screen time from the App Usage activity log, then adds the icon and
+    category of each app.
+
+    If incremental, the screen time is kept in the cache folder and only events newer
+    than the last event of the previous run are read from the activity log. Exports
+    hold the whole history, so daily runs only parse the events of the last day.
+    """
     df = AppUsageScreenTime.empty()
-    with PipelineStage(logger, "app_usage_screen_time"):
-        df = extract_screen_time(csv_file_path)
+    with PipelineStage(logger, "app_usage_screen_time") as stage:
+        df_history, last_event = None, None
+        history_folder = None
+        if incremental and cache_folder:
+            history_folder = cache_folder / "app_usage"
+            df_history, last_event = read_screen_time_history(history_folder)
+        with stage.span("extract"):
+            latest_event = None
+            try:
+                df = extract_screen_time(csv_file_path, after=last_event)
+                if history_folder:
+                    latest_event = get_event_timestamps(df).max()
+            except EventTimestampError as e:
+                logger.warning(
+                    f"{e}. Reading the whole activity log, without keeping its history."
+                )
+                if last_event is not None:
+                    df = extract_screen_time(csv_file_path)
+                df_history, last_event, history_folder = None, None, None
+            record_metrics(rows_in=len(df))
         df_app_info_map = None
         if app_info_path:
-            df_app_info_map = proccess_app_info_map(app_info_path)
-        df = transform_screen_time(df, df_app_info_map)
+            icon_cache_path = None
+            if cache_folder:
+                icon_cache_path = cache_folder / "play_store_icons.json"
+            df_app_info_map = proccess_app_info_map(
+                app_info_path,
+                icon_cache_path=icon_cache_path,
+                play_store_url=play_store_url,
+            )
+        with stage.span("transform"):
+            df = transform_screen_time(df)
+            if history_folder:
+                if df_history is not None:
+                    # The log is newest first, so new events go before the history
+                    df = pd.concat([df, df_history], ignore_index=True)
+                if pd.notna(latest_event):
+                    last_event = latest_event
+                if last_event is not None:
+                    write_screen_time_history(history_folder, df, last_event)
+            if df_app_info_map is not None:
+                df = merge_app_info(df, df_app_info_map)
         if load_function:
-            load_function(df, "app_usage_screen_time", AppUsageScreenTime)
+            with stage.span("load"):
+                load_function(df, "app_usage_screen_time", AppUsageScreenTime)
         
     return df
 
@@ -2,3 +2,4 @@ from .calories import process_calories
 from .exercise import process_exercise
 from .sleep import process_sleep
 from .steps import process_steps
+from .takeout_archive import TakeoutArchive
@@ -1,37 +1,30 @@
 import logging
-import shutil
-from pathlib import Path
 from typing import Callable, Optional
 
 import pandas as pd
-import pandera as pa
 from pandera.typing.pandas import DataFrame
 
-from yd_extractor.utils.pipeline_stage import PipelineStage
+from yd_extractor.utils.pipeline_stage import PipelineStage, record_metrics
+from yd_extractor.fitbit.takeout_archive import TakeoutArchive
 from yd_extractor.fitbit.schemas import FitbitExercise, RawFitbitExercise
 from yd_extractor.fitbit.utils import extract_json_file_data
 from yd_extractor.utils.pandas import (convert_columns_to_numeric,
                                        validate_columns)
-from yd_extractor.utils.io import extract_specific_files_flat
+from yd_extractor.utils.validation import check_types, validate
 
 logger = logging.getLogger(__name__)
 
 
-@pa.check_types
-def extract_exercise(data_folder: str, zip_path: str) -> DataFrame[RawFitbitExercise]:
-    """Extract exercise data from files from the folder path. The files have the name
+@check_types
+def extract_exercise(archive: TakeoutArchive) -> DataFrame[RawFitbitExercise]:
+    """Extract exercise data from files in the zip file. The files have the name
     format "exercise-YYYY-MM-DD.json".
 
     Parameters
     ----------
-    folder_path : str
-        Path to folder containing jsons with exercise data.
+    archive : TakeoutArchive
+        Index of google takeout zip containing jsons with exercise data.
     """
-    extract_specific_files_flat(
-        zip_file_path=zip_path,
-        prefix="Takeout/Fitbit/Global Export Data/exercise",
-        output_path=data_folder,
-    )
     keys_to_keep = [
         "activityName",
         "averageHeartRate",
@@ -42,9 +35,11 @@ def extract_exercise(data_folder: str, zip_path: str) -> DataFrame[RawFitbitExer
         "pace",
     ]
     df = extract_json_file_data(
-        data_folder, file_name_prefix="exercise", keys_to_keep=keys_to_keep
+        archive,
+        data_type="exercise",
+        keys_to_keep=keys_to_keep,
     )
-    df = RawFitbitExercise.validate(df)
+    df = validate(df, RawFitbitExercise)
     return df
 
 
@@ -95,29 +90,25 @@ def transform_exercise(df: DataFrame[RawFitbitExercise]) -> DataFrame[FitbitExer
             "pace_minutes_per_km",
         ]
     ]
-    df = FitbitExercise.validate(df)
+    df = validate(df, FitbitExercise)
     return df
 
 
 def process_exercise(
-    inputs_folder: Path,
-    zip_path: Path,
-    cleanup: bool = True,
+    archive: TakeoutArchive,
     load_function: Optional[Callable[[pd.DataFrame, str], None]] = None,
 ) -> pd.DataFrame:
 
-    # Unzip and extract jsons from zip file.
-    data_folder = inputs_folder / "exercise"
-    
-    with PipelineStage(logger, "fitbit_exercise"):
-        df = extract_exercise(data_folder, zip_path)
-        df = transform_exercise(df)
+    # Read jsons straight from takeout archive.
+    df = FitbitExercise.empty()
+    with PipelineStage(logger, "fitbit_exercise") as stage:
+        with stage.span("extract"):
+            df = extract_exercise(archive)
+            record_metrics(rows_in=len(df))
+        with stage.span("transform"):
+            df = transform_exercise(df)
         if load_function:
-            load_function(df, "fitbit_exercise", FitbitExercise)
-
-
-    if cleanup:
-        logger.info(f"Removing folder {data_folder} from zip...")
-        shutil.rmtree(data_folder)
+            with stage.span("load"):
+                load_function(df, "fitbit_exercise", FitbitExercise)
 
     return df
@@ -6,7 +6,7 @@ class RawTimeSeriesData(pa.DataFrameModel):
     class Config:
         coerce = True
 
-    date: Series[str] = pa.Field(
+    date: Series[pa.Timestamp] = pa.Field(
         alias="dateTime",
     )
     value: Series[float] = pa.Field()
@@ -1,45 +1,48 @@
 import logging
-import shutil
 from pathlib import Path
 from typing import Callable, Optional
 
 import pandas as pd
 
-from yd_extractor.utils.pipeline_stage import PipelineStage
-from yd_extractor.fitbit.utils import (extract_json_file_data,
+from yd_extractor.utils.pipeline_stage import PipelineStage, record_metrics
+from yd_extractor.fitbit.takeout_archive import TakeoutArchive
+from yd_extractor.fitbit.utils import (extract_time_series_data,
+                                       extract_time_series_data_incremental,
                                        transform_time_series_data)
-from yd_extractor.utils.io import extract_specific_files_flat
 from yd_extractor.fitbit.schemas import TimeSeriesData
 
 logger = logging.getLogger(__name__)
 
 
 def process_steps(
-    inputs_folder: Path, 
-    zip_path: Path, 
-    cleanup: bool = True,
+    archive: TakeoutArchive,
     load_function: Optional[Callable[[pd.DataFrame, str], None]] = None,
+    aggregate_daily: bool = False,
+    cache_folder: Optional[Path] = None,
 ) -> pd.DataFrame:
 
-    # Unzip and extract calories jsons from zip file.
-    with PipelineStage(logger, "fitbit_steps"):
-        data_folder = inputs_folder / "steps"
-        extract_specific_files_flat(
-            zip_file_path=zip_path,
-            prefix="Takeout/Fitbit/Global Export Data/steps",
-            output_path=data_folder,
-        )
-        df = extract_json_file_data(
-            folder_path=data_folder,
-            file_name_prefix="steps",
-            keys_to_keep=["dateTime", "value"],
-        )
-        df = transform_time_series_data(df)
+    # Read steps jsons straight from takeout archive.
+    df = TimeSeriesData.empty()
+    with PipelineStage(logger, "fitbit_steps") as stage:
+        with stage.span("extract"):
+            if cache_folder:
+                # Only parse files which changed since the last run
+                df = extract_time_series_data_incremental(
+                    archive=archive,
+                    data_type="steps",
+                    cache_path=cache_folder / "fitbit_steps.json",
+                )
+            else:
+                df = extract_time_series_data(
+                    archive=archive,
+                    data_type="steps",
+                    aggregate_daily=aggregate_daily,
+                )
+            record_metrics(rows_in=len(df))
+        with stage.span("transform"):
+            df = transform_time_series_data(df)
         if load_function:
-            load_function(df, "fitbit_steps", TimeSeriesData)
-
-
-    if cleanup:
-        shutil.rmtree(data_folder)
+            with stage.span("load"):
+                load_function(df, "fitbit_steps", TimeSeriesData)
 
     return df
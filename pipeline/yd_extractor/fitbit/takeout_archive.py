@@ -0,0 +1,144 @@
+import logging
+import os
+import re
+import zipfile
+from pathlib import Path
+from typing import Iterator, Optional
+
+from yd_extractor.utils.io import iter_valid_zips
+from yd_extractor.utils.pipeline_stage import record_metrics
+
+logger = logging.getLogger(__name__)
+
+FITBIT_EXPORT_PREFIX = "Takeout/Fitbit/Global Export Data/"
+
+# Fitbit exports every series as "{data_type}-YYYY-MM-DD.json" (a few as .csv).
+FITBIT_FILE_PATTERN = re.compile(r"^(?P<data_type>.+)-\d{4}-\d{2}-\d{2}\.(json|csv)$")
+
+
+class TakeoutArchive:
+    """Index of the fitbit files inside a google takeout zip.
+
+    The central directory of the zip is read once when the archive is opened and the
+    members inside "Takeout/Fitbit/Global Export Data/" are grouped by their data type
+    (calories, steps, sleep, exercise, heart_rate, ...). Each stage can then get its
+    members without rescanning the whole zip.
+
+    An already open zip file of zip_path can be passed, e.g. the one opened to check
+    the zip is valid. The open zip file is not pickled, it is reopened lazily when the
+    archive is used in another process.
+    """
+
+    def __init__(
+        self,
+        zip_path: Path,
+        zip_file: Optional[zipfile.ZipFile] = None,
+    ) -> None:
+        self.zip_path = Path(zip_path)
+        self._zip_file = zip_file
+        self._members: dict[str, list[zipfile.ZipInfo]] = {}
+        self._index()
+
+    @classmethod
+    def from_latest_zip(
+        cls,
+        folder_path: Path,
+        file_name_glob: str,
+        manifest_path: Optional[Path] = None,
+    ) -> Optional["TakeoutArchive"]:
+        """Opens the most recent zip matching the glob which contains fitbit data.
+
+        Parameters
+        ----------
+        folder_path : Path
+            Path where the takeout zips are.
+        file_name_glob : str
+            Name/pattern the zips match.
+        manifest_path : Optional[Path]
+            Manifest of zips checked in previous runs, see `iter_valid_zips`. Zips
+            known to not contain fitbit data aren't opened again.
+
+        Returns
+        -------
+        TakeoutArchive | None
+            Archive of the latest valid zip. None if no zip contains fitbit data.
+        """
+        for file, zip_file in iter_valid_zips(
+            folder_path, file_name_glob, FITBIT_EXPORT_PREFIX, manifest_path
+        ):
+            try:
+                archive = cls(file, zip_file)
+            except Exception:
+                logger.warning(f"Couldn't read zip {file}")
+                if zip_file is not None:
+                    zip_file.close()
+                continue
+            if archive.data_types:
+                return archive
+            archive.close()
+        return None
+
+    def _index(self) -> None:
+        for zip_info in self.zip_file.infolist():
+            if zip_info.is_dir():
+                continue
+            folder, file_name = os.path.split(zip_info.filename)
+            if folder + "/" != FITBIT_EXPORT_PREFIX:
+                continue
+            match = FITBIT_FILE_PATTERN.match(file_name)
+            if not match:
+                continue
+            self._members.setdefault(match["data_type"], []).append(zip_info)
+
+        logger.info(
+            f"Indexed {sum(len(m) for m in self._members.values())} fitbit files "
+            f"from '{os.path.relpath(self.zip_path)}'"
+        )
+
+    @property
+    def zip_file(self) -> zipfile.ZipFile:
+        if self._zip_file is None:
+            self._zip_file = zipfile.ZipFile(self.zip_path, "r")
+        return self._zip_file
+
+    @property
+    def data_types(self) -> list[str]:
+        return list(self._members.keys())
+
+    def members(self, data_type: str) -> list[zipfile.ZipInfo]:
+        """Returns the zip members which hold the given fitbit data type."""
+        return self._members.get(data_type, [])
+
+    def iter_members(self, data_type: str) -> Iterator[tuple[str, bytes]]:
+        """Iterates over the files of the given data type, reading each one into memory.
+
+        Yields
+        ------
+        tuple[str, bytes]
+            Name of the file inside the archive and its contents.
+        """
+        for zip_info in self.members(data_type):
+            yield zip_info.filename, self.read(zip_info)
+
+    def read(self, zip_info: zipfile.ZipInfo) -> bytes:
+        """Reads a single member of the archive into memory."""
+        with self.zip_file.open(zip_info) as source_file:
+            content = source_file.read()
+        record_metrics(bytes_read=len(content))
+        return content
+
+    def close(self) -> None:
+        if self._zip_file is not None:
+            self._zip_file.close()
+            self._zip_file = None
+
+    def __enter__(self) -> "TakeoutArchive":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_zip_file"] = None
+        return state
@@ -1,31 +1,44 @@
 import datetime
 import json
 import logging
-import os
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
-import pandera as pa
 from pandera.typing.pandas import DataFrame
 
 from yd_extractor.fitbit.schemas import RawTimeSeriesData, TimeSeriesData
+from yd_extractor.fitbit.takeout_archive import TakeoutArchive
+from yd_extractor.utils.io import read_json_cache, write_json_cache
 from yd_extractor.utils.pandas import rename_df_from_schema
+from yd_extractor.utils.validation import check_types, validate
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 logger = logging.getLogger(__name__)
 
+FITBIT_DATETIME_FORMAT = "%m/%d/%y %H:%M:%S"
+
 
 def extract_json_file_data(
-    folder_path: str,
-    file_name_prefix: str,
+    archive: TakeoutArchive,
+    data_type: str,
     keys_to_keep: list[str],
 ) -> pd.DataFrame:
-    """Extract fitbit data from the folder path containing jsons. The files in the folder
-    have the format like : "{file_name_prefix}-YYYY-MM-DD.json".
+    """Extract fitbit data from the jsons inside the takeout archive. The files in the
+    zip have the format like : "{data_type}-YYYY-MM-DD.json" and are parsed in memory
+    without being extracted to disk.
 
     Parameters
     ----------
-    folder_path : str
-        Path to folder containing jsons of fitbit data.
-    file_name_prefix : str
+    archive : TakeoutArchive
+        Index of the google takeout zip containing jsons of fitbit data.
+    data_type : str
         Defines what specific data to filter.
     keys_to_keep : list[str]
         From the jsons, keys_to_keep determines which key value pairs should be kept.
@@ -36,33 +49,203 @@ def extract_json_file_data(
         Pandas dataframe with keys_to_keep as the columns with rows being objects/dicts
         extracted from the jsons.
     """
-    file_names = [f for f in os.listdir(folder_path) if f.startswith(file_name_prefix)]
-    if len(file_names) == 0:
-        logger.error(f"No files found with prefix: {file_name_prefix}")
-
     full_data = []
-    for file_name in file_names:
-        file_path = folder_path / file_name
-        with open(file_path) as file:
-            data_list = json.load(file)
-            for data in data_list:
-                filtered_data = {
-                    key: data[key] for key in keys_to_keep if key in list(data.keys())
-                }
-                if filtered_data.keys() != keys_to_keep:
-                    full_data.append(filtered_data)
-
-            del data_list  # Free memory used by data_list
-            # TODO: When I delete the data_list variable I find that memory usage goes
-            #   down by 200MB. I know python has its own garbage collection system but I
-            #   found my self hitting memory limits in small docker containers with RAM
-            #   ~500MB. Am I doing something wrong here??
+    number_of_files = 0
+    for _, content in archive.iter_members(data_type):
+        number_of_files += 1
+        data_list = json_loads(content)
+        for data in data_list:
+            filtered_data = {
+                key: data[key] for key in keys_to_keep if key in data
+            }
+            if filtered_data.keys() != keys_to_keep:
+                full_data.append(filtered_data)
+
+        del data_list  # Free memory used by data_list
+        # TODO: When I delete the data_list variable I find that memory usage goes
+        #   down by 200MB. I know python has its own garbage collection system but I
+        #   found my self hitting memory limits in small docker containers with RAM
+        #   ~500MB. Am I doing something wrong here??
+
+    if number_of_files == 0:
+        logger.error(f"No files found for data type: {data_type}")
 
     df = pd.DataFrame(full_data)
     return df
 
 
-@pa.check_types
+def parse_time_series_json(content: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """Parse the contents of a fitbit time series json into typed arrays. The json is a
+    list of samples like `{"dateTime": "MM/DD/YY HH:MM:SS", "value": "1.23"}`.
+
+    Parameters
+    ----------
+    content : bytes
+        Contents of a file like "{data_type}-YYYY-MM-DD.json".
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        Array of sample times with type datetime64 and array of values with type
+        float64.
+    """
+    data_list = json_loads(content)
+    date_times = pd.to_datetime(
+        [data["dateTime"] for data in data_list],
+        format=FITBIT_DATETIME_FORMAT,
+    ).to_numpy()
+    values = np.array([data["value"] for data in data_list], dtype=np.float64)
+    return date_times, values
+
+
+def aggregate_daily_values(
+    date_times: np.ndarray,
+    values: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Reduce samples to one total per day.
+
+    Parameters
+    ----------
+    date_times : np.ndarray
+        Sample times with type datetime64.
+    values : np.ndarray
+        Sample values.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        Array of days (datetime64 at midnight) and array with the total for each day.
+    """
+    days = date_times.astype("datetime64[D]").astype(date_times.dtype)
+    daily_values = pd.Series(values).groupby(days).sum()
+    return daily_values.index.to_numpy(), daily_values.to_numpy()
+
+
+def extract_time_series_data(
+    archive: TakeoutArchive,
+    data_type: str,
+    aggregate_daily: bool = False,
+) -> DataFrame[RawTimeSeriesData]:
+    """Extract fitbit time series data (calories, steps, ...) from the jsons inside the
+    takeout archive. Each file is parsed straight into typed arrays, so the samples
+    never exist as python dicts and the dataframe is built once at the end.
+
+    Parameters
+    ----------
+    archive : TakeoutArchive
+        Index of the google takeout zip containing jsons of fitbit data.
+    data_type : str
+        Defines what specific data to filter.
+    aggregate_daily : bool
+        If True each file is reduced to its daily totals as soon as it is read, so only
+        one row per day is kept in memory instead of every sample. Passing the result
+        to `transform_time_series_data` gives the same output as the samples would.
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe containing columns:
+        * dateTime with type datetime.
+        * value with type float.
+    """
+    date_time_arrays = []
+    value_arrays = []
+    for _, content in archive.iter_members(data_type):
+        date_times, values = parse_time_series_json(content)
+        if aggregate_daily:
+            date_times, values = aggregate_daily_values(date_times, values)
+        date_time_arrays.append(date_times)
+        value_arrays.append(values)
+
+    if len(date_time_arrays) == 0:
+        logger.error(f"No files found for data type: {data_type}")
+        return RawTimeSeriesData.empty()
+
+    df = pd.DataFrame(
+        {
+            "dateTime": np.concatenate(date_time_arrays),
+            "value": np.concatenate(value_arrays),
+        }
+    )
+    return df
+
+
+def extract_time_series_data_incremental(
+    archive: TakeoutArchive,
+    data_type: str,
+    cache_path: Path,
+) -> DataFrame[RawTimeSeriesData]:
+    """Extract the daily totals of fitbit time series data, only parsing the files which
+    are new or have changed since the last run.
+
+    The cache stores the CRC and size of each "{data_type}-YYYY-MM-DD.json" file, which
+    are read from the zip's central directory, along with the daily totals of that
+    file. Files whose CRC and size match the cache are not read at all.
+
+    Parameters
+    ----------
+    archive : TakeoutArchive
+        Index of the google takeout zip containing jsons of fitbit data.
+    data_type : str
+        Defines what specific data to filter.
+    cache_path : Path
+        Path to the json file storing the state of previous runs.
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe with the same daily totals as
+        `extract_time_series_data(archive, data_type, aggregate_daily=True)`.
+    """
+    cached_files = read_json_cache(cache_path)
+    files = {}
+    number_of_parsed_files = 0
+    for zip_info in archive.members(data_type):
+        cached_file = cached_files.get(zip_info.filename)
+        if (
+            cached_file is None
+            or cached_file["crc"] != zip_info.CRC
+            or cached_file["file_size"] != zip_info.file_size
+        ):
+            days, values = aggregate_daily_values(
+                *parse_time_series_json(archive.read(zip_info))
+            )
+            cached_file = {
+                "crc": zip_info.CRC,
+                "file_size": zip_info.file_size,
+                "days": np.datetime_as_string(days, unit="D").tolist(),
+                "values": values.tolist(),
+            }
+            number_of_parsed_files += 1
+        files[zip_info.filename] = cached_file
+
+    logger.info(
+        f"Parsed {number_of_parsed_files} new or changed {data_type} files, "
+        f"{len(files) - number_of_parsed_files} were unchanged since last run."
+    )
+    # Files no longer in the archive are dropped from the cache.
+    write_json_cache(cache_path, files)
+
+    if len(files) == 0:
+        logger.error(f"No files found for data type: {data_type}")
+        return RawTimeSeriesData.empty()
+
+    df = pd.DataFrame(
+        {
+            "dateTime": np.array(
+                [day for file in files.values() for day in file["days"]],
+                dtype="datetime64[ns]",
+            ),
+            "value": np.array(
+                [value for file in files.values() for value in file["values"]],
+                dtype=np.float64,
+            ),
+        }
+    )
+    return df
+
+
+@check_types
 def transform_time_series_data(
     df: DataFrame[RawTimeSeriesData],
 ) -> DataFrame[TimeSeriesData]:
@@ -72,18 +255,18 @@ def transform_time_series_data(
     ----------
     df : pd.DataFrame
         dataframe containing columns:
-        * dateTime with type string.
-        * value with type integer.
+        * dateTime with type datetime.
+        * value with type float.
 
     Returns
     -------
     pd.DataFrame
         Dataframe containing columns:
         * date with type datetime.
-        * value with type integer.
+        * value with type float.
     """
     df = rename_df_from_schema(df, RawTimeSeriesData)
-    df["date"] = pd.to_datetime(df["date"], format="%m/%d/%y %H:%M:%S").dt.date
+    df["date"] = df["date"].dt.normalize()
     df = (
         df.groupby(["date"])
         .aggregate(
@@ -93,6 +276,5 @@ def transform_time_series_data(
         )
         .reset_index()
     )
-    df["date"] = pd.to_datetime(df["date"])
-    df = TimeSeriesData.validate(df)
+    df = validate(df, TimeSeriesData)
     return df
@@ -1,21 +1,28 @@
 import logging
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Callable, Optional
 
 import pandas as pd
-import pandera as pa
 import requests
 from pandera.typing.pandas import DataFrame
+from requests.adapters import HTTPAdapter
 
 from yd_extractor.github.schemas import (GithubRepoContributions,
                                          RawGithubRepoContributions)
+from yd_extractor.utils.io import (load_graphql_query, read_json_cache,
+                                   write_json_cache)
 from yd_extractor.utils.pandas import (convert_columns_to_numeric,
                                        validate_columns)
-from yd_extractor.utils.pipeline_stage import PipelineStage
+from yd_extractor.utils.pipeline_stage import PipelineStage, record_metrics
+from yd_extractor.utils.validation import check_types, validate
 
 logger = logging.getLogger(__name__)
 
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+GITHUB_MAX_WORKERS = 4
+
 
 def unpack_contributions_dict(contributions_for_repo: dict) -> list[dict]:
     """Unpacks contribution dicts obtained from the using a graphql query on github
@@ -75,62 +82,208 @@ def unpack_contributions_dict(contributions_for_repo: dict) -> list[dict]:
     return node_list
 
 
-@pa.check_types
-def extract_repo_contributions(
-    github_token: str, year: int
-) -> DataFrame[RawGithubRepoContributions]:
+def load_query(query_name: str) -> str:
+    # Load query from seperate file
+    path_to_query = Path(__file__).parent / "graphql" / f"{query_name}.graphql"
+    query = load_graphql_query(path_to_query)
+    if not query:
+        raise Exception(f"Couldn't load query {query_name}!")
+    return query
 
-    if year < 2005:
-        raise Exception("Can't load contributions from before 2005!")
 
+def create_github_session(github_token: str) -> requests.Session:
+    """Creates a session whose connection pool is shared by all requests to github."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=GITHUB_MAX_WORKERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Authorization": f"Bearer {github_token}"})
+    session.verify = False
+    return session
+
+
+def post_graphql_query(
+    session: requests.Session,
+    query: str,
+    variables: dict,
+    api_url: str = GITHUB_GRAPHQL_URL,
+) -> dict:
+    """Posts a graphql query and returns the data of the response."""
+    response = session.post(
+        api_url,
+        json={"query": query, "variables": variables},
+    )
+    if not response.ok:
+        response.raise_for_status()
+
+    response_json = response.json()
+    if response_json.get("errors"):
+        raise Exception(f"Github graphql query failed: {response_json['errors']}")
+    return response_json["data"]
+
+
+def fetch_repo_commit_history(
+    session: requests.Session,
+    owner: str,
+    name: str,
+    author_id: str,
+    year: int,
+    api_url: str = GITHUB_GRAPHQL_URL,
+) -> list[dict]:
+    """Fetches the commits authored by author_id on the default branch of a repository
+    in the given year, 100 at a time, and sums them per day.
+
+    Used for repos with more contribution days than a GetUserRepoContributions page
+    holds, as that query can't be narrowed down to a single repo. Days are UTC days of
+    the commits' authored dates.
+
+    Returns
+    -------
+    list[dict]
+        Contributions of the repo in the format returned by
+        `unpack_contributions_dict`.
+    """
+    query = load_query("GetRepoCommitHistory")
+    variables = {
+        "owner": owner,
+        "name": name,
+        "authorId": author_id,
+        "since": f"{year}-01-01T00:00:00Z",
+        "until": f"{year}-12-31T23:59:59Z",
+    }
+    commit_counts: dict[str, int] = {}
+    has_next_page, end_cursor = True, None
+    while has_next_page:
+        repository = post_graphql_query(
+            session, query, {**variables, "after": end_cursor}, api_url
+        )["repository"]
+        if repository is None or repository["defaultBranchRef"] is None:
+            break
+        history = repository["defaultBranchRef"]["target"]["history"]
+        for node in history["nodes"]:
+            day = node["authoredDate"][:10] + "T00:00:00Z"
+            commit_counts[day] = commit_counts.get(day, 0) + 1
+        has_next_page = history["pageInfo"]["hasNextPage"]
+        end_cursor = history["pageInfo"]["endCursor"]
+
+    if repository is None:
+        return []
+    return [
+        {
+            "commit_count": commit_count,
+            "occured_at": day,
+            "repository_name": repository["name"],
+            "repository_url": repository["url"],
+            "repository_image": repository["openGraphImageUrl"],
+        }
+        for day, commit_count in sorted(commit_counts.items())
+    ]
+
+
+def fetch_repo_contributions(
+    session: requests.Session,
+    year: int,
+    api_url: str = GITHUB_GRAPHQL_URL,
+) -> list[dict]:
+    """Fetches all commit contributions of the viewer in the given year.
+
+    The first page of every repo's contributions comes with the
+    GetUserRepoContributions query. Only the repos which have more pages are then
+    fetched again, one repo at a time, see `fetch_repo_commit_history`.
+
+    Returns
+    -------
+    list[dict]
+        Contributions in the format returned by `unpack_contributions_dict`.
+    """
     logger.info(
-        f"Making request to https://api.github.com/graphql for repo contribution"
+        f"Making request to {api_url} for repo contribution"
         f"data from {year}"
     )
 
-    # Load query from seperate file
-    query = None
-    path_to_query = (
-        Path(__file__).parent / "graphql" / "GetUserRepoContributions.graphql"
-    )
-    with open(path_to_query, "r") as file:
-        query = file.read()
-    if query is None:
-        raise Exception("Couldn't load query GetUserRepoContributions!")
+    query = load_query("GetUserRepoContributions")
 
     # Post request to github graphql api
     variables = {
         "from": f"{year}-01-01T00:00:00Z",
         "to": f"{year}-12-31T23:59:59Z",
     }
-    headers = {"Authorization": f"Bearer {github_token}"}
-    repos_url = f"https://api.github.com/graphql"
-    response = requests.post(
-        repos_url,
-        json={"query": query, "variables": variables},
-        headers=headers,
-        verify=False,
-    )
-    if not response.ok:
-        response.raise_for_status()
-
-    # Turn response object into pandas dataframe
-    response_json = response.json()
-    contributions_by_repos = response_json["data"]["viewer"]["contributionsCollection"][
+    viewer = post_graphql_query(session, query, variables, api_url)["viewer"]
+    contributions_by_repos = viewer["contributionsCollection"][
         "commitContributionsByRepository"
     ]
+
     full_contribution_list = []
     for repo_contributions in contributions_by_repos:
-        full_contribution_list.extend(unpack_contributions_dict(repo_contributions))
+        if not repo_contributions["contributions"]["pageInfo"]["hasNextPage"]:
+            full_contribution_list.extend(unpack_contributions_dict(repo_contributions))
+            continue
+        repository = repo_contributions["repository"]
+        logger.info(f"Fetching remaining contributions of {repository['url']}...")
+        full_contribution_list.extend(
+            fetch_repo_commit_history(
+                session,
+                repository["owner"]["login"],
+                repository["name"],
+                viewer["id"],
+                year,
+                api_url,
+            )
+        )
+
+    return full_contribution_list
 
+
+def is_year_closed(year: int, fetched_at: str) -> bool:
+    """Checks if contributions fetched at the given time cover the whole year, in which
+    case they can never change."""
+    return datetime.fromisoformat(fetched_at) >= datetime(
+        year + 1, 1, 1, tzinfo=timezone.utc
+    )
+
+
+@check_types
+def extract_repo_contributions(
+    github_token: str,
+    year: int,
+    session: Optional[requests.Session] = None,
+    api_url: str = GITHUB_GRAPHQL_URL,
+    cache_folder: Optional[Path] = None,
+) -> DataFrame[RawGithubRepoContributions]:
+
+    if year < 2005:
+        raise Exception("Can't load contributions from before 2005!")
+
+    # Contributions of years which had already ended when they were fetched are
+    # served from the cache, only the current year is fetched again.
+    cache_path = cache_folder / f"{year}.json" if cache_folder else None
+    cached_year = read_json_cache(cache_path) if cache_path else {}
+    if cached_year and is_year_closed(year, cached_year["fetched_at"]):
+        logger.info(f"Loaded repo contributions from {year} from cache.")
+        full_contribution_list = cached_year["contributions"]
+    else:
+        fetched_at = datetime.now(timezone.utc).isoformat()
+        full_contribution_list = fetch_repo_contributions(
+            session or create_github_session(github_token), year, api_url
+        )
+        if cache_path:
+            write_json_cache(
+                cache_path,
+                {
+                    "fetched_at": fetched_at,
+                    "contributions": full_contribution_list,
+                },
+            )
+
+    # Turn contributions into pandas dataframe
     df = pd.DataFrame(full_contribution_list)
     if df.empty:
         df = RawGithubRepoContributions.empty()
-    df = RawGithubRepoContributions.validate(df)
+    df = validate(df, RawGithubRepoContributions)
     return df
 
 
-@pa.check_types
+@check_types
 def transform_repo_contributions(
     df: DataFrame[RawGithubRepoContributions],
 ) -> DataFrame[GithubRepoContributions]:
@@ -147,7 +300,7 @@ def transform_repo_contributions(
     ]
     if df.empty:
         df = GithubRepoContributions.empty()
-    df = GithubRepoContributions.validate(df)
+    df = validate(df, GithubRepoContributions)
     return df
 
 
@@ -155,25 +308,47 @@ def process_repo_contributions(
     github_token: Optional[str], 
     start_year: int = 2020,
     load_function: Optional[Callable[[pd.DataFrame, str], None]] = None,
+    api_url: str = GITHUB_GRAPHQL_URL,
+    github_username: Optional[str] = None,
+    cache_folder: Optional[Path] = None,
 ) -> pd.DataFrame:
     logger.info("Processing github repo contributions...")
     df = GithubRepoContributions.empty()
-    with PipelineStage(logger, "repo_contributions"):
+    with PipelineStage(logger, "repo_contributions") as stage:
         if github_token is None:
             error_message = (
                 "Couldn't process github data due to missing environment variables!"
             )
             raise Exception(error_message)
         
-        df = RawGithubRepoContributions.empty()
+        user_cache_folder = None
+        if cache_folder:
+            user_cache_folder = cache_folder / (github_username or "viewer")
+
         current_year = datetime.now().year
-        for year in range(start_year, current_year + 1):
-            df_raw = extract_repo_contributions(github_token, year)
-            df = pd.concat([df, df_raw], ignore_index=True)
-        df = transform_repo_contributions(df)
+        years = range(start_year, current_year + 1)
+        with stage.span("extract"):
+            with create_github_session(github_token) as session, ThreadPoolExecutor(
+                GITHUB_MAX_WORKERS
+            ) as executor:
+                df_raw_list = list(
+                    executor.map(
+                        lambda year: extract_repo_contributions(
+                            github_token, year, session, api_url, user_cache_folder
+                        ),
+                        years,
+                    )
+                )
+            df = pd.concat(
+                [RawGithubRepoContributions.empty(), *df_raw_list], ignore_index=True
+            )
+            record_metrics(rows_in=len(df))
+        with stage.span("transform"):
+            df = transform_repo_contributions(df)
         
         if load_function:
-            load_function(df, "github_repo_contributions", GithubRepoContributions)
+            with stage.span("load"):
+                load_function(df, "github_repo_contributions", GithubRepoContributions)
     return df
 
 
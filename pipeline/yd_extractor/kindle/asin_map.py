@@ -1,99 +1,194 @@
+import functools
 import json
 import logging
 import os
-import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Callable, Optional
 
 import pandas as pd
-import pandera as pa
 from pandera.typing.pandas import DataFrame
 
-from yd_extractor.utils.pipeline_stage import PipelineStage
+from yd_extractor.utils.pipeline_stage import PipelineStage, record_metrics
 from yd_extractor.kindle.schemas import AsinMap, RawAsinMap
-from yd_extractor.utils.io import extract_specific_files_flat
+from yd_extractor.utils.io import read_json_cache, write_json_cache
+from yd_extractor.utils.scheduler import is_stage_worker
+from yd_extractor.utils.validation import check_types, validate
 
 logger = logging.getLogger(__name__)
 
-
-def extract_book_data_from_jsons(file_names, output_path):
-    full_data = []
-    for file_name in file_names:
-        with open(output_path / file_name, "r", encoding="utf-8") as file:
-            content = file.read()
-            if '"origin":{"originType":"Purchase"}' in content:
-                try:
-                    file.seek(0)
-                    json_data = json.load(file)
-                    full_data.append(
-                        {
-                            "purchase_date": json_data["rights"][0]["acquiredDate"],
-                            "asin": json_data["resource"]["ASIN"],
-                            "product_name": json_data["resource"]["Product Name"],
-                        }
-                    )
-                except:
-                    logger.warning(f"Error whilst loading data from {file_name}")
-
-    logger.info(f"Extracted data from {len(full_data)} files.")
-    return full_data
+OWNERSHIP_PREFIX = "Digital.Content.Ownership/Digital.Content.Ownership."
+PURCHASE_ORIGIN = b'"origin":{"originType":"Purchase"}'
+KINDLE_MAX_WORKERS = 4
+OWNERSHIP_CHUNK_SIZE = 250
+
+
+def parse_ownership_json(file_name: str, content: bytes) -> Optional[dict]:
+    """Parses a "Digital.Content.Ownership.*.json" file. Returns None for books which
+    weren't purchased (samples, borrowed books, ...)."""
+    # Cheap check so borrowed books and samples are skipped without being parsed.
+    if PURCHASE_ORIGIN not in content:
+        return None
+    try:
+        json_data = json.loads(content)
+        return {
+            "purchase_date": json_data["rights"][0]["acquiredDate"],
+            "asin": json_data["resource"]["ASIN"],
+            "product_name": json_data["resource"]["Product Name"],
+        }
+    except (ValueError, KeyError, IndexError, TypeError):
+        logger.warning(f"Error whilst loading data from {file_name}")
+        return None
+
+
+def parse_ownership_members(
+    zip_file_path: Path,
+    file_names: list[str],
+) -> list[Optional[dict]]:
+    """Parses ownership files straight from the zip, see `parse_ownership_json`."""
+    with zipfile.ZipFile(zip_file_path, "r") as zip_file:
+        return [
+            parse_ownership_json(file_name, zip_file.read(file_name))
+            for file_name in file_names
+        ]
 
 
-@pa.check_types
+def parse_ownership_files(
+    zip_file_path: Path,
+    file_names: list[str],
+    max_workers: int = KINDLE_MAX_WORKERS,
+) -> list[Optional[dict]]:
+    """Parses ownership files in a process pool. The files are split into chunks so
+    each worker opens the zip once per chunk. Small libraries, machines with a single
+    cpu and stages already running in a scheduler worker process are parsed in the
+    calling process.
+
+    Returns
+    -------
+    list[Optional[dict]]
+        Result of `parse_ownership_json` for each file, in the same order as file_names.
+    """
+    chunks = [
+        file_names[start : start + OWNERSHIP_CHUNK_SIZE]
+        for start in range(0, len(file_names), OWNERSHIP_CHUNK_SIZE)
+    ]
+    max_workers = min(max_workers, os.cpu_count() or 1)
+    if len(chunks) <= 1 or max_workers <= 1 or is_stage_worker():
+        return [
+            book
+            for chunk in chunks
+            for book in parse_ownership_members(zip_file_path, chunk)
+        ]
+
+    with ProcessPoolExecutor(min(max_workers, len(chunks))) as executor:
+        chunk_books = executor.map(
+            functools.partial(parse_ownership_members, zip_file_path), chunks
+        )
+        return [book for books in chunk_books for book in books]
+
+
+@check_types
 def extract_asin_map(
-    output_path: Path,
     zip_file_path: Path,
+    cache_path: Optional[Path] = None,
+    max_workers: int = KINDLE_MAX_WORKERS,
 ) -> DataFrame[RawAsinMap]:
-    search_prefix = "Digital.Content.Ownership/Digital.Content.Ownership."
-    extract_specific_files_flat(
+    """Extracts the purchased books from the ownership jsons inside the kindle zip,
+    without extracting them to disk.
+
+    If a cache path is given, the CRC and size of each ownership file (read from the
+    zip's central directory) are stored along with the book parsed from it. Files whose
+    CRC and size match the cache are not read again.
+
+    Parameters
+    ----------
+    zip_file_path : Path
+        Path to the amazon kindle zip.
+    cache_path : Optional[Path]
+        Path to the json file storing the books parsed in previous runs.
+    max_workers : int
+        Processes parsing the ownership files, see `parse_ownership_files`.
+    """
+    with zipfile.ZipFile(zip_file_path, "r") as zip_file:
+        members = [
+            zip_info
+            for zip_info in zip_file.infolist()
+            if zip_info.filename.startswith(OWNERSHIP_PREFIX) and not zip_info.is_dir()
+        ]
+    if len(members) == 0:
+        logger.error(f"No files found with prefix: {OWNERSHIP_PREFIX}")
+
+    cached_files = read_json_cache(cache_path) if cache_path else {}
+    changed_members = [
+        zip_info
+        for zip_info in members
+        if zip_info.filename not in cached_files
+        or cached_files[zip_info.filename]["crc"] != zip_info.CRC
+        or cached_files[zip_info.filename]["file_size"] != zip_info.file_size
+    ]
+    books = parse_ownership_files(
         zip_file_path,
-        search_prefix,
-        output_path,
+        [zip_info.filename for zip_info in changed_members],
+        max_workers,
     )
-    file_prefix = "Digital.Content.Ownership."
-    file_names = [f for f in os.listdir(output_path) if f.startswith(file_prefix)]
-    if len(file_names) == 0:
-        logger.error(f"No files found with prefix: {file_prefix}")
+    record_metrics(bytes_read=sum(zip_info.file_size for zip_info in changed_members))
+    for zip_info, book in zip(changed_members, books):
+        cached_files[zip_info.filename] = {
+            "crc": zip_info.CRC,
+            "file_size": zip_info.file_size,
+            "book": book,
+        }
+    logger.info(
+        f"Parsed {len(changed_members)} new or changed ownership files, "
+        f"{len(members) - len(changed_members)} were unchanged since last run."
+    )
+
+    # Files no longer in the zip are dropped from the cache.
+    files = {zip_info.filename: cached_files[zip_info.filename] for zip_info in members}
+    if cache_path:
+        write_json_cache(cache_path, files)
 
-    full_data = extract_book_data_from_jsons(file_names, output_path)
+    full_data = [file["book"] for file in files.values() if file["book"]]
+    logger.info(f"Extracted data from {len(full_data)} files.")
     df = pd.DataFrame(full_data)
-    RawAsinMap.validate(df)
+    df = validate(df, RawAsinMap)
     return df
 
 
-@pa.check_types
+@check_types
 def transform_asin_map(df: DataFrame[RawAsinMap]) -> DataFrame[AsinMap]:
     df = df.drop("purchase_date", axis=1)
     df = df.groupby("asin").aggregate({"product_name": "first"}).reset_index()
     df["product_name"] = df["product_name"].apply(lambda name: name.split(":")[0])
 
-    AsinMap.validate(df)
+    df = validate(df, AsinMap)
     return df
 
 
 def process_asin_map(
-    inputs_folder: Path,
     zip_path: Path,
-    cleanup: bool = True,
     load_function: Optional[Callable[[pd.DataFrame, str], None]] = None,
-    
+    cache_folder: Optional[Path] = None,
+    max_workers: int = KINDLE_MAX_WORKERS,
 ) -> DataFrame[AsinMap]:
     df = AsinMap.empty()
-    with PipelineStage(logger, "kindle_asin_map"):
-        data_folder = inputs_folder / "kindle_asin_map"
-        df = extract_asin_map(data_folder, zip_path)
-        df = transform_asin_map(df)
+    with PipelineStage(logger, "kindle_asin_map") as stage:
+        cache_path = None
+        if cache_folder:
+            cache_path = cache_folder / "kindle_asin_map.json"
+        with stage.span("extract"):
+            df = extract_asin_map(zip_path, cache_path, max_workers)
+            record_metrics(rows_in=len(df))
+        with stage.span("transform"):
+            df = transform_asin_map(df)
         if load_function:
-            load_function(df, "kindle_asin_map", AsinMap)
-
-    if cleanup:
-        logger.info(f"Removing folder {data_folder} from zip...")
-        shutil.rmtree(data_folder)
+            with stage.span("load"):
+                load_function(df, "kindle_asin_map", AsinMap)
     return df
 
 
 if __name__ == "__main__":
     df = process_asin_map(
-        Path("data/input"),
         Path("data/input/Kindle.zip"),
     )
@@ -4,20 +4,21 @@ from pathlib import Path
 from typing import Callable, Optional, Union
 
 import pandas as pd
-import pandera as pa
 from pandera.typing.pandas import DataFrame
 
-from yd_extractor.utils.pipeline_stage import PipelineStage
-from yd_extractor.kindle.asin_map import process_asin_map
+from yd_extractor.utils.pipeline_stage import PipelineStage, record_metrics
+from yd_extractor.kindle.asin_map import KINDLE_MAX_WORKERS, process_asin_map
 from yd_extractor.kindle.schemas import (AsinMap, KindleReading,
                                          RawKindleReading)
-from yd_extractor.utils.pandas import detect_delimiter, rename_df_from_schema
+from yd_extractor.utils.csv_reader import read_csv_from_schema
+from yd_extractor.utils.pandas import rename_df_from_schema
 from yd_extractor.utils.io import extract_specific_files_flat
+from yd_extractor.utils.validation import check_types, validate
 
 logger = logging.getLogger(__name__)
 
 
-@pa.check_types
+@check_types
 def extract_reading(data_folder: Path, zip_file_path) -> DataFrame[RawKindleReading]:
     kindle_search_prefix = (
         "Kindle.Devices.ReadingSession" "/Kindle.Devices.ReadingSession.csv"
@@ -29,15 +30,8 @@ def extract_reading(data_folder: Path, zip_file_path) -> DataFrame[RawKindleRead
     )
     csv_path = data_folder / "Kindle.Devices.ReadingSession.csv"
     # Read in csv from config into a pandas dataframe
-    df = None
-    with open(csv_path) as csv_file:
-        delimeter = detect_delimiter(csv_file)
-        df = pd.read_csv(
-            csv_file,
-            delimiter=delimeter,
-            parse_dates=["start_timestamp", "end_timestamp"],
-        )
-    df = RawKindleReading.validate(df)
+    df = read_csv_from_schema(csv_path, RawKindleReading)
+    df = validate(df, RawKindleReading)
     return df
 
 
@@ -50,8 +44,9 @@ def transform_reading(
     df["start_timestamp"] = pd.to_datetime(df["start_timestamp"])
     df.loc[:, "date"] = df["start_timestamp"].dt.date
     df.loc[:, "start_time"] = df["start_timestamp"].dt.time
-    df["total_reading_minutes"] = df["total_reading_millis"].apply(
-        lambda x: round(x / (60 * 1000))
+    # Rounds half to even, like python's round
+    df["total_reading_minutes"] = (
+        (df["total_reading_millis"] / (60 * 1000)).round().astype(int)
     )
     df.drop("total_reading_millis", axis=1)
     df = (
@@ -69,7 +64,7 @@ def transform_reading(
     # Inner join on asin map
     df = asin_map.merge(df, how="inner", on="asin")
     df = df.rename(columns={"product_name": "book_name"})
-    df["image"] = df["asin"].apply(get_asin_image)
+    df["image"] = get_asin_images(df["asin"])
 
     df = df[
         [
@@ -82,7 +77,7 @@ def transform_reading(
             "number_of_page_flips",
         ]
     ]
-    df = KindleReading.validate(df)
+    df = validate(df, KindleReading)
     return df
 
 
@@ -91,20 +86,30 @@ def process_reading(
     zip_path: Path,
     cleanup: bool = True,
     load_function: Optional[Callable[[pd.DataFrame, str], None]] = None,
+    cache_folder: Optional[Path] = None,
+    max_workers: int = KINDLE_MAX_WORKERS,
 ) -> pd.DataFrame:
     """
     Read in kindle data from csv file.
 
+    max_workers is the number of processes parsing the ownership files of the asin
+    map, they are parsed inline when run by the stage scheduler's process pool.
     """
     df = KindleReading.empty()
     
-    with PipelineStage(logger, "kindle_reading"):
+    with PipelineStage(logger, "kindle_reading") as stage:
         data_folder = inputs_folder / "kindle"
-        df = extract_reading(data_folder, zip_path)
-        asin_map = process_asin_map(inputs_folder, zip_path, cleanup)
-        df = transform_reading(df, asin_map)
+        with stage.span("extract"):
+            df = extract_reading(data_folder, zip_path)
+            record_metrics(rows_in=len(df))
+        asin_map = process_asin_map(
+            zip_path, cache_folder=cache_folder, max_workers=max_workers
+        )
+        with stage.span("transform"):
+            df = transform_reading(df, asin_map)
         if load_function:
-            load_function(df, "kindle_reading", KindleReading)
+            with stage.span("load"):
+                load_function(df, "kindle_reading", KindleReading)
         
     if cleanup:
         logger.info(f"Removing folder {data_folder} from zip...")
@@ -151,6 +156,24 @@ def get_asin_image(asin: str) -> Union[str, None]:
     return f"https://images.amazon.com/images/P/{asin}.jpg"
 
 
+def get_asin_images(asins: pd.Series) -> pd.Series:
+    """Applies `get_asin_image` to a series of asin codes. Each asin is repeated on
+    every day it was read, so the urls are built once per unique asin and mapped back.
+
+    Parameters
+    ----------
+    asins : pd.Series
+        asin codes.
+
+    Returns
+    -------
+    pd.Series
+        Image url of each valid asin code, None for the others.
+    """
+    unique_asins = asins.unique()
+    return asins.map(dict(zip(unique_asins, map(get_asin_image, unique_asins))))
+
+
 if __name__ == "__main__":
     df = process_reading(
         inputs_folder=Path("data/input"),
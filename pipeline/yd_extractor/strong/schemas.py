@@ -1,10 +1,11 @@
-import datetime
 from typing import Optional
 
 import pandas as pd
 import pandera as pa
 from pandera.typing.pandas import Series
 
+from yd_extractor.utils.validation import check_is_time
+
 
 # Define schema for input data
 class RawStrongWorkouts(pa.DataFrameModel):
@@ -121,5 +122,5 @@ class StrongWorkouts(pa.DataFrameModel):
     )
 
     @pa.check("start_time")
-    def is_time(self, series: Series[object]) -> Series[bool]:
-        return series.apply(lambda x: isinstance(x, datetime.time))
+    def is_time(self, series: Series[object]) -> bool:
+        return check_is_time(series)
@@ -2,29 +2,25 @@ import logging
 from typing import BinaryIO, Callable, Optional
 
 import pandas as pd
-import pandera as pa
 from pandera.typing.pandas import DataFrame
 
-from yd_extractor.utils.pipeline_stage import PipelineStage
+from yd_extractor.utils.pipeline_stage import PipelineStage, record_metrics
 from yd_extractor.strong.schemas import RawStrongWorkouts, StrongWorkouts
-from yd_extractor.utils.pandas import detect_delimiter, rename_df_from_schema
+from yd_extractor.utils.csv_reader import read_csv_from_schema
+from yd_extractor.utils.pandas import rename_df_from_schema
+from yd_extractor.utils.validation import check_types, validate
 
 logger = logging.getLogger(__name__)
 
 
-@pa.check_types()
+@check_types
 def extract_workouts(csv_path: str) -> DataFrame[RawStrongWorkouts]:
-    with open(csv_path) as csv_file:
-        df_raw = pd.read_csv(
-            csv_file,
-            delimiter=detect_delimiter(csv_file),
-            parse_dates=["Date"],
-        )
-    RawStrongWorkouts.validate(df_raw)
+    df_raw = read_csv_from_schema(csv_path, RawStrongWorkouts)
+    df_raw = validate(df_raw, RawStrongWorkouts)
     return df_raw
 
 
-@pa.check_types
+@check_types
 def transform_workouts(df: DataFrame[RawStrongWorkouts]) -> DataFrame[StrongWorkouts]:
 
     if "Weight (lb)" in df.columns:
@@ -76,7 +72,7 @@ def transform_workouts(df: DataFrame[RawStrongWorkouts]) -> DataFrame[StrongWork
             "workout_volume",
         ]
     ]
-    StrongWorkouts.validate(df)
+    df = validate(df, StrongWorkouts)
     return df
 
 
@@ -84,10 +80,14 @@ def process_workouts(
     csv_path: str,
     load_function: Optional[Callable[[pd.DataFrame, str], None]] = None,    
 ) -> pd.DataFrame:
-    with PipelineStage(logger, "strong_workouts"):
-        df = extract_workouts(csv_path)
-        df = transform_workouts(df)
+    with PipelineStage(logger, "strong_workouts") as stage:
+        with stage.span("extract"):
+            df = extract_workouts(csv_path)
+            record_metrics(rows_in=len(df))
+        with stage.span("transform"):
+            df = transform_workouts(df)
         if load_function:
-            load_function(df, "strong_workouts", StrongWorkouts)
+            with stage.span("load"):
+                load_function(df, "strong_workouts", StrongWorkouts)
     return df
 
@@ -0,0 +1,183 @@
+import json
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pandera as pa
+
+from yd_extractor.utils.output_manifest import write_output_file
+
+logger = logging.getLogger(__name__)
+
+
+def get_columns_by_tag(schema: pa.DataFrameModel, tag: str) -> list[str]:
+    """Returns the columns of the schema whose metadata has the given tag, in the order
+    they are defined."""
+    metadata = schema.get_metadata()
+    schema_name = list(metadata.keys())[0]
+    return [
+        column
+        for column, column_metadata in metadata[schema_name]["columns"].items()
+        if column_metadata and column_metadata.get("tag") == tag
+    ]
+
+
+def summarise_daily_values(
+    daily_values: np.ndarray,
+    days: pd.DatetimeIndex,
+    has_data: np.ndarray,
+) -> dict:
+    """Builds the dense daily array of a value column along with its weekday and month
+    rollups. Means are taken over the days which have data, like the website does.
+
+    Parameters
+    ----------
+    daily_values : np.ndarray
+        Total of the value column for each day of the year.
+    days : pd.DatetimeIndex
+        Every day of the year.
+    has_data : np.ndarray
+        True for days which have at least one row.
+
+    Returns
+    -------
+    dict
+        Has structure like:
+        ```
+        {
+            "daily": [float] * number of days in year,
+            "weekday": {"total": [float] * 7, "mean": [float] * 7},  # Monday first
+            "month": {"total": [float] * 12, "mean": [float] * 12},
+        }
+        ```
+    """
+
+    def rollup(groups: np.ndarray, number_of_groups: int) -> dict:
+        total = np.bincount(groups, weights=daily_values, minlength=number_of_groups)
+        number_of_days = np.bincount(
+            groups, weights=has_data, minlength=number_of_groups
+        )
+        mean = np.divide(
+            total,
+            number_of_days,
+            out=np.zeros(number_of_groups),
+            where=number_of_days > 0,
+        )
+        return {
+            "total": np.round(total, 3).tolist(),
+            "mean": np.round(mean, 3).tolist(),
+        }
+
+    return {
+        "daily": np.round(daily_values, 3).tolist(),
+        "weekday": rollup(days.weekday.to_numpy(), 7),
+        "month": rollup(days.month.to_numpy() - 1, 12),
+    }
+
+
+def create_year_bundle(
+    df: pd.DataFrame,
+    name: str,
+    year: int,
+    date_column: str,
+    value_columns: list[str],
+    category_column: Optional[str] = None,
+) -> dict:
+    """Aggregates the rows of a table from a single year into a compact bundle which the
+    website can plot without any further grouping.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Rows of the table. The date column must have type datetime.
+    name : str
+        Name of the table.
+    year : int
+        Year to aggregate, rows from other years are ignored.
+    date_column : str
+        Column containing the date of each row.
+    value_columns : list[str]
+        Columns which are summed for each day.
+    category_column : Optional[str]
+        If given, each category also gets its own daily arrays and rollups.
+
+    Returns
+    -------
+    dict
+        Bundle with the daily totals of every value column as arrays with one entry
+        per day of the year, their weekday and month rollups and the same for each
+        category.
+    """
+    days = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="D")
+    df = df[df[date_column].dt.year == year]
+    day_index = (df[date_column].dt.dayofyear - 1).to_numpy()
+
+    def summarise(mask: Optional[np.ndarray] = None) -> dict:
+        rows_day_index = day_index if mask is None else day_index[mask]
+        has_data = np.bincount(rows_day_index, minlength=len(days)) > 0
+        summaries = {}
+        for column in value_columns:
+            values = df[column].to_numpy(dtype=np.float64, na_value=0)
+            if mask is not None:
+                values = values[mask]
+            daily_values = np.bincount(
+                rows_day_index, weights=values, minlength=len(days)
+            )
+            summaries[column] = summarise_daily_values(daily_values, days, has_data)
+        return summaries
+
+    bundle = {
+        "table": name,
+        "year": year,
+        "start_date": f"{year}-01-01",
+        "number_of_days": len(days),
+        "value_columns": summarise(),
+        "category_column": category_column,
+        "categories": {},
+    }
+    if category_column:
+        categories = df[category_column].astype(str).to_numpy()
+        for category in pd.unique(categories):
+            bundle["categories"][category] = summarise(categories == category)
+    return bundle
+
+
+def write_year_bundles(
+    df: pd.DataFrame,
+    name: str,
+    schema: pa.DataFrameModel,
+    output_data_folder: Path,
+) -> None:
+    """Writes one bundle per year of the table into
+    `{output_data_folder}/bundles/{name}/{year}.json`, see `create_year_bundle`.
+    Tables without a date column or value columns are skipped."""
+    date_columns = get_columns_by_tag(schema, "date_column")
+    value_columns = get_columns_by_tag(schema, "value_column")
+    category_columns = get_columns_by_tag(schema, "category_column")
+    if not date_columns or not value_columns or df.empty:
+        return
+
+    date_column = date_columns[0]
+    df = df.assign(**{date_column: pd.to_datetime(df[date_column])})
+    bundle_folder = Path("bundles") / name
+    years = sorted(df[date_column].dt.year.dropna().unique())
+    logger.info(
+        f"Writing {len(years)} yearly bundles into {output_data_folder / bundle_folder}.."
+    )
+    for year in years:
+        bundle = create_year_bundle(
+            df,
+            name,
+            int(year),
+            date_column,
+            value_columns,
+            category_columns[0] if category_columns else None,
+        )
+        # Only written if the year changed, past years usually don't
+        write_output_file(
+            output_data_folder,
+            bundle_folder / f"{int(year)}.json",
+            json.dumps(bundle, separators=(",", ":")).encode(),
+        )
@@ -0,0 +1,155 @@
+import importlib.util
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import pandas as pd
+import pandera as pa
+
+from yd_extractor.utils.pandas import detect_delimiter
+from yd_extractor.utils.pipeline_stage import record_metrics
+
+logger = logging.getLogger(__name__)
+
+CSV_ENGINES = ["c", "pyarrow"]
+DEFAULT_CSV_ENGINE = "c"
+
+_csv_engine = DEFAULT_CSV_ENGINE
+_memory_map = False
+
+
+def configure_csv_reader(
+    engine: str = DEFAULT_CSV_ENGINE,
+    memory_map: bool = False,
+) -> None:
+    """Sets the engine `read_csv_from_schema` uses in this process. The pyarrow engine
+    parses with multiple threads, it falls back to the c engine if pyarrow is not
+    installed.
+
+    Args:
+        engine (str): "c" or "pyarrow".
+        memory_map (bool): Memory map the csv instead of reading it into a buffer.
+    """
+    global _csv_engine, _memory_map
+    if engine not in CSV_ENGINES:
+        logger.warning(
+            f"Unknown csv engine '{engine}', using '{DEFAULT_CSV_ENGINE}' instead."
+        )
+        engine = DEFAULT_CSV_ENGINE
+    if engine == "pyarrow" and importlib.util.find_spec("pyarrow") is None:
+        logger.warning(
+            f"Csv engine 'pyarrow' requires pyarrow to be installed, "
+            f"using '{DEFAULT_CSV_ENGINE}' instead."
+        )
+        engine = DEFAULT_CSV_ENGINE
+    _csv_engine = engine
+    _memory_map = memory_map
+
+
+def get_read_options_from_schema(
+    schema: pa.DataFrameModel,
+    header: list[str],
+) -> dict:
+    """Derives the columns to read, their dtypes and the date columns from a schema.
+
+    Columns of the csv which aren't in the schema are not read. Regex aliases select
+    every column of the header they match. Integer columns which are nullable or have a
+    default are read as floats, pandera fills the defaults and coerces them afterwards.
+
+    Parameters
+    ----------
+    schema : pa.DataFrameModel
+        Schema of the raw csv, with the column names of the csv as aliases.
+    header : list[str]
+        Column names in the header of the csv.
+
+    Returns
+    -------
+    dict
+        Keyword arguments `usecols`, `dtype` and `parse_dates` for `pd.read_csv`.
+    """
+    usecols = []
+    dtype = {}
+    parse_dates = []
+    for name, column in schema.to_schema().columns.items():
+        if column.regex:
+            matching_columns = [col for col in header if re.match(name, col)]
+        else:
+            matching_columns = [name] if name in header else []
+
+        column_type = str(column.dtype)
+        for col in matching_columns:
+            usecols.append(col)
+            if column_type.startswith("datetime64"):
+                parse_dates.append(col)
+            elif column_type in ("str", "object"):
+                # Stops the pyarrow engine inferring its own types, e.g. for times
+                dtype[col] = "str"
+            elif column_type == "float64":
+                dtype[col] = "float64"
+            elif column_type == "int64":
+                has_missing = column.nullable or column.default is not None
+                dtype[col] = "float64" if has_missing else "int64"
+
+    # Keep the order of the csv
+    usecols = [col for col in header if col in usecols]
+    return {"usecols": usecols, "dtype": dtype, "parse_dates": parse_dates}
+
+
+def read_csv_from_schema(
+    csv_path: Path,
+    schema: pa.DataFrameModel,
+    delimiter: Optional[str] = None,
+    chunksize: Optional[int] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Reads only the columns of a csv which are in the schema, parsed straight into
+    their types. See `get_read_options_from_schema` and `configure_csv_reader`.
+
+    Parameters
+    ----------
+    csv_path : Path
+        Path to the csv.
+    schema : pa.DataFrameModel
+        Schema of the raw csv, it still has to be validated afterwards.
+    delimiter : Optional[str]
+        Delimiter of the csv, detected from its first line if not given.
+    chunksize : Optional[int]
+        Read the csv in chunks of this many rows. Chunks are always read with the c
+        engine as pyarrow reads the whole file at once.
+
+    Returns
+    -------
+    pd.DataFrame | Iterator[pd.DataFrame]
+        Dataframe with the columns of the schema found in the csv, or an iterator of
+        dataframes if chunksize is given.
+    """
+    with open(csv_path) as csv_file:
+        delimiter = delimiter or detect_delimiter(csv_file)
+        header = pd.read_csv(csv_file, delimiter=delimiter, nrows=0).columns.tolist()
+    read_options = get_read_options_from_schema(schema, header)
+    if chunksize is None:
+        # Chunked reads may stop early, they don't know how much of the file is read
+        record_metrics(bytes_read=os.path.getsize(csv_path))
+
+    if _csv_engine == "pyarrow" and chunksize is None:
+        import pyarrow
+
+        # The pyarrow engine doesn't take memory_map, give it a memory mapped file.
+        source = pyarrow.memory_map(str(csv_path)) if _memory_map else csv_path
+        try:
+            return pd.read_csv(
+                source, delimiter=delimiter, engine="pyarrow", **read_options
+            )
+        finally:
+            if _memory_map:
+                source.close()
+
+    return pd.read_csv(
+        csv_path,
+        delimiter=delimiter,
+        memory_map=_memory_map,
+        chunksize=chunksize,
+        **read_options,
+    )
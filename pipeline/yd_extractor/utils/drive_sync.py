@@ -0,0 +1,276 @@
+import logging
+import os
+import shutil
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import gdown
+
+from yd_extractor.utils.input_tracker import InputTracker
+from yd_extractor.utils.io import read_json_cache, write_json_cache
+from yd_extractor.utils.pipeline_stage import record_metrics
+
+logger = logging.getLogger(__name__)
+
+DRIVE_MAX_WORKERS = 4
+# Suffix of files being downloaded, they are renamed once complete.
+STAGING_SUFFIX = ".download"
+
+
+@dataclass(frozen=True)
+class RemoteFile:
+    """A file in the shared folder.
+
+    Attributes:
+        id (str): Id of the file, changes when a new file is uploaded in its place.
+        path (str): Path of the file relative to the shared folder, "/" separated.
+        size (Optional[int]): Size in bytes, if the source knows it before downloading.
+        modified_time (Optional[str]): Last modification time, if the source knows it.
+    """
+
+    id: str
+    path: str
+    size: Optional[int] = None
+    modified_time: Optional[str] = None
+
+
+class DriveSource(ABC):
+    """Folder of files which `sync_drive_folder` downloads from."""
+
+    @abstractmethod
+    def list_files(self) -> list[RemoteFile]:
+        """Lists every file in the folder and its subfolders."""
+
+    @abstractmethod
+    def download(self, remote_file: RemoteFile, output_path: Path) -> None:
+        """Downloads a file. Nothing may be written to output_path until the download
+        is complete, and an interrupted download may be resumed by the next call.
+        """
+
+
+class GdownDriveSource(DriveSource):
+    """Public google drive folder, accessed with gdown.
+
+    gdown reads the folder page, which doesn't show sizes or modification times, so
+    changed files are only detected by their id.
+    """
+
+    def __init__(self, folder_url: str) -> None:
+        self.folder_url = folder_url
+
+    def list_files(self) -> list[RemoteFile]:
+        files = gdown.download_folder(
+            url=self.folder_url,
+            use_cookies=False,
+            quiet=True,
+            skip_download=True,
+        )
+        if files is None:
+            raise RuntimeError(f"Couldn't list files of {self.folder_url}")
+        return [RemoteFile(id=file.id, path=file.path) for file in files]
+
+    def download(self, remote_file: RemoteFile, output_path: Path) -> None:
+        # gdown writes into a ".part" file next to output_path and only moves it to
+        # output_path once complete, resume continues from an existing ".part" file.
+        path = gdown.download(
+            id=remote_file.id,
+            output=str(output_path),
+            use_cookies=False,
+            quiet=True,
+            resume=True,
+        )
+        if path is None:
+            raise RuntimeError(f"Couldn't download {remote_file.path}")
+
+
+class LocalDirectorySource(DriveSource):
+    """Stand-in for google drive which serves the files of a local folder. Paths are
+    used as ids."""
+
+    def __init__(self, folder_path: Path) -> None:
+        self.folder_path = Path(folder_path)
+
+    def list_files(self) -> list[RemoteFile]:
+        remote_files = []
+        for file in sorted(self.folder_path.rglob("*")):
+            if not file.is_file():
+                continue
+            path = file.relative_to(self.folder_path).as_posix()
+            stat = file.stat()
+            remote_files.append(
+                RemoteFile(
+                    id=path,
+                    path=path,
+                    size=stat.st_size,
+                    modified_time=str(stat.st_mtime_ns),
+                )
+            )
+        return remote_files
+
+    def download(self, remote_file: RemoteFile, output_path: Path) -> None:
+        tmp_path = f"{output_path}.part"
+        shutil.copyfile(self.folder_path / remote_file.path, tmp_path)
+        os.replace(tmp_path, output_path)
+
+
+def create_drive_source(share_url: str) -> DriveSource:
+    """Returns the source for the share url, a local folder path can be given instead
+    of a url to sync from that folder."""
+    if os.path.isdir(share_url):
+        return LocalDirectorySource(Path(share_url))
+    return GdownDriveSource(share_url)
+
+
+def download_files_from_drive(
+    input_data_folder: Path,
+    env_vars: dict,
+    manifest_path: Path,
+    max_workers: int = DRIVE_MAX_WORKERS,
+    input_tracker: Optional[InputTracker] = None,
+) -> list[Path]:
+    """Syncs the shared google drive folder into the input folder, see
+    `sync_drive_folder`."""
+    if env_vars["DRIVE_SHARE_URL"] is None:
+        raise Exception("Expected DRIVE_SHARE_URL in .env folder!")
+    logger.info("🟡 Downloading data from google drive...")
+    downloaded_files = sync_drive_folder(
+        create_drive_source(env_vars["DRIVE_SHARE_URL"]),
+        input_data_folder,
+        manifest_path,
+        max_workers=max_workers,
+        input_tracker=input_tracker,
+    )
+    logger.info("✅ Finished downloading data from google drive!")
+    return downloaded_files
+
+
+def needs_download(
+    remote_file: RemoteFile,
+    manifest_entry: Optional[dict],
+    output_folder: Path,
+) -> bool:
+    """Checks if a file is new or has changed since it was last downloaded."""
+    local_path = output_folder / remote_file.path
+    if manifest_entry is None or not os.path.exists(local_path):
+        return True
+    if manifest_entry["id"] != remote_file.id:
+        return True
+    for key in ["size", "modified_time"]:
+        remote_value = getattr(remote_file, key)
+        if remote_value is not None and manifest_entry[f"remote_{key}"] != remote_value:
+            return True
+    # Local file was modified or replaced since it was downloaded
+    return os.path.getsize(local_path) != manifest_entry["size"]
+
+
+def download_remote_file(
+    source: DriveSource,
+    remote_file: RemoteFile,
+    output_folder: Path,
+) -> int:
+    """Downloads a file into the output folder, the previous version of the file is kept
+    until the new one has been fully downloaded.
+
+    Returns:
+        int: Size of the downloaded file in bytes.
+    """
+    local_path = output_folder / remote_file.path
+    os.makedirs(local_path.parent, exist_ok=True)
+    staging_path = local_path.with_name(local_path.name + STAGING_SUFFIX)
+    if os.path.exists(staging_path):
+        # Left over from a run which stopped before renaming it, may be outdated.
+        os.remove(staging_path)
+    source.download(remote_file, staging_path)
+    os.replace(staging_path, local_path)
+    return os.path.getsize(local_path)
+
+
+def sync_drive_folder(
+    source: DriveSource,
+    output_folder: Path,
+    manifest_path: Path,
+    max_workers: int = DRIVE_MAX_WORKERS,
+    input_tracker: Optional[InputTracker] = None,
+) -> list[Path]:
+    """Downloads the files of the source which are new or have changed since the last
+    sync, several at once.
+
+    The manifest stores the id, size and modification time of every downloaded file.
+    It is written after each download, so a sync which is interrupted only downloads
+    the remaining files next time.
+
+    Args:
+        source (DriveSource): Folder to download from.
+        output_folder (Path): Folder the files are downloaded into, keeping the
+            structure of the source folder.
+        manifest_path (Path): Path to the json manifest of downloaded files.
+        max_workers (int): Files downloaded at the same time.
+        input_tracker (Optional[InputTracker]): Told which files are being downloaded
+            and when each of them is done, so stages can start before the sync ends.
+
+    Raises:
+        RuntimeError: If any file couldn't be downloaded, after the other downloads
+            have finished.
+
+    Returns:
+        list[Path]: Local paths of the files which were downloaded.
+    """
+    remote_files = source.list_files()
+    remote_paths = {remote_file.path for remote_file in remote_files}
+    # Files removed from the source are kept locally, but dropped from the manifest.
+    manifest = {
+        path: entry
+        for path, entry in read_json_cache(manifest_path).items()
+        if path in remote_paths
+    }
+    files_to_download = [
+        remote_file
+        for remote_file in remote_files
+        if needs_download(remote_file, manifest.get(remote_file.path), output_folder)
+    ]
+    logger.info(
+        f"Downloading {len(files_to_download)} new or changed files, "
+        f"{len(remote_files) - len(files_to_download)} are up to date."
+    )
+    if input_tracker:
+        input_tracker.expect(remote_file.path for remote_file in files_to_download)
+
+    downloaded_files = []
+    failed_files = []
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = {
+            executor.submit(download_remote_file, source, remote_file, output_folder): (
+                remote_file
+            )
+            for remote_file in files_to_download
+        }
+        for future in as_completed(futures):
+            remote_file = futures[future]
+            try:
+                size = future.result()
+            except Exception:
+                logger.exception(f"Failed to download {remote_file.path}")
+                failed_files.append(remote_file.path)
+                if input_tracker:
+                    input_tracker.mark_ready(remote_file.path)
+                continue
+            logger.info(f"Downloaded {remote_file.path} ({size / 1024**2:.1f} MB)")
+            record_metrics(bytes_written=size)
+            manifest[remote_file.path] = {
+                "id": remote_file.id,
+                "size": size,
+                "remote_size": remote_file.size,
+                "remote_modified_time": remote_file.modified_time,
+            }
+            write_json_cache(manifest_path, manifest)
+            downloaded_files.append(output_folder / remote_file.path)
+            if input_tracker:
+                input_tracker.mark_ready(remote_file.path)
+
+    write_json_cache(manifest_path, manifest)
+    if failed_files:
+        raise RuntimeError(f"Failed to download: {', '.join(failed_files)}")
+    return downloaded_files
@@ -0,0 +1,80 @@
+import fnmatch
+import logging
+import threading
+from typing import Callable, Iterable, Union
+
+logger = logging.getLogger(__name__)
+
+
+class InputTracker:
+    """Tracks which files of the input folder are still being downloaded and runs a
+    callback as soon as every file matching its globs is ready, so a stage can start
+    whilst other inputs are still downloading.
+
+    Nothing is ready until the files to download are known (`expect`) or the download
+    is over (`finish`). Paths and globs are relative to the input folder and "/"
+    separated, e.g. "strong/strong*.csv".
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._is_listed = False
+        self._pending: set[str] = set()
+        self._callbacks: list[tuple[list[str], Callable[[], None]]] = []
+
+    def when_ready(
+        self,
+        file_name_globs: Union[str, list[str]],
+        callback: Callable[[], None],
+    ) -> None:
+        """Calls callback once no file matching the globs is waiting to be downloaded,
+        straight away if that is already the case."""
+        if isinstance(file_name_globs, str):
+            file_name_globs = [file_name_globs]
+        with self._lock:
+            self._callbacks.append((file_name_globs, callback))
+        self._run_ready_callbacks()
+
+    def expect(self, paths: Iterable[str]) -> None:
+        """Sets the files which are about to be downloaded."""
+        with self._lock:
+            self._pending.update(paths)
+            self._is_listed = True
+        self._run_ready_callbacks()
+
+    def mark_ready(self, path: str) -> None:
+        """Marks a file as downloaded, or as failed to download."""
+        with self._lock:
+            self._pending.discard(path)
+        self._run_ready_callbacks()
+
+    def finish(self) -> None:
+        """Marks every file as ready once the download is over, whether it succeeded or
+        not, so the remaining callbacks are called."""
+        with self._lock:
+            self._pending.clear()
+            self._is_listed = True
+        self._run_ready_callbacks()
+
+    def _is_ready(self, file_name_globs: list[str]) -> bool:
+        return self._is_listed and not any(
+            fnmatch.fnmatch(path, file_name_glob)
+            for path in self._pending
+            for file_name_glob in file_name_globs
+        )
+
+    def _run_ready_callbacks(self) -> None:
+        ready, waiting = [], []
+        with self._lock:
+            for file_name_globs, callback in self._callbacks:
+                if self._is_ready(file_name_globs):
+                    ready.append(callback)
+                else:
+                    waiting.append((file_name_globs, callback))
+            self._callbacks = waiting
+        # Called outside the lock, callbacks may add more callbacks.
+        for callback in ready:
+            try:
+                callback()
+            except Exception:
+                logger.exception(f"Callback for ready inputs failed: {callback}")
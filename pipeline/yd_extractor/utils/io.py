@@ -1,17 +1,23 @@
+import csv
+import functools
 import json
 import logging
 import os
 import sqlite3
-from typing import Callable, Optional
+from typing import Callable, Iterator, Optional
 import zipfile
 from pathlib import Path
 
-import gdown
 import pandas as pd
 import pandera as pa
 
+from yd_extractor.utils.bundles import get_columns_by_tag, write_year_bundles
 from yd_extractor.utils.logger import redirect_output_to_logger
-from yd_extractor.utils.pandas import get_range_for_df_column
+from yd_extractor.utils.output_manifest import write_output_file
+from yd_extractor.utils.pandas import get_value_column_statistics
+from yd_extractor.utils.pipeline_stage import record_metrics
+from yd_extractor.utils.sinks import DEFAULT_OUTPUT_FORMAT, get_sink
+from yd_extractor.utils.warehouse import load_to_warehouse, quote_identifier
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -36,31 +42,91 @@ def load_graphql_query(file_path: str) -> str:
     return query
 
 
-def write_db_to_jsons(db_path: str, output_path: str):
+# Rows fetched from sqlite at a time when exporting tables
+EXPORT_BATCH_SIZE = 10_000
+
+
+def iter_db_tables(
+    db_path: str,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[tuple[str, list[str], Iterator[list[tuple]]]]:
+    """Yields the name, columns and batches of rows of each table in a sqlite database.
+    Rows are fetched `batch_size` at a time so tables never have to fit in memory.
+    """
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    try:
+        table_names = [
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type='table' AND name NOT LIKE 'sqlite_%';"
+            )
+        ]
+        for table_name in table_names:
+            cursor = conn.execute(f"SELECT * FROM {quote_identifier(table_name)}")
+            columns = [column[0] for column in cursor.description]
+            batches = iter(lambda: cursor.fetchmany(batch_size), [])
+            yield table_name, columns, batches
+    finally:
+        conn.close()
+
+
+def write_db_to_jsons(db_path: str, output_path: str):
+    """Writes each table of a sqlite database into `{output_path}/{table}.json`, as a
+    list of objects."""
+    for table_name, columns, batches in iter_db_tables(db_path):
+        with open(f"{output_path}/{table_name}.json", "w") as json_file:
+            json_file.write("[")
+            separator = ""
+            for rows in batches:
+                for row in rows:
+                    json_file.write(separator + json.dumps(dict(zip(columns, row))))
+                    separator = ","
+            json_file.write("]")
 
-    # Get all table names
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
 
-    for table_name in tables:
-        table_name = table_name[0]
-        cursor.execute(f"SELECT * FROM {table_name}")
-        rows = cursor.fetchall()
+def write_db_to_csvs(db_path: str, output_path: str):
+    """Writes each table of a sqlite database into `{output_path}/{table}.csv`."""
+    for table_name, columns, batches in iter_db_tables(db_path):
+        with open(f"{output_path}/{table_name}.csv", "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(columns)
+            for rows in batches:
+                writer.writerows(rows)
 
-        # Get column names
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [col[1] for col in cursor.fetchall()]
 
-        # Convert to list of dictionaries
-        data = [dict(zip(columns, row)) for row in rows]
+def read_json_cache(cache_path: Path) -> dict:
+    """Reads a json file used to keep state between pipeline runs.
+
+    Args:
+        cache_path (Path): Path to the json file.
+
+    Returns:
+        dict: Contents of the cache. Empty if the file doesn't exist or is corrupt.
+    """
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        logger.warning(f"Couldn't read cache {cache_path}, ignoring it.")
+        return {}
 
-        # Write to JSON file
-        with open(f"{output_path}/{table_name}.json", "w") as json_file:
-            json.dump(data, json_file, indent=4)
 
-    conn.close()
+def write_json_cache(cache_path: Path, cache: dict) -> None:
+    """Writes state kept between pipeline runs to a json file. The file is written to a
+    temporary file first then renamed, so a crash never leaves a half written cache.
+
+    Args:
+        cache_path (Path): Path to the json file.
+        cache (dict): Json serializable state.
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(cache, file)
+    os.replace(tmp_path, cache_path)
 
 
 def get_latest_file(folder_path: Path, file_name_glob: str) -> Path:
@@ -95,41 +161,128 @@ def get_latest_file(folder_path: Path, file_name_glob: str) -> Path:
     return files[0]
 
 
+def get_files_newest_first(folder_path: Path, file_name_glob: str) -> list[Path]:
+    """Gets the files matching the glob pattern in the specified folder, sorted from
+    most to least recently modified.
+
+    Args:
+        folder_path (Path): Path where desired files are.
+        file_name_glob (str): Name/pattern the files match.
+
+    Returns:
+        list[Path]: Paths of the matching files, newest first.
+    """
+    files = list(folder_path.glob(file_name_glob))
+    files.sort(key=os.path.getmtime, reverse=True)
+    return files
+
+
 def get_latest_valid_zip(
     folder_path: Path, 
     file_name_glob: str,
     expected_file_path: str,
+    manifest_path: Optional[Path] = None,
 ) -> Path:
-    valid_zips = []
-    for file in folder_path.glob(file_name_glob):
-        is_valid_zip = validate_zip(
-            str(file),
-            expected_file_path,
-        )
-        if is_valid_zip:
-            valid_zips.append(file)
-    
-    # Search for most recent file
-    valid_zips.sort(key=os.path.getmtime, reverse=True)
-    if len(valid_zips) > 0:
-        return valid_zips[0]
-    else:
+    # Check the most recent files first so older archives are never opened once a
+    # valid one has been found.
+    for file, zip_file in iter_valid_zips(
+        folder_path, file_name_glob, expected_file_path, manifest_path
+    ):
+        if zip_file is not None:
+            zip_file.close()
+        return file
+    return None
+
+
+def iter_valid_zips(
+    folder_path: Path,
+    file_name_glob: str,
+    search_prefix: str,
+    manifest_path: Optional[Path] = None,
+) -> Iterator[tuple[Path, Optional[zipfile.ZipFile]]]:
+    """Iterates over the zips matching the glob which contain a file starting with the
+    search prefix, newest first.
+
+    If a manifest path is given, whether each zip is valid and contains the prefix is
+    stored in it, keyed by the path, size and modification time of the zip. Zips which
+    haven't changed since they were last checked are answered from the manifest without
+    being opened. Zips opened to be checked are yielded open, so the caller can read
+    them without scanning their central directory again.
+
+    Args:
+        folder_path (Path): Path where the zips are.
+        file_name_glob (str): Name/pattern the zips match.
+        search_prefix (str): Prefix of a file the zip must contain.
+        manifest_path (Optional[Path]): Path to the json manifest of checked zips.
+
+    Yields:
+        tuple[Path, Optional[zipfile.ZipFile]]: Path of each valid zip, and the zip
+            opened whilst checking it or None if it was answered from the manifest.
+            The caller closes it.
+    """
+    manifest = read_json_cache(manifest_path) if manifest_path else {}
+    for file in get_files_newest_first(folder_path, file_name_glob):
+        key = str(Path(file).resolve())
+        stat = os.stat(file)
+        entry = manifest.get(key)
+        if (
+            entry is None
+            or entry["size"] != stat.st_size
+            or entry["mtime_ns"] != stat.st_mtime_ns
+        ):
+            entry = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "is_zip": zipfile.is_zipfile(file),
+                "prefixes": {},
+            }
+            manifest[key] = entry
+
+        zip_file = None
+        if search_prefix not in entry["prefixes"]:
+            if entry["is_zip"]:
+                zip_file = open_zip_with_prefix(str(file), search_prefix)
+            entry["prefixes"][search_prefix] = zip_file is not None
+            if manifest_path:
+                # Zips which no longer exist are dropped from the manifest.
+                manifest = {
+                    path: zip_entry
+                    for path, zip_entry in manifest.items()
+                    if os.path.exists(path)
+                }
+                write_json_cache(manifest_path, manifest)
+        else:
+            logger.debug(f"Zip {file} is unchanged, using result from manifest.")
+
+        if entry["prefixes"][search_prefix]:
+            yield file, zip_file
+
+
+def open_zip_with_prefix(
+    file_path: str,
+    search_prefix: str,
+) -> Optional[zipfile.ZipFile]:
+    """Opens the zip if it contains a file starting with the search prefix, the caller
+    closes it. Returns None otherwise, or if it isn't a valid zip."""
+    try:
+        zip_file = zipfile.ZipFile(file_path, "r")
+    except Exception:
         return None
+    if any(name.startswith(search_prefix) for name in zip_file.namelist()):
+        return zip_file
+    zip_file.close()
+    return None
+
 
 def validate_zip(
     file_path: str,
     search_prefix: str,
 ) -> bool:
-    try:
-        is_zip = zipfile.is_zipfile(file_path)
-        if (not is_zip):
-            return False
-        
-        with zipfile.ZipFile(file_path, "r") as zip_ref:
-            if any(name.startswith(search_prefix) for name in zip_ref.namelist()):
-                return True
-    except Exception:
+    zip_file = open_zip_with_prefix(file_path, search_prefix)
+    if zip_file is None:
         return False
+    zip_file.close()
+    return True
 
 
 def validate_csv(
@@ -184,26 +337,10 @@ def extract_specific_files_flat(zip_file_path: Path, prefix: str, output_path: P
                     out_file_path = os.path.join(output_path, file_name)
 
                     # Write the extracted file to the output directory
+                    content = source_file.read()
                     with open(out_file_path, "wb") as output_file:
-                        output_file.write(source_file.read())
-
-
-def download_files_from_drive(
-    input_data_folder: Path,
-    env_vars: dict,
-):
-    if env_vars["DRIVE_SHARE_URL"] is None:
-        raise Exception("Expected DRIVE_SHARE_URL in .env folder!")
-    logger.info("🟡 Downloading data from google drive...")
-
-    gdown.download_folder(
-        url=env_vars["DRIVE_SHARE_URL"],
-        output=str(input_data_folder.absolute()),
-        use_cookies=False,
-        quiet=True,
-    )
-    logger.info("✅ Finished downloading data from google drive!")
-    
+                        output_file.write(content)
+                    record_metrics(bytes_read=len(content))
 
 
 def get_metadata_from_schema(
@@ -216,28 +353,106 @@ def get_metadata_from_schema(
     for column in column_metadata_dict.keys():
         if not column_metadata_dict[column]:
             column_metadata_dict[column] = {}
-        if "tag" in column_metadata_dict[column].keys():
-            if column_metadata_dict[column]["tag"] == "value_column": 
-                logger.info(f"Getting range for {column} in {schema_name}")
-                range = [0, 1]
-                if df is not None:
-                    range = get_range_for_df_column(df, column)
-                column_metadata_dict[column]["range"] = range
+
+    value_columns = get_columns_by_tag(schema, "value_column")
+    category_columns = get_columns_by_tag(schema, "category_column")
+    if not value_columns:
+        return metadata
+
+    # Statistics of all value columns are computed in one pass over the table
+    logger.info(f"Getting statistics for {value_columns} in {schema_name}")
+    statistics = {column: {"range": [0, 1]} for column in value_columns}
+    if df is not None:
+        statistics = get_value_column_statistics(
+            df,
+            value_columns,
+            category_column=category_columns[0] if category_columns else None,
+        )
+    for column in value_columns:
+        column_metadata_dict[column].update(statistics[column])
     return metadata
 
-        
-def create_load_function(output_data_folder: str) -> Callable:
-    def load_function(df: pd.DataFrame, name: str, schema: pa.DataFrameModel):
-        save_path = output_data_folder / (name + ".csv")
-        logger.info(f"Saving file into {save_path}..")
-        df.to_csv(save_path, index=False)
 
-        # Save to a JSON file
-        metadata = get_metadata_from_schema(schema, df)
-        output_file = output_data_folder / "metadata" / (name + "_metadata.json")
-        with open(output_file, "w") as file:
-            json.dump(metadata, file, indent=2)
-            
-    return load_function
+def with_categorical_columns(
+    df: pd.DataFrame,
+    schema: pa.DataFrameModel,
+) -> pd.DataFrame:
+    """Returns a copy of df with the category tagged columns of the schema converted to
+    pd.Categorical, so parquet and feather store them as dictionaries. Doesn't change
+    what is written to csv."""
+    category_columns = [
+        column
+        for column in get_columns_by_tag(schema, "category_column")
+        if column in df.columns
+        and not isinstance(df[column].dtype, pd.CategoricalDtype)
+    ]
+    if not category_columns:
+        return df
+    return df.assign(
+        **{column: df[column].astype("category") for column in category_columns}
+    )
 
 
+def load_to_output_folder(
+    df: pd.DataFrame,
+    name: str,
+    schema: pa.DataFrameModel,
+    output_data_folder: Path,
+    output_formats: Optional[dict[str, str]] = None,
+    default_output_format: str = DEFAULT_OUTPUT_FORMAT,
+    write_bundles: bool = False,
+    warehouse_path: Optional[Path] = None,
+) -> None:
+    output_format = (output_formats or {}).get(name, default_output_format)
+    sink = get_sink(output_format)
+    table_path = Path(name + sink.extension)
+    content = sink.serializer(with_categorical_columns(df, schema))
+    bytes_written = 0
+    if write_output_file(output_data_folder, table_path, content, rows=len(df)):
+        logger.info(f"Saved file into {output_data_folder / table_path}..")
+        bytes_written += len(content)
+    else:
+        logger.info(f"{table_path} is unchanged since the last run, not saving it.")
+
+    # Save to a JSON file
+    metadata = get_metadata_from_schema(schema, df)
+    metadata_content = json.dumps(metadata, indent=2).encode()
+    metadata_path = Path("metadata") / (name + "_metadata.json")
+    if write_output_file(output_data_folder, metadata_path, metadata_content):
+        bytes_written += len(metadata_content)
+    record_metrics(rows_out=len(df), bytes_written=bytes_written)
+
+    if write_bundles:
+        write_year_bundles(df, name, schema, output_data_folder)
+    if warehouse_path:
+        load_to_warehouse(df, name, schema, warehouse_path)
+
+
+def create_load_function(
+    output_data_folder: Path,
+    output_formats: Optional[dict[str, str]] = None,
+    default_output_format: str = DEFAULT_OUTPUT_FORMAT,
+    write_bundles: bool = False,
+    warehouse_path: Optional[Path] = None,
+) -> Callable:
+    """Creates the function each stage uses to save its output table.
+
+    Args:
+        output_data_folder (Path): Folder where tables are saved.
+        output_formats (dict[str, str]): Maps table names to the format they are saved
+            in (csv, parquet, feather, ...). See `yd_extractor.utils.sinks`.
+        default_output_format (str): Format of tables not in output_formats.
+        write_bundles (bool): Also write pre-aggregated yearly bundles of each table,
+            see `yd_extractor.utils.bundles`.
+        warehouse_path (Optional[Path]): Also upsert each table into this sqlite
+            database, see `yd_extractor.utils.warehouse`.
+    """
+    # A partial (rather than a closure) can be pickled and sent to worker processes.
+    return functools.partial(
+        load_to_output_folder,
+        output_data_folder=output_data_folder,
+        output_formats=output_formats,
+        default_output_format=default_output_format,
+        write_bundles=write_bundles,
+        warehouse_path=warehouse_path,
+    )
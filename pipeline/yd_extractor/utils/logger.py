@@ -96,8 +96,13 @@ class ExcludeStringFilter(logging.Filter):
         )
 
 
+DEFAULT_LOG_DIR = "logs"
+
+
 def get_cpu_memory_usage():
-    cpu_usage = psutil.cpu_percent(interval=1)  # Get CPU usage as a percentage
+    # CPU usage since the previous call, doesn't block the caller. The first call
+    # returns 0.0.
+    cpu_usage = psutil.cpu_percent(interval=None)
     memory_info = (
         psutil.Process().memory_info().rss / 1024**2
     )  # Get memory usage details
@@ -125,7 +130,7 @@ def log_system_resources_regularly(logger: logging.Logger, interval=5):
 
 def add_date_file_handler(
     logger: logging.Logger,
-    log_dir: str = "logs",
+    log_dir: str = DEFAULT_LOG_DIR,
     base_filename: str = "pipeline",
     formatter_to_override: logging.Logger = logging.Formatter(),
 ):
@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# One frame per allocation is enough to find the line and keeps snapshots small.
+TRACEMALLOC_FRAMES = 1
+TOP_ALLOCATIONS = 10
+MEMORY_REPORT_PREFIX = "memory_profile"
+
+
+def start_memory_profiling() -> None:
+    """Starts tracing allocations. Every `PipelineStage` opened afterwards in this
+    process records its traced peak and top allocation sites."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def stop_memory_profiling() -> None:
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_memory_profiling() -> bool:
+    return tracemalloc.is_tracing()
+
+
+def take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ]
+    )
+
+
+def get_traced_memory_mb() -> tuple[float, float]:
+    """Returns the current and peak traced memory and resets the peak."""
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    return current / 1024**2, peak / 1024**2
+
+
+def get_top_allocations(
+    snapshot_start: tracemalloc.Snapshot,
+    snapshot_end: tracemalloc.Snapshot,
+    limit: int = TOP_ALLOCATIONS,
+) -> list[dict]:
+    """Compares two snapshots and returns the lines whose allocations grew the most.
+
+    Returns
+    -------
+    list[dict]
+        Has structure like:
+        ```
+        [
+            {
+                "location": str,  # file:line
+                "size_diff_mb": float,
+                "size_mb": float,
+                "count_diff": int,
+            }
+        ]
+        ```
+    """
+    top_allocations = []
+    for stat in snapshot_end.compare_to(snapshot_start, "lineno")[:limit]:
+        frame = stat.traceback[0]
+        top_allocations.append(
+            {
+                "location": f"{frame.filename}:{frame.lineno}",
+                "size_diff_mb": round(stat.size_diff / 1024**2, 3),
+                "size_mb": round(stat.size / 1024**2, 3),
+                "count_diff": stat.count_diff,
+            }
+        )
+    return top_allocations
+
+
+class ResourceSampler:
+    """Samples the rss of this process, the rss of its child processes (e.g. the
+    scheduler's process pool) and the cpu usage in a background thread.
+
+    `psutil.cpu_percent(interval=None)` is used so sampling never blocks, each sample
+    reports the cpu usage since the previous one.
+    """
+
+    def __init__(self, interval: float = 0.5) -> None:
+        self.interval = interval
+        self.samples: list[dict] = []
+        self._process = psutil.Process()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_time = 0.0
+
+    def start(self) -> "ResourceSampler":
+        self._start_time = time.perf_counter()
+        self._process.cpu_percent(interval=None)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self.samples.append(self.sample())
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.samples.append(self.sample())
+
+    def sample(self) -> dict:
+        children_rss = 0
+        for child in self._process.children(recursive=True):
+            try:
+                children_rss += child.memory_info().rss
+            except psutil.Error:
+                # Child exited between listing and reading it
+                continue
+        return {
+            "time_s": round(time.perf_counter() - self._start_time, 3),
+            "rss_mb": round(self._process.memory_info().rss / 1024**2, 1),
+            "children_rss_mb": round(children_rss / 1024**2, 1),
+            "cpu_percent": self._process.cpu_percent(interval=None),
+        }
+
+    def __enter__(self) -> "ResourceSampler":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+
+def get_stage_memory(stage_metrics: dict) -> dict:
+    """Keeps only the memory measurements of a stage and its sub-spans."""
+    return {
+        "name": stage_metrics["name"],
+        "pid": stage_metrics["pid"],
+        "peak_rss_increase_mb": stage_metrics["peak_rss_increase_mb"],
+        "traced_peak_mb": stage_metrics["traced_peak_mb"],
+        "traced_peak_increase_mb": stage_metrics["traced_peak_increase_mb"],
+        "top_allocations": stage_metrics["top_allocations"],
+        "spans": [get_stage_memory(span) for span in stage_metrics["spans"]],
+    }
+
+
+def write_memory_report(
+    stage_metrics: list[dict],
+    samples: list[dict],
+    log_dir: Path,
+) -> Path:
+    """Writes the memory measurements of every stage and the rss samples into
+    `{log_dir}/memory_profile_YYYY-MM-DD_HH-MM-SS.json`.
+
+    Parameters
+    ----------
+    stage_metrics : list[dict]
+        Metrics of every top level stage, see `StageMetrics`.
+    samples : list[dict]
+        Samples taken by a `ResourceSampler`.
+    log_dir : Path
+        Folder the pipeline logs are written to.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    report_path = Path(log_dir) / (
+        f"{MEMORY_REPORT_PREFIX}_{datetime.now():%Y-%m-%d_%H-%M-%S}.json"
+    )
+    total_rss = [sample["rss_mb"] + sample["children_rss_mb"] for sample in samples]
+    report = {
+        "peak_sampled_rss_mb": max(total_rss, default=None),
+        "stages": [get_stage_memory(metrics) for metrics in stage_metrics],
+        "rss_samples": samples,
+    }
+    with open(report_path, "w") as file:
+        json.dump(report, file, indent=2)
+
+    logger.info(f"Memory profile written to {report_path}")
+    return report_path
@@ -0,0 +1,134 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Relative to the output folder
+OUTPUT_MANIFEST_PATH = Path("metadata") / "output_manifest.json"
+
+
+def write_bytes_atomically(path: Path, content: bytes) -> None:
+    """Writes to a temporary file in the same folder then renames it, so readers never
+    see a half written file, even if the pipeline crashes whilst writing.
+
+    Args:
+        path (Path): Path of the file.
+        content (bytes): Contents of the file.
+    """
+    folder, file_name = os.path.split(path)
+    os.makedirs(folder, exist_ok=True)
+    # Opened like any other file so it gets the usual permissions, unlike mkstemp's.
+    tmp_path = os.path.join(
+        folder, f".{file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def exclusive_lock(lock_path: Path) -> Iterator[None]:
+    """Holds an exclusive lock on the lock file, waiting for other processes holding it.
+    Uses flock on POSIX systems and msvcrt.locking on Windows."""
+    with open(lock_path, "w") as lock_file:
+        if fcntl is not None:
+            # Released when the file is closed
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+            return
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                # LK_LOCK gives up after retrying for 10 seconds
+                continue
+        try:
+            yield
+        finally:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def locked_manifest(output_data_folder: Path) -> Iterator[dict]:
+    """Reads the output manifest whilst holding a lock on it, stages in other processes
+    write to it too. Changes made to the yielded manifest are saved on exit."""
+    manifest_path = output_data_folder / OUTPUT_MANIFEST_PATH
+    os.makedirs(manifest_path.parent, exist_ok=True)
+    with exclusive_lock(manifest_path.parent / ".output_manifest.lock"):
+        manifest = {}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r") as file:
+                    manifest = json.load(file)
+            except (OSError, ValueError):
+                logger.warning(f"Couldn't read {manifest_path}, rewriting every output.")
+        original_manifest = dict(manifest)
+        yield manifest
+        if manifest != original_manifest:
+            write_bytes_atomically(
+                manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode()
+            )
+
+
+def write_output_file(
+    output_data_folder: Path,
+    relative_path: Path,
+    content: bytes,
+    rows: Optional[int] = None,
+) -> bool:
+    """Writes a file into the output folder, unless the previous run wrote exactly the
+    same content.
+
+    The sha256, size (and number of rows for tables) of each file written are kept in
+    `{output_data_folder}/metadata/output_manifest.json`. Files whose hash matches the
+    manifest are not touched, so their modification time only changes when their
+    content does.
+
+    Args:
+        output_data_folder (Path): Folder where outputs are saved.
+        relative_path (Path): Path of the file relative to the output folder.
+        content (bytes): Serialized contents of the file.
+        rows (Optional[int]): Number of rows, if the file is a table.
+
+    Returns:
+        bool: True if the file was written, False if it was unchanged.
+    """
+    path = output_data_folder / relative_path
+    key = Path(relative_path).as_posix()
+    entry = {"sha256": hashlib.sha256(content).hexdigest(), "size": len(content)}
+    if rows is not None:
+        entry["rows"] = rows
+
+    with locked_manifest(output_data_folder) as manifest:
+        is_unchanged = (
+            manifest.get(key) == entry
+            and os.path.exists(path)
+            and os.path.getsize(path) == len(content)
+        )
+        if is_unchanged:
+            logger.debug(f"{key} is unchanged, not writing it.")
+            return False
+        # Written whilst holding the lock, so the manifest always matches the files.
+        write_bytes_atomically(path, content)
+        manifest[key] = entry
+    return True
@@ -2,8 +2,9 @@ import csv
 import json
 import logging
 import re
-from typing import BinaryIO, Callable
+from typing import BinaryIO, Callable, Optional
 
+import numpy as np
 import pandas as pd
 import pandera as pa
 
@@ -107,6 +108,55 @@ def parse_duration(duration: str) -> float:
     return duration_ms
 
 
+def parse_hms_durations(durations: pd.Series) -> pd.Series:
+    """Vectorised conversion of `{hours}:{minutes}:{seconds}` strings to seconds, gives
+    the same result as `pd.to_timedelta(durations).dt.total_seconds()` much faster.
+
+    The strings are joined into a single buffer which is checked and parsed by numpy.
+    If any string isn't in that format the whole series is passed to `pd.to_timedelta`
+    instead, so other formats still parse (or raise) as before.
+
+    Parameters
+    ----------
+    durations : pd.Series
+        Durations such as "0:05:12" or "12:00:00", missing values stay missing.
+
+    Returns
+    -------
+    pd.Series
+        Durations in seconds as floats, with the same index as durations.
+    """
+    is_present = durations.notna().to_numpy()
+    strings = durations.to_numpy()[is_present]
+    seconds = np.full(len(durations), np.nan)
+    if len(strings) == 0:
+        return pd.Series(seconds, index=durations.index)
+
+    # Each duration is 3 fields which all end with a ":"
+    try:
+        text = (":".join(strings) + ":").encode()
+    except TypeError:
+        return pd.to_timedelta(durations).dt.total_seconds()
+    characters = np.frombuffer(text, dtype=np.uint8)
+    is_colon = characters == ord(":")
+    # Characters before "0" wrap around, so only digits are below 10
+    is_digit = (characters - np.uint8(ord("0"))) < 10
+    field_ends = np.flatnonzero(is_colon)
+    is_valid = len(field_ends) == 3 * len(strings) and (is_colon | is_digit).all()
+    if is_valid:
+        field_lengths = (np.diff(field_ends, prepend=-1) - 1).reshape(-1, 3)
+        is_valid = (field_lengths[:, 0] > 0).all() and (field_lengths[:, 1:] == 2).all()
+    if is_valid:
+        fields = np.fromstring(text.replace(b":", b" "), dtype=np.int64, sep=" ")
+        fields = fields.reshape(-1, 3)
+        is_valid = (fields[:, 1:] < 60).all()
+    if not is_valid:
+        return pd.to_timedelta(durations).dt.total_seconds()
+
+    seconds[is_present] = fields @ np.array([3600, 60, 1])
+    return pd.Series(seconds, index=durations.index)
+
+
 def convert_columns_to_numeric(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
     validate_columns(df, columns_to_validate=columns)
     for column in columns:
@@ -150,17 +200,6 @@ def rename_df_from_schema(df: pd.DataFrame, schema: pa.DataFrameModel) -> pd.Dat
     return df.rename(columns=rename_fields)
 
 
-def get_nth_percentile(df: pd.DataFrame, column: str, nth_percentile: int):
-    if column not in df.columns:
-        raise ValueError(f"Column '{column}' not found in DataFrame.")
-
-    # Filter out zero values and compute the percentile
-    filtered = df[df[column] != 0.0][column]
-    if filtered.empty:
-        return None  # or some default value / raise error
-    return filtered.quantile(nth_percentile / 100.0)
-
-
 def get_nice_range(min_val: float, max_val:float) -> list[float]:
     range_diff = max_val - min_val
     magnitude = 10 ** (len(str(int(range_diff))) - 1)
@@ -169,15 +208,118 @@ def get_nice_range(min_val: float, max_val:float) -> list[float]:
     return [lower_bound, upper_bound]
 
 
-def get_range_for_df_column(df: pd.DataFrame, column: str):
-    if column not in df.columns:
-        raise ValueError(f"Column provided ({column}) does not exist in DataFrame.")
-    df = df.groupby("date").aggregate(
+def get_nice_range_or_default(min_val: Optional[float], max_val: Optional[float]):
+    if min_val is None or max_val is None or pd.isna(min_val) or pd.isna(max_val):
+        return [0, 1]
+    return [float(value) for value in get_nice_range(min_val, max_val)]
+
+
+def get_nice_ranges(percentiles: pd.DataFrame, column: str) -> dict:
+    """Turns the 10th and 90th percentiles of a column for each group into nice ranges.
+
+    Parameters
+    ----------
+    percentiles : pd.DataFrame
+        Result of `groupby(...).quantile([0.1, 0.9])`, indexed by (group, quantile).
+    column : str
+        Column to get the ranges for.
+    """
+    ranges = {}
+    grouped_percentiles = percentiles[column].groupby(level=0, observed=True)
+    for group, group_percentiles in grouped_percentiles:
+        ranges[str(group)] = get_nice_range_or_default(
+            group_percentiles.iloc[0], group_percentiles.iloc[1]
+        )
+    return ranges
+
+
+def get_value_column_statistics(
+    df: pd.DataFrame,
+    value_columns: list[str],
+    date_column: str = "date",
+    category_column: Optional[str] = None,
+) -> dict[str, dict]:
+    """Computes the statistics of every value column of a table. The table is grouped
+    by date once for all columns, the ranges are then computed over the daily totals.
+
+    Ranges are the 10th to 90th percentile of the non zero daily totals, rounded out
+    to nice numbers. Daily totals have at most 366 rows per year, so percentiles are
+    computed exactly without needing a sketch.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Table to compute statistics for.
+    value_columns : list[str]
+        Columns to compute statistics for.
+    date_column : str
+        Column containing the date of each row.
+    category_column : Optional[str]
+        If given, ranges are also computed for the daily totals of each category.
+
+    Returns
+    -------
+    dict[str, dict]
+        Maps each value column to a dict like:
+        ```
         {
-            column: "sum"
+            "range": [float, float],
+            "range_by_year": {year: [float, float]},
+            "total": float,
+            "total_by_year": {year: float},
+            "count": int,
+            "count_by_year": {year: int},
+            "range_by_category": {category: [float, float]},  # if category_column
         }
-    )
-    min_val = get_nth_percentile(df, column, 10)
-    max_val = get_nth_percentile(df, column, 90)
-    return get_nice_range(min_val, max_val)
+        ```
+    """
+    for column in [date_column, *value_columns]:
+        if column not in df.columns:
+            raise ValueError(f"Column provided ({column}) does not exist in DataFrame.")
+
+    df = df[[date_column, *value_columns] + ([category_column] if category_column else [])]
+    df = df.assign(**{date_column: pd.to_datetime(df[date_column])})
+    years = df[date_column].dt.year.rename("year")
+
+    totals_by_year = df[value_columns].groupby(years).sum()
+    counts_by_year = df[value_columns].groupby(years).count()
+
+    daily = df.groupby(date_column)[value_columns].sum()
+    daily_non_zero = daily.where(daily != 0)
+    all_time_percentiles = daily_non_zero.quantile([0.1, 0.9])
+    percentiles_by_year = daily_non_zero.groupby(daily.index.year).quantile([0.1, 0.9])
+
+    percentiles_by_category = None
+    if category_column:
+        daily_by_category = df.groupby([category_column, date_column], observed=True)[
+            value_columns
+        ].sum()
+        percentiles_by_category = (
+            daily_by_category.where(daily_by_category != 0)
+            .groupby(level=0, observed=True)
+            .quantile([0.1, 0.9])
+        )
 
+    statistics = {}
+    for column in value_columns:
+        column_statistics = {
+            "range": get_nice_range_or_default(
+                all_time_percentiles[column].iloc[0],
+                all_time_percentiles[column].iloc[1],
+            ),
+            "range_by_year": get_nice_ranges(percentiles_by_year, column),
+            "total": float(totals_by_year[column].sum()),
+            "total_by_year": {
+                str(year): float(total) for year, total in totals_by_year[column].items()
+            },
+            "count": int(counts_by_year[column].sum()),
+            "count_by_year": {
+                str(year): int(count) for year, count in counts_by_year[column].items()
+            },
+        }
+        if percentiles_by_category is not None:
+            column_statistics["range_by_category"] = get_nice_ranges(
+                percentiles_by_category, column
+            )
+        statistics[column] = column_statistics
+    return statistics
@@ -1,26 +1,224 @@
+import contextvars
 import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Iterator, Optional
+
+import psutil
+
+from yd_extractor.utils.memory_profiler import (get_top_allocations,
+                                                get_traced_memory_mb,
+                                                is_memory_profiling,
+                                                take_snapshot)
+
+try:
+    import resource
+except ImportError:  # Not available on windows
+    resource = None
+
+# Stages which are currently open in this thread/process, innermost last.
+_open_stages: contextvars.ContextVar[tuple["PipelineStage", ...]] = (
+    contextvars.ContextVar("open_stages", default=())
+)
+# Stages recording the traced peak in any thread of this process. The traced peak is
+# process wide, so whenever it is reset every one of them has to see it first.
+_traced_stages: list["PipelineStage"] = []
+_traced_stages_lock = threading.Lock()
+# Metrics of finished top level stages, see `collect_stage_metrics`.
+_finished_stages: contextvars.ContextVar[Optional[list["StageMetrics"]]] = (
+    contextvars.ContextVar("finished_stages", default=None)
+)
+
+
+def get_rss_mb() -> float:
+    return psutil.Process().memory_info().rss / 1024**2
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on linux and bytes on mac os
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak_rss / 1024**2
+    return peak_rss / 1024
+
+
+@dataclass
+class StageMetrics:
+    """Measurements of a single stage or sub-span.
+
+    CPU time is the cpu time of the whole process while the stage was open, so it
+    includes threads started by the stage. The peak rss increase is how much the stage
+    raised the highest rss the process has had so far.
+
+    The traced memory and top allocations are only recorded while memory profiling is
+    on, see `yd_extractor.utils.memory_profiler`. tracemalloc only has a process wide
+    peak, so the traced peak of a stage includes what stages running at the same time
+    in other threads of the process allocated.
+    """
+
+    name: str
+    status: str = "running"
+    started_at: str = ""
+    pid: int = 0
+    wall_time_s: float = 0.0
+    cpu_time_s: float = 0.0
+    rss_start_mb: float = 0.0
+    rss_end_mb: float = 0.0
+    rss_delta_mb: float = 0.0
+    peak_rss_increase_mb: Optional[float] = None
+    rows_in: int = 0
+    rows_out: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    traced_peak_mb: Optional[float] = None
+    traced_peak_increase_mb: Optional[float] = None
+    top_allocations: list[dict] = field(default_factory=list)
+    spans: list["StageMetrics"] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
 
 
 class PipelineStage:
+    """Logs entering and leaving a stage of the pipeline and measures it, see
+    `StageMetrics`.
+
+    Stages opened while another stage is open are recorded as its sub-spans, use
+    `span` for the extract/transform/load steps of a stage. Rows and bytes are
+    recorded with `record_metrics` from anywhere inside the stage.
+    """
+
     def __init__(
-        self, 
-        logger: logging.Logger, 
-        stage_name: str=None, 
-        suppress: bool=True
+        self,
+        logger: logging.Logger,
+        stage_name: str=None,
+        suppress: bool=True,
+        log_level: int=logging.INFO,
     ) -> None:
         self.stage_name = stage_name
         self.suppress = suppress
         self.logger = logger
+        self.log_level = log_level
+        self.metrics = StageMetrics(name=stage_name)
+        self._token: Optional[contextvars.Token] = None
+        self._snapshot_start = None
+        self._traced_start_mb = 0.0
+        self._traced_peak_mb = 0.0
 
     def __enter__(self):
         # Optionally log entering the stage
-        self.logger.info(f"Entering stage: {self.stage_name}")
+        self.logger.log(self.log_level, f"Entering stage: {self.stage_name}")
+        if is_memory_profiling():
+            self._snapshot_start = take_snapshot()
+            with _traced_stages_lock:
+                # Peak is reset for this stage, so pass the peak so far to the stages
+                # already open
+                self._traced_start_mb = _update_traced_peaks()
+                self._traced_peak_mb = self._traced_start_mb
+                _traced_stages.append(self)
+        self._token = _open_stages.set(_open_stages.get() + (self,))
+        self.metrics.started_at = datetime.now().isoformat()
+        self.metrics.pid = os.getpid()
+        self.metrics.rss_start_mb = round(get_rss_mb(), 1)
+        self._peak_rss_start = get_peak_rss_mb()
+        self._cpu_time_start = time.process_time()
+        self._wall_time_start = time.perf_counter()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self._finish(failed=exc_type is not None)
         if exc_type:
             self.logger.exception(f"Exception in stage '{self.stage_name}'")
             if self.suppress:
                 return True  # suppresses the exception
-        self.logger.info(f"Stage {self.stage_name} finished successfullly")
-        return False  
\ No newline at end of file
+        self.logger.log(
+            self.log_level,
+            f"Stage {self.stage_name} finished successfullly "
+            f"in {self.metrics.wall_time_s:.2f}s",
+        )
+        return False
+
+    def _finish(self, failed: bool) -> None:
+        metrics = self.metrics
+        metrics.status = "failed" if failed else "ok"
+        metrics.wall_time_s = round(time.perf_counter() - self._wall_time_start, 3)
+        metrics.cpu_time_s = round(time.process_time() - self._cpu_time_start, 3)
+        metrics.rss_end_mb = round(get_rss_mb(), 1)
+        metrics.rss_delta_mb = round(metrics.rss_end_mb - metrics.rss_start_mb, 1)
+        peak_rss_end = get_peak_rss_mb()
+        if peak_rss_end is not None:
+            metrics.peak_rss_increase_mb = round(peak_rss_end - self._peak_rss_start, 1)
+        if self._snapshot_start is not None and is_memory_profiling():
+            with _traced_stages_lock:
+                _update_traced_peaks()
+                _traced_stages.remove(self)
+            metrics.traced_peak_mb = round(self._traced_peak_mb, 1)
+            metrics.traced_peak_increase_mb = round(
+                self._traced_peak_mb - self._traced_start_mb, 1
+            )
+            metrics.top_allocations = get_top_allocations(
+                self._snapshot_start, take_snapshot()
+            )
+            self._snapshot_start = None
+
+        _open_stages.reset(self._token)
+        parents = _open_stages.get()
+        if parents:
+            parents[-1].metrics.spans.append(metrics)
+        else:
+            finished_stages = _finished_stages.get()
+            if finished_stages is not None:
+                finished_stages.append(metrics)
+
+    def span(self, span_name: str) -> "PipelineStage":
+        """Opens a sub-span of this stage, e.g. "extract". Exceptions are not suppressed
+        so they still reach the stage."""
+        return PipelineStage(
+            self.logger, span_name, suppress=False, log_level=logging.DEBUG
+        )
+
+
+def _update_traced_peaks() -> float:
+    """Reads and resets the traced peak and raises the peak of every stage recording it,
+    in any thread. Must be called holding _traced_stages_lock.
+
+    Returns:
+        float: Current traced memory in MB.
+    """
+    traced_current_mb, traced_peak_mb = get_traced_memory_mb()
+    for stage in _traced_stages:
+        stage._traced_peak_mb = max(stage._traced_peak_mb, traced_peak_mb)
+    return traced_current_mb
+
+
+def record_metrics(
+    rows_in: int = 0,
+    rows_out: int = 0,
+    bytes_read: int = 0,
+    bytes_written: int = 0,
+) -> None:
+    """Adds rows/bytes to every stage which is currently open. Does nothing outside of
+    a stage."""
+    for stage in _open_stages.get():
+        stage.metrics.rows_in += rows_in
+        stage.metrics.rows_out += rows_out
+        stage.metrics.bytes_read += bytes_read
+        stage.metrics.bytes_written += bytes_written
+
+
+@contextmanager
+def collect_stage_metrics() -> Iterator[list[StageMetrics]]:
+    """Collects the metrics of the top level stages which finish inside the block."""
+    finished_stages = []
+    token = _finished_stages.set(finished_stages)
+    try:
+        yield finished_stages
+    finally:
+        _finished_stages.reset(token)
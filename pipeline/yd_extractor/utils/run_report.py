@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import platform
+from datetime import datetime
+from pathlib import Path
+
+from yd_extractor.utils.pipeline_stage import get_peak_rss_mb
+
+logger = logging.getLogger(__name__)
+
+RUN_REPORT_PREFIX = "pipeline_run_report"
+SUMMARY_COLUMNS = [
+    ("name", "stage"),
+    ("status", "status"),
+    ("wall_time_s", "wall (s)"),
+    ("cpu_time_s", "cpu (s)"),
+    ("rss_delta_mb", "rss delta (MB)"),
+    ("peak_rss_increase_mb", "peak rss +(MB)"),
+    ("rows_in", "rows in"),
+    ("rows_out", "rows out"),
+    ("bytes_read", "MB read"),
+    ("bytes_written", "MB written"),
+]
+
+
+def create_run_report(
+    stage_metrics: list[dict],
+    started_at: datetime,
+    wall_time_s: float,
+) -> dict:
+    """Creates the run report of a pipeline run.
+
+    Parameters
+    ----------
+    stage_metrics : list[dict]
+        Metrics of every top level stage, see `StageMetrics`.
+    started_at : datetime
+        When the run started.
+    wall_time_s : float
+        How long the whole run took.
+
+    Returns
+    -------
+    dict
+        Has structure like:
+        ```
+        {
+            "started_at": str,
+            "wall_time_s": float,
+            "peak_rss_mb": float,  # of the main process
+            "python_version": str,
+            "cpu_count": int,
+            "stages": [StageMetrics, ...]  # ordered by start time
+        }
+        ```
+    """
+    return {
+        "started_at": started_at.isoformat(),
+        "wall_time_s": round(wall_time_s, 3),
+        "peak_rss_mb": get_peak_rss_mb(),
+        "python_version": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "stages": sorted(stage_metrics, key=lambda metrics: metrics["started_at"]),
+    }
+
+
+def format_summary_table(stage_metrics: list[dict]) -> str:
+    """Formats the metrics of each stage and its sub-spans as a plain text table."""
+
+    def format_value(key: str, value) -> str:
+        if value is None:
+            return "-"
+        if key.startswith("bytes"):
+            return f"{value / 1024**2:.2f}"
+        return str(value)
+
+    rows = [[header for _, header in SUMMARY_COLUMNS]]
+
+    def add_rows(metrics: dict, depth: int) -> None:
+        row = [format_value(key, metrics[key]) for key, _ in SUMMARY_COLUMNS]
+        row[0] = "  " * depth + row[0]
+        rows.append(row)
+        for span in metrics["spans"]:
+            add_rows(span, depth + 1)
+
+    for metrics in stage_metrics:
+        add_rows(metrics, 0)
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(SUMMARY_COLUMNS))]
+    lines = ["  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in rows]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def write_run_report(report: dict, log_dir: Path) -> Path:
+    """Writes the run report into `{log_dir}/pipeline_run_report_YYYY-MM-DD_HH-MM-SS.json`
+    and logs the summary table of its stages. It changes every run, so it is kept with
+    the logs rather than in the published output folder."""
+    os.makedirs(log_dir, exist_ok=True)
+    report_path = Path(log_dir) / (
+        f"{RUN_REPORT_PREFIX}_{datetime.now():%Y-%m-%d_%H-%M-%S}.json"
+    )
+    with open(report_path, "w") as file:
+        json.dump(report, file, indent=2)
+
+    logger.info(
+        f"Pipeline run took {report['wall_time_s']:.1f}s\n"
+        + format_summary_table(report["stages"])
+    )
+    logger.info(f"Run report written to {report_path}")
+    return report_path
@@ -0,0 +1,197 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import (Executor, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, as_completed)
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from yd_extractor.utils.memory_profiler import start_memory_profiling
+from yd_extractor.utils.pipeline_stage import collect_stage_metrics
+
+logger = logging.getLogger(__name__)
+
+# Set in the scheduler's worker processes, see `is_stage_worker`.
+_is_stage_worker = False
+
+
+@dataclass
+class ScheduledStage:
+    name: str
+    function: Callable
+    kwargs: dict = field(default_factory=dict)
+    io_bound: bool = False
+
+
+def is_stage_worker() -> bool:
+    """Checks if this process is one of the scheduler's worker processes. Stages running
+    in one shouldn't start process pools of their own, the scheduler already runs
+    max_workers of them at the same time."""
+    return _is_stage_worker
+
+
+def initialize_stage_worker(
+    initializer: Optional[Callable] = None,
+    initargs: tuple = (),
+) -> None:
+    global _is_stage_worker
+    _is_stage_worker = True
+    if initializer:
+        initializer(*initargs)
+
+
+def run_stage(
+    function: Callable,
+    kwargs: dict,
+    profile_memory: bool = False,
+) -> list[dict]:
+    """Runs a stage and drops its result, so dataframes returned by the `process_*`
+    functions are not pickled back from worker processes. Only the metrics of the
+    `PipelineStage`s it ran are returned."""
+    if profile_memory:
+        # Worker processes have to start tracing themselves
+        start_memory_profiling()
+    with collect_stage_metrics() as stage_metrics:
+        function(**kwargs)
+    return [metrics.to_dict() for metrics in stage_metrics]
+
+
+class StageScheduler:
+    """Runs independent pipeline stages concurrently.
+
+    CPU heavy stages are run in a process pool and network bound stages (io_bound=True)
+    in a thread pool. Each stage is still wrapped in its own `PipelineStage`, an error
+    in one stage is logged and does not stop the others.
+
+    With max_workers <= 1 the stages are run one after another in the calling process,
+    in the order they were added.
+
+    Stages can be added while the scheduler is running: after `start` every stage added
+    is submitted straight away, e.g. as soon as its input files are downloaded. `run`
+    waits for all of them.
+
+    The metrics of every `PipelineStage` run, including those run in worker processes,
+    are gathered in `stage_metrics`. With profile_memory=True allocations are traced in
+    every process running a stage.
+
+    Worker processes don't share the module level settings of the calling process, e.g.
+    the validation level. Pass an initializer which sets them up, it is called once in
+    each worker process. Worker processes are started with start_method (fork, spawn
+    or forkserver), the platform's default if it is None.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        profile_memory: bool = False,
+        initializer: Optional[Callable] = None,
+        initargs: tuple = (),
+        start_method: Optional[str] = None,
+    ) -> None:
+        self.max_workers = max_workers
+        self.start_method = start_method
+        self.profile_memory = profile_memory
+        self.initializer = initializer
+        self.initargs = initargs
+        self.stages: list[ScheduledStage] = []
+        self.stage_metrics: list[dict] = []
+        self._futures: dict[Future, str] = {}
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._start_time: Optional[float] = None
+
+    def add_stage(
+        self,
+        name: str,
+        function: Callable,
+        kwargs: dict = None,
+        io_bound: bool = False,
+    ) -> None:
+        """Adds a stage to be run by `run`.
+
+        Args:
+            name (str): Name used when logging the stage.
+            function (Callable): Module level function running the stage. It must be
+                picklable if the stage is not io_bound.
+            kwargs (dict): Keyword arguments passed to function.
+            io_bound (bool): Run the stage in a thread instead of a process.
+        """
+        stage = ScheduledStage(name, function, kwargs or {}, io_bound)
+        self.stages.append(stage)
+        if self._process_pool is not None:
+            self._submit(stage)
+
+    def start(self) -> None:
+        """Starts the worker pools, stages added from now on are run straight away. Does
+        nothing when stages are run sequentially."""
+        self._start_time = time.perf_counter()
+        if self.max_workers <= 1 or self._process_pool is not None:
+            return
+        logger.info(f"Starting stage scheduler with {self.max_workers} workers...")
+        self._process_pool = ProcessPoolExecutor(
+            self.max_workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=initialize_stage_worker,
+            initargs=(self.initializer, self.initargs),
+        )
+        self._thread_pool = ThreadPoolExecutor(self.max_workers)
+        self._start_workers()
+        for stage in self.stages:
+            self._submit(stage)
+
+    def _start_workers(self) -> None:
+        """Starts every worker process now, so stages added later run at the same time
+        rather than queueing for the first worker. A fork pool starts all of them on the
+        first submit, but spawn and forkserver pools only start a worker when a task is
+        submitted and none is idle, so max_workers tasks are submitted at once.
+
+        Also with fork, workers are forked before the caller starts other threads (e.g.
+        downloads) which a forked process could inherit locks from.
+        """
+        warm_up = [self._process_pool.submit(int) for _ in range(self.max_workers)]
+        for future in warm_up:
+            future.result()
+
+    def run(self) -> None:
+        """Runs the stages added, or waits for them to finish if `start` was called."""
+        if self._start_time is None:
+            self.start()
+        if self.max_workers <= 1:
+            for stage in self.stages:
+                self._run_sequentially(stage)
+        else:
+            self._wait_for_stages()
+        logger.info(
+            f"Ran {len(self.stages)} stages in "
+            f"{time.perf_counter() - self._start_time:.1f}s"
+        )
+        self.stages = []
+        self._start_time = None
+
+    def _run_sequentially(self, stage: ScheduledStage) -> None:
+        try:
+            self.stage_metrics.extend(
+                run_stage(stage.function, stage.kwargs, self.profile_memory)
+            )
+        except Exception:
+            logger.exception(f"Stage '{stage.name}' failed")
+
+    def _submit(self, stage: ScheduledStage) -> None:
+        executor: Executor = self._thread_pool if stage.io_bound else self._process_pool
+        future = executor.submit(
+            run_stage, stage.function, stage.kwargs, self.profile_memory
+        )
+        self._futures[future] = stage.name
+
+    def _wait_for_stages(self) -> None:
+        try:
+            for future in as_completed(self._futures):
+                try:
+                    self.stage_metrics.extend(future.result())
+                except Exception:
+                    logger.exception(f"Stage '{self._futures[future]}' failed")
+        finally:
+            self._process_pool.shutdown()
+            self._thread_pool.shutdown()
+            self._process_pool, self._thread_pool = None, None
+            self._futures = {}
@@ -0,0 +1,92 @@
+import importlib.util
+import io
+import logging
+from typing import Callable
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_csv(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def serialize_parquet(df: pd.DataFrame) -> bytes:
+    # Dates, times and categorical columns are stored with their native arrow types,
+    # categoricals as dictionaries. See `with_categorical_columns`.
+    return df.to_parquet(index=False)
+
+
+def serialize_feather(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    # Feather can't store a non default index.
+    df.reset_index(drop=True).to_feather(buffer)
+    return buffer.getvalue()
+
+
+class Sink:
+    """Output format of tables. Tables are serialized to bytes rather than written
+    straight to disk, so unchanged tables can be skipped and the others written
+    atomically, see `yd_extractor.utils.output_manifest`."""
+
+    def __init__(
+        self,
+        extension: str,
+        serializer: Callable[[pd.DataFrame], bytes],
+        required_module: str = None,
+    ) -> None:
+        self.extension = extension
+        self.serializer = serializer
+        self.required_module = required_module
+
+    def is_available(self) -> bool:
+        if self.required_module is None:
+            return True
+        return importlib.util.find_spec(self.required_module) is not None
+
+
+SINKS: dict[str, Sink] = {
+    "csv": Sink(".csv", serialize_csv),
+    "parquet": Sink(".parquet", serialize_parquet, required_module="pyarrow"),
+    "feather": Sink(".feather", serialize_feather, required_module="pyarrow"),
+}
+DEFAULT_OUTPUT_FORMAT = "csv"
+
+
+def register_sink(
+    output_format: str,
+    extension: str,
+    serializer: Callable[[pd.DataFrame], bytes],
+    required_module: str = None,
+) -> None:
+    """Registers a serializer which can then be chosen as an output format in
+    config.toml.
+
+    Args:
+        output_format (str): Name of the format, e.g. "parquet".
+        extension (str): Extension of the files written, e.g. ".parquet".
+        serializer (Callable[[pd.DataFrame], bytes]): Serializes a dataframe into the
+            contents of a file.
+        required_module (str): Optional module the serializer needs to be installed.
+    """
+    SINKS[output_format] = Sink(extension, serializer, required_module)
+
+
+def get_sink(output_format: str) -> Sink:
+    """Gets the sink registered for the output format. Falls back to csv if the format
+    is unknown or its dependencies are not installed."""
+    sink = SINKS.get(output_format)
+    if sink is None:
+        logger.warning(
+            f"Unknown output format '{output_format}', "
+            f"using '{DEFAULT_OUTPUT_FORMAT}' instead."
+        )
+        return SINKS[DEFAULT_OUTPUT_FORMAT]
+    if not sink.is_available():
+        logger.warning(
+            f"Output format '{output_format}' requires {sink.required_module} to be "
+            f"installed, using '{DEFAULT_OUTPUT_FORMAT}' instead."
+        )
+        return SINKS[DEFAULT_OUTPUT_FORMAT]
+    return sink
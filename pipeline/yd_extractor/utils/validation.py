@@ -0,0 +1,112 @@
+import datetime
+import functools
+import logging
+from enum import Enum
+from typing import Callable, Optional, Union
+
+import pandas as pd
+import pandera as pa
+
+logger = logging.getLogger(__name__)
+
+
+class ValidationLevel(str, Enum):
+    """How much of each dataframe is validated against its pandera schema.
+
+    * full: The inputs and outputs of every function decorated with `check_types` are
+      validated, along with each explicit `validate` call.
+    * once_per_boundary: Only the explicit `validate` calls at the end of each extract
+      and transform function are run, `check_types` decorators do nothing.
+    * sampled: Like once_per_boundary but the checks only run on a random sample of
+      rows. Columns are still coerced and defaults filled on every row.
+    * off: No checks are run, columns are only coerced and defaults filled so the
+      dataframes keep the types later steps rely on.
+    """
+
+    FULL = "full"
+    ONCE_PER_BOUNDARY = "once_per_boundary"
+    SAMPLED = "sampled"
+    OFF = "off"
+
+
+DEFAULT_SAMPLE_SIZE = 1000
+
+_validation_level = ValidationLevel.FULL
+_sample_size = DEFAULT_SAMPLE_SIZE
+
+
+def configure_validation(
+    level: ValidationLevel = ValidationLevel.FULL,
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+) -> None:
+    """Sets the validation level of this process. Worker processes have to call it too,
+    see `StageScheduler`'s initializer."""
+    global _validation_level, _sample_size
+    _validation_level = ValidationLevel(level)
+    _sample_size = sample_size
+    logger.debug(f"Validation level set to '{_validation_level.value}'")
+
+
+def get_validation_level() -> ValidationLevel:
+    return _validation_level
+
+
+def coerce_to_schema(df: pd.DataFrame, schema: pa.DataFrameModel) -> pd.DataFrame:
+    """Fills defaults and coerces the columns of the schema without running checks."""
+    dataframe_schema = schema.to_schema()
+    defaults = {
+        name: column.default
+        for name, column in dataframe_schema.columns.items()
+        if column.default is not None and name in df.columns
+    }
+    if defaults:
+        df = df.fillna(defaults)
+    return dataframe_schema.coerce_dtype(df)
+
+
+def validate(df: pd.DataFrame, schema: pa.DataFrameModel) -> pd.DataFrame:
+    """Validates a dataframe against a schema according to the validation level set by
+    `configure_validation`.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataframe to validate.
+    schema : pa.DataFrameModel
+        Schema to validate against.
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe with its columns coerced to the types of the schema.
+    """
+    if _validation_level == ValidationLevel.OFF:
+        return coerce_to_schema(df, schema)
+    if _validation_level == ValidationLevel.SAMPLED and len(df) > _sample_size:
+        return schema.validate(df, sample=_sample_size, random_state=0)
+    return schema.validate(df)
+
+
+def check_is_time(series: pd.Series) -> Union[bool, pd.Series]:
+    """Checks every value of the series is a `datetime.time`. Only loops over the values
+    in python when some aren't, to report which rows failed."""
+    if pd.api.types.infer_dtype(series, skipna=False) in ("time", "empty"):
+        return True
+    return series.map(lambda value: isinstance(value, datetime.time))
+
+
+def check_types(function: Optional[Callable] = None, **check_types_kwargs) -> Callable:
+    """Drop in replacement for `pa.check_types` which only validates when the
+    validation level is full. Can be used with or without brackets."""
+    if function is None:
+        return functools.partial(check_types, **check_types_kwargs)
+
+    checked_function = pa.check_types(function, **check_types_kwargs)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _validation_level == ValidationLevel.FULL:
+            return checked_function(*args, **kwargs)
+        return function(*args, **kwargs)
+
+    return wrapper
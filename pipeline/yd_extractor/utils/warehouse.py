@@ -0,0 +1,288 @@
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+import pandera as pa
+
+from yd_extractor.utils.bundles import get_columns_by_tag
+
+logger = logging.getLogger(__name__)
+
+# Columns which identify a row, in this order, when the schema has no unique column.
+KEY_COLUMN_TAGS = [
+    "date_column",
+    "category_column",
+    "time_column",
+    "start_time_column",
+]
+# Other stages may be writing to the warehouse at the same time.
+WAREHOUSE_TIMEOUT_SECONDS = 60
+
+
+def quote_identifier(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def get_primary_key(schema: pa.DataFrameModel, columns: list[str]) -> list[str]:
+    """Returns the columns identifying a row of the table: a unique column of the schema
+    if it has one, otherwise its date, category and time columns.
+
+    Args:
+        schema (pa.DataFrameModel): Schema of the table.
+        columns (list[str]): Columns of the table, optional columns of the schema may
+            be missing.
+
+    Returns:
+        list[str]: Primary key, empty if the schema has none of these columns.
+    """
+    schema_columns = schema.to_schema().columns
+    unique_columns = [
+        column
+        for column in columns
+        if column in schema_columns and schema_columns[column].unique
+    ]
+    if unique_columns:
+        return unique_columns[:1]
+    primary_key = []
+    for tag in KEY_COLUMN_TAGS:
+        for column in get_columns_by_tag(schema, tag):
+            if column in columns and column not in primary_key:
+                primary_key.append(column)
+    return primary_key
+
+
+def get_sql_type(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(series):
+        return "REAL"
+    return "TEXT"
+
+
+def to_sql_values(series: pd.Series) -> pd.Series:
+    """Converts a column to values sqlite can store, dates and times become ISO
+    strings so they sort and compare like they do in pandas."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        date_format = "%Y-%m-%d %H:%M:%S"
+        if (series.dropna().dt.normalize() == series.dropna()).all():
+            date_format = "%Y-%m-%d"
+        series = series.dt.strftime(date_format)
+    elif isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    elif series.dtype == object and pd.api.types.infer_dtype(series) not in (
+        "string",
+        "empty",
+    ):
+        # e.g. datetime.date and datetime.time objects
+        series = series.map(str, na_action="ignore")
+    return series.astype(object).where(series.notna(), None)
+
+
+def create_table(
+    connection: sqlite3.Connection,
+    table_name: str,
+    df: pd.DataFrame,
+    primary_key: list[str],
+    temporary: bool = False,
+) -> None:
+    column_definitions = [
+        f"{quote_identifier(column)} {get_sql_type(df[column])}" for column in df.columns
+    ]
+    if primary_key:
+        key = ", ".join(quote_identifier(column) for column in primary_key)
+        column_definitions.append(f"PRIMARY KEY ({key})")
+    connection.execute(
+        f"CREATE {'TEMP ' if temporary else ''}TABLE {quote_identifier(table_name)} "
+        f"({', '.join(column_definitions)})"
+    )
+
+
+def get_table_columns(connection: sqlite3.Connection, table_name: str) -> list[tuple]:
+    """Returns the name, type and position in the primary key of each column."""
+    rows = connection.execute(
+        f"PRAGMA table_info({quote_identifier(table_name)})"
+    ).fetchall()
+    return [
+        (name, column_type, key_position)
+        for _, name, column_type, _, _, key_position in rows
+    ]
+
+
+def upsert_table(
+    connection: sqlite3.Connection,
+    df: pd.DataFrame,
+    name: str,
+    schema: pa.DataFrameModel,
+) -> tuple[int, int]:
+    """Makes the table in the warehouse match the dataframe, only touching rows which
+    are new, changed or no longer in the dataframe.
+
+    The table is keyed by `get_primary_key` and indexed on its date column. Rows are
+    compared on every column with `IS`, so keys with missing values are matched too
+    (a primary key doesn't make NULLs conflict in sqlite). If the dataframe has
+    several rows with the same key the last one is kept. Tables without a key can't
+    tell identical rows apart, so only one of them is kept.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the warehouse, not in a
+            transaction.
+        df (pd.DataFrame): Whole output table of the stage.
+        name (str): Name of the table.
+        schema (pa.DataFrameModel): Schema of the table.
+
+    Returns:
+        tuple[int, int]: Number of rows inserted and deleted. Changed rows are counted
+            in both.
+    """
+    columns = list(df.columns)
+    primary_key = get_primary_key(schema, columns)
+    if primary_key:
+        number_of_duplicates = df.duplicated(primary_key, keep="last").sum()
+        if number_of_duplicates:
+            logger.warning(
+                f"{number_of_duplicates} rows of {name} have the same {primary_key} as "
+                "a later row, only the later rows are kept in the warehouse."
+            )
+    else:
+        number_of_duplicates = df.duplicated().sum()
+        if number_of_duplicates:
+            logger.warning(
+                f"{number_of_duplicates} rows of {name} are identical to another row, "
+                "only one of them is kept in the warehouse."
+            )
+            df = df.drop_duplicates()
+    table = quote_identifier(name)
+    staging_table = quote_identifier(f"staging_{name}")
+    all_columns = ", ".join(quote_identifier(column) for column in columns)
+    rows_match = " AND ".join(
+        f"new.{quote_identifier(column)} IS old.{quote_identifier(column)}"
+        for column in columns
+    )
+    values = pd.DataFrame({column: to_sql_values(df[column]) for column in columns})
+
+    # Immediate so concurrent stages wait for the lock up front rather than failing
+    # to upgrade a read lock.
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        expected_columns = [
+            (column, get_sql_type(df[column]), primary_key.index(column) + 1)
+            if column in primary_key
+            else (column, get_sql_type(df[column]), 0)
+            for column in columns
+        ]
+        existing_columns = get_table_columns(connection, name)
+        if existing_columns != expected_columns:
+            if existing_columns:
+                logger.info(f"Columns of {name} changed, recreating its table.")
+                connection.execute(f"DROP TABLE {table}")
+            create_table(connection, name, df, primary_key)
+        date_columns = [
+            column
+            for column in get_columns_by_tag(schema, "date_column")
+            if column in columns
+        ]
+        if date_columns and primary_key[:1] != date_columns[:1]:
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {quote_identifier(f'{name}_date')} "
+                f"ON {table} ({quote_identifier(date_columns[0])})"
+            )
+
+        connection.execute(f"DROP TABLE IF EXISTS temp.{staging_table}")
+        create_table(connection, f"staging_{name}", df, primary_key, temporary=True)
+        connection.executemany(
+            f"INSERT OR REPLACE INTO temp.{staging_table} VALUES "
+            f"({', '.join('?' * len(columns))})",
+            values.itertuples(index=False, name=None),
+        )
+        deleted = connection.execute(
+            f"DELETE FROM {table} AS old WHERE NOT EXISTS "
+            f"(SELECT 1 FROM temp.{staging_table} AS new WHERE {rows_match})"
+        ).rowcount
+        inserted = connection.execute(
+            f"INSERT INTO {table} ({all_columns}) "
+            f"SELECT {all_columns} FROM temp.{staging_table} AS new WHERE NOT EXISTS "
+            f"(SELECT 1 FROM {table} AS old WHERE {rows_match})"
+        ).rowcount
+        connection.execute(f"DROP TABLE temp.{staging_table}")
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    return inserted, deleted
+
+
+def connect_to_warehouse(warehouse_path: Path) -> sqlite3.Connection:
+    """Opens the warehouse, transactions are managed explicitly."""
+    warehouse_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(
+        warehouse_path,
+        timeout=WAREHOUSE_TIMEOUT_SECONDS,
+        isolation_level=None,
+    )
+    # Readers don't block the stages writing to it
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
+
+
+def load_to_warehouse(
+    df: pd.DataFrame,
+    name: str,
+    schema: pa.DataFrameModel,
+    warehouse_path: Path,
+) -> None:
+    """Upserts the output table of a stage into the sqlite warehouse, see
+    `upsert_table`.
+
+    Args:
+        df (pd.DataFrame): Output table of the stage.
+        name (str): Name of the table.
+        schema (pa.DataFrameModel): Schema of the table.
+        warehouse_path (Path): Path to the sqlite database.
+    """
+    connection = connect_to_warehouse(warehouse_path)
+    try:
+        inserted, deleted = upsert_table(connection, df, name, schema)
+    finally:
+        connection.close()
+    logger.info(
+        f"Warehouse table {name}: {inserted} rows inserted, {deleted} rows deleted."
+    )
+
+
+def read_warehouse_table(
+    warehouse_path: Path,
+    name: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    date_column: str = "date",
+) -> pd.DataFrame:
+    """Reads a table of the warehouse, optionally only the rows between two dates.
+
+    Args:
+        warehouse_path (Path): Path to the sqlite database.
+        name (str): Name of the table.
+        start_date (Optional[str]): First date included, e.g. "2024-01-01".
+        end_date (Optional[str]): Last date included.
+        date_column (str): Column the dates are compared to, it is indexed.
+
+    Returns:
+        pd.DataFrame: Rows of the table, dates are ISO strings.
+    """
+    conditions, parameters = [], []
+    # Dates with a time are after the bare date, so the end is exclusive of the next day
+    if start_date is not None:
+        conditions.append(f"{quote_identifier(date_column)} >= ?")
+        parameters.append(str(pd.Timestamp(start_date).date()))
+    if end_date is not None:
+        conditions.append(f"{quote_identifier(date_column)} < ?")
+        parameters.append(str((pd.Timestamp(end_date) + pd.Timedelta(days=1)).date()))
+    query = f"SELECT * FROM {quote_identifier(name)}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    connection = sqlite3.connect(warehouse_path, timeout=WAREHOUSE_TIMEOUT_SECONDS)
+    try:
+        return pd.read_sql_query(query, connection, params=parameters)
+    finally:
+        connection.close()
@@ -6,6 +6,15 @@ BRANCH="gh-pages"
 TMP_DIR="tmp-deploy" # Should be in .gitignore!
 WEBSITE_BUILD_DIR="website/dist"
 PIPELINE_OUTPUTS_DIR="pipeline/data/output"
+# Bookkeeping of the pipeline's output writer and the sqlite warehouse (kept in
+# pipeline/data), not served by the website
+PIPELINE_PRIVATE_FILES=(
+    "metadata/output_manifest.json"
+    "metadata/.output_manifest.lock"
+    "warehouse.sqlite"
+    "warehouse.sqlite-wal"
+    "warehouse.sqlite-shm"
+)
 
 # Delete local branch if exists
 if git show-ref --quiet refs/heads/$BRANCH; then
@@ -35,6 +44,11 @@ if [ -d "./assets" ]; then
     echo "Copying pipeline outputs to  assets/data/"
     mkdir -p ./assets/data
     cp -r ../$PIPELINE_OUTPUTS_DIR/* ./assets/data/
+    for private_file in "${PIPELINE_PRIVATE_FILES[@]}"; do
+        rm -f "./assets/data/$private_file"
+    done
+    # Left behind if the pipeline stopped whilst writing an output
+    find ./assets/data -name ".*.tmp" -type f -delete
 else
     echo "Expected assets folder to copy pipeline outputs into!"
 fi